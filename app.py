@@ -1,9 +1,27 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context, g, has_request_context
 from hash_util import generate_hash
 import mysql.connector
 from config import Config
+from db_pool import ConnectionPool, pooled_cursor
+from db_router import ReplicaRouter
+from backup_util import BackupScheduler, BackupManager, RetentionPolicy
+from pagination import Page, parse_page_args, keyset_page
+from catalog import available_books_page, search_available_books, escape_like
+from search import search_books, parse_offset
+from cache import CatalogCache, create_backend
+from bulk_import import import_books, iter_records, detect_format, FORMATS as IMPORT_FORMATS
+from export import export_query, stream_rows, ENCODERS, CONTENT_TYPES
+import circulation
+import stats
+import loan_history
+from image_util import ImageStore
+from assets import AssetManifest, VENDOR, send_asset, missing_vendor
+from metrics import Registry, DatabaseInstrument, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import profiler
 import os
-import subprocess
+import time
+import functools
+import hmac
 from datetime import datetime
 
 app = Flask(__name__)
@@ -13,87 +31,362 @@ app.config.from_object(Config)
 
 app.secret_key = Config.SECRET_KEY
 
+# 指标：请求延迟、数据库耗时、备份等，由 /metrics 以 Prometheus 格式导出
+metrics_registry = Registry()
+db_instrument = DatabaseInstrument(metrics_registry, profile_source=profiler.current)
+request_latency = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method', 'status'))
+backup_duration = metrics_registry.histogram(
+    'backup_duration_seconds', 'Backup duration', ('result',),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+backup_size = metrics_registry.gauge('backup_last_size_bytes', 'Size of the most recent backup file')
+circulation_failures = metrics_registry.counter(
+    'circulation_item_failures_total', 'Rejected borrow / return items', ('action', 'message'))
+circulation_retries = metrics_registry.counter(
+    'circulation_retries_total', 'Borrow / return transactions retried after lock conflicts',
+    ('procedure', 'reason'))
+circulation_gave_up = metrics_registry.counter(
+    'circulation_retry_exhausted_total', 'Borrow / return transactions that ran out of retries',
+    ('procedure', 'reason'))
+
+# 数据库连接池：每个进程独立维护，连接在首次借出时建立
+db_pool = ConnectionPool(
+    size=app.config['DB_POOL_SIZE'],
+    max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+    recycle=app.config['DB_POOL_RECYCLE'],
+    pre_ping=app.config['DB_POOL_PRE_PING'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    instrument=db_instrument,
+    host=app.config['MYSQL_HOST'],
+    user=app.config['MYSQL_USER'],
+    password=app.config['MYSQL_PASSWORD'],
+    database=app.config['MYSQL_DB']
+)
+
+# 只读副本：每个副本一个连接池，只读视图的查询由 db_router 分配
+replica_pools = {}
+for replica in app.config['MYSQL_REPLICAS']:
+    port = replica.get('port', 3306)
+    replica_pools[replica.get('name', f"{replica['host']}:{port}")] = ConnectionPool(
+        size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+        recycle=app.config['DB_POOL_RECYCLE'],
+        pre_ping=app.config['DB_POOL_PRE_PING'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        instrument=db_instrument,
+        host=replica['host'],
+        port=port,
+        user=replica.get('user', app.config['MYSQL_USER']),
+        password=replica.get('password', app.config['MYSQL_PASSWORD']),
+        database=replica.get('database', app.config['MYSQL_DB'])
+    )
+db_router = ReplicaRouter(db_pool, replica_pools, max_lag=app.config['REPLICA_MAX_LAG'],
+                          check_interval=app.config['REPLICA_CHECK_INTERVAL'])
+
+metrics_registry.gauge(
+    'db_pool_connections', 'Pooled connections by state', ('state',),
+    callback=lambda: {(state,): db_pool.stats()[state] for state in ('idle', 'in_use')})
+metrics_registry.gauge(
+    'db_replica_lag_seconds', 'Replication lag of each read replica', ('replica',),
+    callback=lambda: {(name,): status['lag'] for name, status in db_router.stats()['replicas'].items()
+                      if status['lag'] is not None})
+metrics_registry.gauge(
+    'db_replica_healthy', 'Whether each read replica is receiving reads', ('replica',),
+    callback=lambda: {(name,): int(status['healthy'])
+                      for name, status in db_router.stats()['replicas'].items()})
+
+def replica_cache_ttl():
+    # 副本上的结果可能落后于主库，写入缓存时缩短过期时间
+    if has_request_context() and g.get('replica_read'):
+        return app.config['REPLICA_CACHE_TTL']
+    return None
+
+# 图书目录读缓存：写操作提交后按命名空间失效
+catalog_cache = CatalogCache(create_backend(app.config), load_ttl=replica_cache_ttl)
+
+# 热门图书借阅：锁冲突重试、售罄快速失败
+circulation_retry = circulation.RetryPolicy(
+    attempts=app.config['CIRCULATION_RETRY_ATTEMPTS'],
+    base_delay=app.config['CIRCULATION_RETRY_BASE_DELAY'],
+    max_delay=app.config['CIRCULATION_RETRY_MAX_DELAY'],
+    on_retry=lambda procedure, reason: circulation_retries.inc(procedure=procedure, reason=reason),
+    on_give_up=lambda procedure, reason: circulation_gave_up.inc(procedure=procedure, reason=reason)
+)
+sold_out_fast_failures = metrics_registry.counter(
+    'circulation_sold_out_fast_failures_total', 'Borrows rejected as sold out without a database call')
+sold_out_cache = circulation.SoldOutCache(
+    ttl=app.config['CIRCULATION_SOLD_OUT_TTL'], on_fast_fail=sold_out_fast_failures.inc)
+
+# 封面图片：按内容哈希存储，后台线程生成缩略图 / 中等尺寸变体
+image_store = ImageStore(
+    os.path.join(app.root_path, 'static'),
+    app.config['IMAGE_VARIANTS'],
+    fmt=app.config['IMAGE_VARIANT_FORMAT'],
+    quality=app.config['IMAGE_QUALITY']
+)
+
+@app.template_global()
+def image_url(image_filename, size=None):
+    """图片的 URL，size 为 IMAGE_VARIANTS 中的名称，变体未生成时返回原图"""
+    path = image_store.url_path(image_filename, size)
+    return url_for('static', filename=path) if path else None
+
+# 静态资源：python assets.py build 生成带指纹的文件，模板通过 asset_url 引用
+asset_manifest = AssetManifest(os.path.join(app.root_path, 'static'))
+_missing_vendor = missing_vendor(asset_manifest.static_dir, asset_manifest)
+if _missing_vendor:
+    # 只提示不中断启动：static/vendor 尚未提交时仍能运行
+    if app.config['ASSET_ALLOW_CDN']:
+        print(f"Warning: loading {len(_missing_vendor)} vendored assets from the CDN, "
+              f"run python assets.py vendor to self-host them")
+    else:
+        print(f"Warning: missing vendored assets {_missing_vendor}, run python assets.py vendor "
+              f"(or set ASSET_ALLOW_CDN = True to load them from the CDN)")
+
+@app.template_global()
+def asset_url(path):
+    """静态资源的 URL：优先使用构建后带指纹的文件，其次是 static 下的原文件"""
+    fingerprinted = asset_manifest.lookup(path)
+    if fingerprinted:
+        return url_for('asset', filename=fingerprinted)
+    if path in VENDOR and app.config['ASSET_ALLOW_CDN'] \
+            and not os.path.exists(os.path.join(app.root_path, 'static', path)):
+        # 显式允许时，尚未执行 python assets.py vendor 的文件使用 CDN
+        return VENDOR[path]
+    return url_for('static', filename=path)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    # 只提供清单中登记过的带指纹文件，它们的内容永不改变
+    if not asset_manifest.is_fingerprinted(filename):
+        return jsonify({"success": False, "message": "资源不存在"}), 404
+    return send_asset(asset_manifest, filename, request.headers.get('Accept-Encoding', ''),
+                      app.config['ASSET_CACHE_MAX_AGE'])
+
+@app.after_request
+def cache_immutable_images(response):
+    # 内容寻址的图片及其变体永不改变，允许浏览器和 CDN 长期缓存
+    if request.path.startswith('/static/images/') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['IMAGE_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
+
+def read_only(view):
+    """标记只读视图：其中的查询可以发往只读副本"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def use_replica():
+    # 只读视图，且当前会话不在自己写操作之后的固定窗口内
+    return (has_request_context() and g.get('read_only', False)
+            and session.get('primary_until', 0) <= time.time())
+
+def get_db_connection():
+    """从连接池借出连接，close() 即归还；只读视图中借自只读副本"""
+    connection = db_router.connect(read_only=use_replica())
+    if db_router.is_replica(connection):
+        g.replica_read = True
+    return connection
+
+def db_cursor(**cursor_kwargs):
+    """with db_cursor(dictionary=True) as (connection, cursor): ... 退出时保证归还连接"""
+    return pooled_cursor(get_db_connection, **cursor_kwargs)
+
+# 备份管理：全量 / 增量备份与按时间点还原
+backup_manager = BackupManager(
+    app.config,
+    os.path.join(app.root_path, 'backup'),
+    get_db_connection,
+    mode=app.config['BACKUP_MODE'],
+    full_interval=app.config['BACKUP_FULL_INTERVAL'],
+    compression=app.config['BACKUP_COMPRESSION'],
+    retention=RetentionPolicy(
+        keep_last=app.config['BACKUP_KEEP_LAST'],
+        hourly=app.config['BACKUP_KEEP_HOURLY'],
+        daily=app.config['BACKUP_KEEP_DAILY'],
+        weekly=app.config['BACKUP_KEEP_WEEKLY'],
+        max_total_bytes=app.config['BACKUP_MAX_TOTAL_BYTES']
+    )
+)
+
+def sync_inventory():
+    """把拆分库存的分片之和回写到 books.quantity；只改变库存，依赖库存的缓存项按 CACHE_STOCK_TTL 过期"""
+    connection = get_db_connection()
+    try:
+        return circulation.sync_split_inventory(connection)
+    finally:
+        connection.close()
+
+# 后台同步拆分库存的镜像，首次借还书时启动
+inventory_sync = circulation.InventorySync(sync_inventory, interval=app.config['INVENTORY_SYNC_INTERVAL'])
+
 def backup_database():
     """备份数据库到 backup 文件夹"""
+    start = time.perf_counter()
     try:
-        # 确保备份目录存在
-        backup_dir = os.path.join(app.root_path, 'backup')
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-
-        # 生成备份文件名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"backup_{timestamp}.sql"
-        filepath = os.path.join(backup_dir, filename)
-
-        # 获取数据库配置
-        host = app.config['MYSQL_HOST']
-        user = app.config['MYSQL_USER']
-        password = app.config['MYSQL_PASSWORD']
-        db_name = app.config['MYSQL_DB']
-
-        # 构建 mysqldump 命令
-        # 注意：mysqldump 需要在系统环境变量中，或者指定完整路径
-        command = [
-            'mysqldump',
-            f'-h{host}',
-            f'-u{user}',
-            f'-p{password}',
-            '--routines', # 导出存储过程和函数
-            '--events',   # 导出定时事件
-            db_name
-        ]
-
-        # 执行备份
-        with open(filepath, 'w') as f:
-            subprocess.run(command, stdout=f, check=True)
-        
-        print(f"Database backup successful: {filepath}")
+        # 先把拆分库存的分片之和写回 books.quantity，还原后据此重新分配分片
+        sync_inventory()
+        # 增量模式下没有新的变更时不生成文件
+        filename = backup_manager.backup()
+        if filename:
+            filepath = os.path.join(backup_manager.backup_dir, filename)
+            backup_duration.observe(time.perf_counter() - start, result='success')
+            backup_size.set(os.path.getsize(filepath))
+            print(f"Database backup successful: {filepath}")
+            # 按保留策略清理旧备份
+            for removed in backup_manager.prune():
+                print(f"Pruned old backup: {removed}")
+        else:
+            backup_duration.observe(time.perf_counter() - start, result='skipped')
+        return filename
     except Exception as e:
+        backup_duration.observe(time.perf_counter() - start, result='failure')
         print(f"Database backup failed: {str(e)}")
+        raise
+
+# 后台备份调度器：写操作只标记变更，由后台线程合并后执行 backup_database
+backup_scheduler = BackupScheduler(
+    backup_database,
+    window=app.config['BACKUP_WINDOW'],
+    lock_path=os.path.join(app.root_path, 'backup', '.backup.lock')
+)
 
-def restore_database(filename):
-    """从 backup 文件夹中的 sql 文件还原数据库"""
+def restore_database(filename, until=None):
+    """从 backup 文件夹中的 sql 文件还原数据库，增量文件会连同其基准一起回放"""
     try:
-        backup_dir = os.path.join(app.root_path, 'backup')
-        filepath = os.path.join(backup_dir, filename)
-        
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Backup file not found: {filename}")
-
-        # 获取数据库配置
-        host = app.config['MYSQL_HOST']
-        user = app.config['MYSQL_USER']
-        password = app.config['MYSQL_PASSWORD']
-        db_name = app.config['MYSQL_DB']
-
-        # 构建 mysql 还原命令
-        # 注意：mysql 客户端需要在系统环境变量中
-        command = [
-            'mysql',
-            f'-h{host}',
-            f'-u{user}',
-            f'-p{password}',
-            db_name
-        ]
-
-        # 执行还原
-        with open(filepath, 'r') as f:
-            subprocess.run(command, stdin=f, check=True)
-            
-        print(f"Database restore successful: {filepath}")
+        # 只接受清单中登记过且校验和一致的备份
+        chain = backup_manager.restore(filename, until)
+        # 增量备份不包含分片表，按还原后的 books.quantity 重新分配分片
+        with db_cursor() as (connection, cursor):
+            circulation.set_split_quantity(cursor)
+            connection.commit()
+        reconcile_borrow_counts()
+        # 数据整体回退，所有缓存一起失效
+        catalog_cache.invalidate_all()
+        print(f"Database restore successful: {', '.join(chain)}")
         return True, "数据库还原成功"
     except Exception as e:
         print(f"Database restore failed: {str(e)}")
         return False, str(e)
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=app.config['MYSQL_HOST'],
-        user=app.config['MYSQL_USER'],
-        password=app.config['MYSQL_PASSWORD'],
-        database=app.config['MYSQL_DB']
-    )
+def reconcile_borrow_counts(repair=True):
+    """检查并修复 users / books 的借出数计数列，修复时同时重算统计中的在借总数"""
+    connection = get_db_connection()
+    try:
+        drift = circulation.reconcile_borrow_counts(connection, repair)
+    finally:
+        connection.close()
+    if repair:
+        with db_cursor() as (connection, cursor):
+            stats.rebuild_active_loans(cursor)
+            connection.commit()
+    if drift:
+        print(f"Borrow count drift {'repaired' if repair else 'found'}: {len(drift)} rows")
+        if repair:
+            catalog_cache.invalidate_books()
+    return drift
+
+def rollup_stats():
+    """刷新借阅统计的汇总快照，其他 worker 刚刷新过时跳过"""
+    connection = get_db_connection()
+    try:
+        return stats.rollup(connection, top=app.config['STATS_TOP_BOOKS'],
+                            max_age=app.config['STATS_ROLLUP_INTERVAL'] / 2)
+    finally:
+        connection.close()
+
+# 后台定期刷新借阅统计快照，管理员首次访问主页时启动
+stats_rollup = stats.RollupJob(rollup_stats, interval=app.config['STATS_ROLLUP_INTERVAL'])
+
+def maintain_loan_history():
+    """预建借阅历史的分区并归档过期分区，其他 worker 正在维护时跳过"""
+    connection = get_db_connection()
+    try:
+        return loan_history.maintain_once(connection,
+                                          months_ahead=app.config['LOAN_EVENTS_PARTITIONS_AHEAD'],
+                                          retention_months=app.config['LOAN_EVENTS_RETENTION_MONTHS'],
+                                          archive=app.config['LOAN_EVENTS_ARCHIVE'])
+    finally:
+        connection.close()
+
+# 后台定期维护借阅历史分区，首次借还书时启动；分区提前几个月拆出，p_future 始终为空
+loan_history_job = loan_history.MaintenanceJob(maintain_loan_history,
+                                               interval=app.config['LOAN_EVENTS_MAINTAIN_INTERVAL'])
+
+def dry_run_restore_database(filename, until=None):
+    """把备份还原到临时库中试跑并比对行数，不影响生产库"""
+    try:
+        report = backup_manager.dry_run_restore(filename, until)
+        print(f"Database dry-run restore finished: {report}")
+        if not report['ok']:
+            return False, f"行数不一致: {report['mismatches']}", report
+        return True, "试还原成功，备份可用", report
+    except Exception as e:
+        print(f"Database dry-run restore failed: {str(e)}")
+        return False, str(e), None
+
+def run_batch(action, user_id, book_ids, admin=False):
+    """执行批量借书 / 还书，有成功项时使缓存失效并触发一次备份；admin 为管理员代办"""
+    inventory_sync.start()
+    loan_history_job.start()
+    connection = get_db_connection()
+    try:
+        results = action(connection, user_id, book_ids, retry=circulation_retry, sold_out=sold_out_cache,
+                         admin=admin)
+    finally:
+        connection.close()
+
+    return record_batch(action.__name__, user_id, results)
+
+def record_batch(action_name, user_id, results):
+    """记录失败项；有成功项时使缓存失效并触发一次备份。异步模式共用"""
+    for item in results:
+        if not item['success']:
+            circulation_failures.inc(action=action_name, message=item['message'])
+
+    if any(item['success'] for item in results):
+        # 只失效该用户的借阅集合；库存变化由依赖库存的缓存项的短 ttl 体现，不使全部图书缓存失效
+        catalog_cache.invalidate(f'user:{user_id}')
+        # 触发备份
+        backup_scheduler.mark_dirty()
+    return results
+
+def batch_response(action, user_id, book_ids, admin=False):
+    """批量接口的公共处理：校验参数、执行并返回逐本结果"""
+    try:
+        book_ids = circulation.parse_book_ids(book_ids, app.config['BATCH_MAX_ITEMS'])
+        results = run_batch(action, user_id, book_ids, admin)
+    except circulation.BatchError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({"success": False, "message": str(err)}), 500
+
+    return jsonify({"success": all(item['success'] for item in results), "results": results})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        request_latency.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def pin_to_primary(response):
+    # 写请求成功后，该会话在一段时间内的读取仍走主库，保证能读到自己的写入
+    if (replica_pools and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and not g.get('read_only') and response.status_code < 400):
+        session['primary_until'] = time.time() + app.config['READ_YOUR_WRITES_WINDOW']
+    return response
 
 @app.before_request
 def check_login():
@@ -104,10 +397,49 @@ def check_login():
         elif 'admin_logged_in' in session:
             return redirect(url_for('admin_dashboard'))
     # 其他页面权限校验
-    if request.endpoint not in ['home', 'user_login', 'admin_login', 'static']:
+    if request.endpoint not in ['home', 'user_login', 'admin_login', 'static', 'asset', 'metrics']:
         if 'user_logged_in' not in session and 'admin_logged_in' not in session:
             return redirect(url_for('home'))
 
+@app.before_request
+def start_profiler():
+    # 仅管理员可以开启，未请求剖析时不做任何事
+    mode = profiler.requested_mode(request)
+    if mode and 'admin_logged_in' in session:
+        profile = profiler.RequestProfile(
+            mode,
+            repeat_threshold=app.config['PROFILE_REPEAT_THRESHOLD'],
+            unbounded_rows=app.config['PROFILE_UNBOUNDED_ROWS']
+        )
+        # 其他请求正在剖析时跳过，本请求照常处理
+        if profile.start():
+            g.profile = profile
+        else:
+            g.profile_skipped = True
+
+@app.after_request
+def finish_profiler(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        if g.pop('profile_skipped', False):
+            response.headers['X-Profile-Report'] = 'skipped: another request is being profiled'
+        return response
+    profile.stop()
+    report = profile.report(request)
+    report['status'] = response.status_code
+    if profile.mode == 'inline':
+        return jsonify({"success": True, "report": report})
+    filename = profile.save(report, os.path.join(app.root_path, app.config['PROFILE_DIR']))
+    response.headers['X-Profile-Report'] = filename
+    return response
+
+@app.teardown_request
+def discard_profiler(exc):
+    # 请求异常结束时 after_request 不会执行，确保关闭剖析
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -120,27 +452,21 @@ def user_login():
 
     hashed_password = generate_hash(password)
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    # 检查用户是否存在
-    cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-    user = cursor.fetchone()
-
-    if user:
-        # 检查密码
-        if user['password_hash'] == hashed_password:
-            session['user_logged_in'] = True
-            session['username'] = username
-            session['user_id'] = user['id']
-            cursor.close()
-            connection.close()
-            return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 200
-        else:
-            cursor.close()
-            connection.close()
-            return jsonify({"success": False, "message": "密码错误"}), 401
-    else:
+    with db_cursor(dictionary=True) as (connection, cursor):
+        # 检查用户是否存在
+        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+        user = cursor.fetchone()
+
+        if user:
+            # 检查密码
+            if user['password_hash'] == hashed_password:
+                session['user_logged_in'] = True
+                session['username'] = username
+                session['user_id'] = user['id']
+                return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 200
+            else:
+                return jsonify({"success": False, "message": "密码错误"}), 401
+
         # 若不存在 创建新用户
         cursor.execute(
             "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
@@ -156,13 +482,10 @@ def user_login():
         session['username'] = username
         session['user_id'] = new_user['id']
 
-        cursor.close()
-        connection.close()
-        
-        # 触发备份
-        backup_database()
-        
-        return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 201
+    # 触发备份
+    backup_scheduler.mark_dirty()
+
+    return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 201
 
 @app.route('/api/admin_login', methods=['POST'])
 def admin_login():
@@ -172,16 +495,9 @@ def admin_login():
 
     hashed_password = generate_hash(password)
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    cursor.execute("SELECT * FROM admins WHERE username = %s AND password_hash = %s", (username, hashed_password))
-    admin = cursor.fetchone()
-
-    cursor.close()
-    connection.close()
-
-    backup_database()
+    with db_cursor(dictionary=True) as (connection, cursor):
+        cursor.execute("SELECT * FROM admins WHERE username = %s AND password_hash = %s", (username, hashed_password))
+        admin = cursor.fetchone()
 
     if admin:
         session['admin_logged_in'] = True
@@ -200,17 +516,11 @@ def user_dashboard():
 def admin_dashboard():
     if 'admin_logged_in' not in session:
         return redirect(url_for('home'))
-    
-    # 获取备份文件列表
-    backup_dir = os.path.join(app.root_path, 'backup')
-    backup_files = []
-    if os.path.exists(backup_dir):
-        files = os.listdir(backup_dir)
-        # 过滤出 .sql 文件并按修改时间倒序排列
-        sql_files = [f for f in files if f.endswith('.sql')]
-        sql_files.sort(key=lambda x: os.path.getmtime(os.path.join(backup_dir, x)), reverse=True)
-        backup_files = sql_files
-        
+
+    stats_rollup.start()
+    # 从备份清单读取备份列表（按时间倒序），无需扫描目录
+    backup_files = backup_manager.list_backups()
+
     return render_template('admin.html', backup_files=backup_files)
 
 @app.route('/admin/restore', methods=['POST'])
@@ -221,53 +531,213 @@ def admin_restore():
     filename = request.json.get('filename')
     if not filename:
         return jsonify({"success": False, "message": "未选择备份文件"}), 400
-        
-    success, message = restore_database(filename)
+
+    # 可选：还原到指定时间点（ISO 格式），只回放该时间之前的增量
+    until = request.json.get('until')
+    if until:
+        try:
+            until = datetime.fromisoformat(until)
+        except ValueError:
+            return jsonify({"success": False, "message": "时间格式错误"}), 400
+    else:
+        until = None
+
+    # dry_run 为真时只还原到临时库验证备份可用
+    if request.json.get('dry_run'):
+        success, message, report = dry_run_restore_database(filename, until)
+        status = 200 if success else 500
+        return jsonify({"success": success, "message": message, "report": report}), status
+
+    success, message = restore_database(filename, until)
     
     if success:
         return jsonify({"success": True, "message": message}), 200
     else:
         return jsonify({"success": False, "message": f"还原失败: {message}"}), 500
 
-@app.route('/user/borrow_books')
-def borrow_books():
-    if 'user_logged_in' not in session:
-        return redirect(url_for('home'))
+@app.route('/admin/backup_status')
+def backup_status():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
 
-    user_id = session.get('user_id')
+    return jsonify({"success": True, "status": backup_scheduler.status()})
+
+@app.route('/admin/db_pool_stats')
+def db_pool_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    # 连接池等待时间与借出次数，用于调整池大小；副本的连接池、复制延迟和读请求分配
+    return jsonify({
+        "success": True,
+        "stats": db_pool.stats(),
+        "replica_pools": {name: pool.stats() for name, pool in replica_pools.items()},
+        "routing": db_router.stats()
+    })
+
+@app.route('/metrics')
+def metrics():
+    # 供 Prometheus 抓取；配置了 METRICS_TOKEN 时需要携带 Bearer 令牌，否则只允许本机访问
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return Response('forbidden: set METRICS_TOKEN to scrape remotely\n', status=403, mimetype='text/plain')
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/admin/cache_stats')
+def cache_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    # 目录缓存的命中、未命中与淘汰次数
+    return jsonify({"success": True, "stats": catalog_cache.stats()})
+
+@app.route('/admin/stats')
+@read_only
+def admin_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    stats_rollup.start()
+    # 只读取计数分片、每日计数和汇总快照，与借阅历史的规模无关
+    with db_cursor() as (connection, cursor):
+        result = stats.read_stats(cursor, app.config['STATS_DAYS'])
+    return jsonify({"success": True, "stats": result})
+
+@app.route('/admin/loan_history')
+@read_only
+def admin_loan_history():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    try:
+        start, end = loan_history.parse_range(request.args)
+        user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+        book_id = int(request.args['book_id']) if request.args.get('book_id') else None
+    except ValueError:
+        return jsonify({"success": False, "message": "查询参数无效，日期格式为 YYYY-MM-DD"}), 400
+    event_type = request.args.get('event_type') or None
+    if event_type is not None and event_type not in loan_history.EVENT_TYPES:
+        return jsonify({"success": False, "message": "事件类型无效"}), 400
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
+
+    # 条件总是带有 event_at 范围，只扫描范围内的按月分区
+    with db_cursor(dictionary=True) as (connection, cursor):
+        page = loan_history.history_page(cursor, user_id, book_id, start, end, event_type,
+                                         after=after, before=before, page_size=page_size)
+    for event in page.items:
+        event['event_at'] = event['event_at'].isoformat()
+    return jsonify({"success": True, "start": start.isoformat(), "end": end.isoformat(), **page.to_dict()})
+
+@app.route('/admin/circulation_stats')
+def circulation_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    with db_cursor() as (connection, cursor):
+        split = circulation.split_books(cursor)
+    return jsonify({
+        "success": True,
+        "stats": sold_out_cache.stats(),
+        "split_books": [{"book_id": book_id, "slots": slots} for book_id, slots in sorted(split.items())]
+    })
+
+@app.route('/admin/reconcile_borrow_counts', methods=['POST'])
+def admin_reconcile_borrow_counts():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    # dry_run 时只报告计数列与借阅记录不一致的行
+    repair = not (request.get_json(silent=True) or {}).get('dry_run')
+    try:
+        drift = reconcile_borrow_counts(repair)
+    except mysql.connector.Error as err:
+        return jsonify({"success": False, "message": str(err)}), 500
+    if drift and repair:
+        backup_scheduler.mark_dirty()
+    return jsonify({"success": True, "repaired": repair, "drift": drift})
+
+@app.route('/admin/books/<int:book_id>/split_inventory', methods=['POST'])
+def split_book_inventory(book_id):
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        slots = int(data.get('slots', app.config['INVENTORY_SPLIT_SLOTS']))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "slots 必须是整数"}), 400
+    if not 0 <= slots <= 64:
+        return jsonify({"success": False, "message": "slots 必须在 0 到 64 之间"}), 400
 
     connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    try:
+        # 拆分或取消拆分（slots <= 1）前先把已有分片合并回 books.quantity
+        quantity = circulation.split_inventory(connection, book_id, slots)
+    except mysql.connector.Error as err:
+        return jsonify({"success": False, "message": str(err)}), 500
+    finally:
+        connection.close()
+    if quantity is None:
+        return jsonify({"success": False, "message": "图书不存在"}), 404
 
-    query = """
-        SELECT * FROM available_books_per_user_view WHERE user_id = %s
-    """
-    cursor.execute(query, (user_id,))
-    books = cursor.fetchall()
+    sold_out_cache.clear(book_id)
+    catalog_cache.invalidate_books()
+    backup_scheduler.mark_dirty()
+    return jsonify({"success": True, "book_id": book_id, "slots": slots if slots > 1 else 0,
+                    "quantity": quantity})
 
-    cursor.close()
-    connection.close()
+@app.route('/user/borrow_books')
+@read_only
+def borrow_books():
+    if 'user_logged_in' not in session:
+        return redirect(url_for('home'))
 
-    return render_template('borrow_books.html', books=books)
+    user_id = session.get('user_id')
+    title = request.args.get('q', '').strip()
+    after, before, page_size = parse_page_args(request.args, app.config['BORROW_BOOKS_PAGE_SIZE'])
+
+    offset = parse_offset(request.args)
+
+    def load():
+        with db_cursor(dictionary=True) as (connection, cursor):
+            # 有检索词时走全文索引按相关度分页，否则反连接 + 游标分页
+            page = search_available_books(cursor, user_id, title, offset, page_size)
+            searching = page is not None
+            if not searching:
+                page = available_books_page(cursor, user_id, after, before, page_size)
+        return {'page': page.to_dict(), 'searching': searching}
+
+    # 结果同时依赖图书库存和该用户的借阅集合
+    result = catalog_cache.get_or_load(
+        ('books', f'user:{user_id}'),
+        f'borrow_books:{user_id}:{title}:{offset}:{after}:{before}:{page_size}', load,
+        ttl=app.config['CACHE_STOCK_TTL'])
+    page = Page(**result['page'])
+
+    return render_template('borrow_books.html', books=page.items, page=page, q=title,
+                           searching=result['searching'])
 
 @app.route('/user/my_books')
+@read_only
 def my_books():
     if 'user_logged_in' not in session:
         return redirect(url_for('home'))
 
     user_id = session.get('user_id')
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    query = """
-        SELECT * FROM user_borrowed_books_view WHERE user_id = %s
-    """
-    cursor.execute(query, (user_id,))
-    books = cursor.fetchall()
+    def load():
+        with db_cursor(dictionary=True) as (connection, cursor):
+            query = """
+                SELECT * FROM user_borrowed_books_view WHERE user_id = %s
+            """
+            cursor.execute(query, (user_id,))
+            return cursor.fetchall()
 
-    cursor.close()
-    connection.close()
+    # 书名、图片来自 books，借阅集合来自该用户
+    books = catalog_cache.get_or_load(('books', f'user:{user_id}'), f'my_books:{user_id}', load)
 
     return render_template('my_books.html', books=books)
 
@@ -280,25 +750,18 @@ def borrow_book():
     if not user_id:
         return jsonify({'success': False, 'message': '用户未登录'}), 401
 
-    book_id = request.form.get('book_id')
-
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    try:
+        book_id = int(request.form.get('book_id'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '图书编号无效'})
 
     try:
-        # 调用存储过程实现借书原子操作
-        cursor.execute("CALL borrow_book(%s, %s)", (user_id, book_id))
-        connection.commit()
-        
-        # 触发备份
-        backup_database()
-        
-        return jsonify({'success': True, 'message': '借书成功'})
+        # 单本借书即只含一本书的批量借书
+        result = run_batch(circulation.borrow_books, user_id, [book_id])[0]
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)})
-    finally:
-        cursor.close()
-        connection.close()
+
+    return jsonify({'success': result['success'], 'message': result['message']})
 
 @app.route('/user/return', methods=['POST'])
 def return_book():
@@ -306,22 +769,31 @@ def return_book():
         return redirect(url_for('home'))
 
     user_id = session.get('user_id')
-    book_id = request.form.get('book_id')
+    try:
+        book_id = int(request.form.get('book_id'))
+    except (TypeError, ValueError):
+        return redirect(url_for('my_books'))
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    # 单本还书即只含一本书的批量还书
+    run_batch(circulation.return_books, user_id, [book_id])
 
-    # 直接调用还书存储过程
-    cursor.execute("CALL return_book(%s, %s)", (user_id, book_id))
-    connection.commit()
+    return redirect(url_for('my_books'))
 
-    cursor.close()
-    connection.close()
+@app.route('/api/borrow_batch', methods=['POST'])
+def api_borrow_batch():
+    if 'user_logged_in' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
 
-    # 触发备份
-    backup_database()
+    data = request.get_json(silent=True) or {}
+    return batch_response(circulation.borrow_books, session.get('user_id'), data.get('book_ids'))
 
-    return redirect(url_for('my_books'))
+@app.route('/api/return_batch', methods=['POST'])
+def api_return_batch():
+    if 'user_logged_in' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
+
+    data = request.get_json(silent=True) or {}
+    return batch_response(circulation.return_books, session.get('user_id'), data.get('book_ids'))
 
 @app.route('/logout', methods=['POST'])
 def logout():
@@ -329,20 +801,18 @@ def logout():
     return redirect(url_for('home'))
 
 @app.route('/admin/manage_users')
+@read_only
 def manage_users():
     if 'admin_logged_in' not in session:
         return redirect(url_for('home'))
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    cursor.execute("SELECT id, username FROM users")
-    users = cursor.fetchall()
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
 
-    cursor.close()
-    connection.close()
+    with db_cursor(dictionary=True) as (connection, cursor):
+        page = keyset_page(cursor, "SELECT id, username, active_borrow_count FROM users", [], [], 'id', 'id',
+                           after=after, before=before, page_size=page_size)
 
-    return render_template('manage_users.html', users=users)
+    return render_template('manage_users.html', users=page.items, page=page)
 
 @app.route('/admin/add_user', methods=['POST'])
 def add_user():
@@ -354,20 +824,15 @@ def add_user():
 
     hashed_password = generate_hash(password)
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    cursor.execute(
-        "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
-        (username, hashed_password)
-    )
-    connection.commit()
-
-    cursor.close()
-    connection.close()
+    with db_cursor() as (connection, cursor):
+        cursor.execute(
+            "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+            (username, hashed_password)
+        )
+        connection.commit()
 
     # 触发备份
-    backup_database()
+    backup_scheduler.mark_dirty()
 
     return redirect(url_for('manage_users'))
 
@@ -380,28 +845,23 @@ def edit_user():
     username = request.form.get('username')
     password = request.form.get('password')
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    if password:
-        hashed_password = generate_hash(password)
-        cursor.execute(
-            "UPDATE users SET username = %s, password_hash = %s WHERE id = %s",
-            (username, hashed_password, user_id)
-        )
-    else:
-        cursor.execute(
-            "UPDATE users SET username = %s WHERE id = %s",
-            (username, user_id)
-        )
-
-    connection.commit()
+    with db_cursor() as (connection, cursor):
+        if password:
+            hashed_password = generate_hash(password)
+            cursor.execute(
+                "UPDATE users SET username = %s, password_hash = %s WHERE id = %s",
+                (username, hashed_password, user_id)
+            )
+        else:
+            cursor.execute(
+                "UPDATE users SET username = %s WHERE id = %s",
+                (username, user_id)
+            )
 
-    cursor.close()
-    connection.close()
+        connection.commit()
 
     # 触发备份
-    backup_database()
+    backup_scheduler.mark_dirty()
 
     return redirect(url_for('manage_users'))
 
@@ -412,17 +872,12 @@ def delete_user():
 
     user_id = request.form.get('user_id')
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-    connection.commit()
-
-    cursor.close()
-    connection.close()
+    with db_cursor() as (connection, cursor):
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        connection.commit()
 
     # 触发备份
-    backup_database()
+    backup_scheduler.mark_dirty()
 
     return redirect(url_for('manage_users'))
 
@@ -435,130 +890,210 @@ def add_book():
     quantity = request.form.get('quantity')
     image = request.files.get('image')
 
+    image_filename = None
     if image:
-        # 保存图片到 static 文件夹，使用原始文件名
-        image_filename = image.filename
-        image.save(os.path.join('static', image_filename))
-    else:
-        image_filename = None
-
-    connection = get_db_connection()
-    cursor = connection.cursor()
+        # 按内容哈希保存图片，相同图片只存一份
+        try:
+            image_filename = image_store.save(image)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-    cursor.execute(
-        "INSERT INTO books (title, quantity, image_filename) VALUES (%s, %s, %s)",
-        (title, quantity, image_filename)
-    )
-    connection.commit()
+    with db_cursor() as (connection, cursor):
+        cursor.execute(
+            "INSERT INTO books (title, quantity, image_filename) VALUES (%s, %s, %s)",
+            (title, quantity, image_filename)
+        )
+        connection.commit()
 
-    cursor.close()
-    connection.close()
+    catalog_cache.invalidate_books()
 
     # 触发备份
-    backup_database()
+    backup_scheduler.mark_dirty()
 
     return redirect(url_for('manage_books'))
 
+@app.route('/api/import_books', methods=['POST'])
+def api_import_books():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({"success": False, "message": "缺少导入文件"}), 400
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"success": False, "message": f"不支持的导入格式: {fmt}"}), 400
+    add_quantity = request.form.get('add_quantity') in ('1', 'true', 'on')
+
+    connection = get_db_connection()
+    try:
+        # 逐行读取上传流，分块写入，每块一个事务；读取中途出错时已提交的块记录在报告中
+        report = import_books(
+            connection,
+            iter_records(upload.stream, fmt),
+            chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+            add_quantity=add_quantity,
+            image_dir=os.path.join(app.root_path, 'static')
+        )
+    finally:
+        connection.close()
+
+    # 只要写入过数据就刷新缓存并备份，整个导入只触发一次备份
+    if report['inserted'] or report['updated']:
+        catalog_cache.invalidate_books()
+        backup_scheduler.mark_dirty()
+
+    return jsonify({"success": report['failed'] == 0, "report": report})
+
+@app.route('/admin/export/<name>')
+@read_only
+def export_data(name):
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ENCODERS:
+        return jsonify({"success": False, "message": f"不支持的导出格式: {fmt}"}), 400
+    try:
+        sql, params, columns = export_query(name, request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    def generate():
+        # 非缓冲游标逐批读取；客户端中途断开时连接带着未读结果，归还时会被连接池丢弃
+        with db_cursor(buffered=False) as (connection, cursor):
+            batches = stream_rows(cursor, sql, params, app.config['EXPORT_FETCH_SIZE'])
+            yield from ENCODERS[fmt](batches, columns)
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# 管理页面的图书列表，借出数读取计数列
+MANAGE_BOOKS_SELECT = (f"SELECT id, title, quantity, image_filename, "
+                       f"{circulation.active_borrows_sql()} AS active_borrow_count FROM books")
+
 @app.route('/admin/manage_books')
+@read_only
 def manage_books():
     if 'admin_logged_in' not in session:
         return redirect(url_for('home'))
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    cursor.execute("SELECT id, title, quantity, image_filename FROM books")
-    books = cursor.fetchall()
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
 
-    cursor.close()
-    connection.close()
+    def load():
+        with db_cursor(dictionary=True) as (connection, cursor):
+            page = keyset_page(cursor, MANAGE_BOOKS_SELECT, [], [],
+                               'id', 'id', after=after, before=before, page_size=page_size)
+        return page.to_dict()
 
-    for book in books:
-        if book['image_filename']:
-            book['image_url'] = url_for('static', filename=book['image_filename'])
-        else:
-            book['image_url'] = None
+    page = Page(**catalog_cache.get_or_load(('books',), f'manage_books:{after}:{before}:{page_size}', load,
+                                            ttl=app.config['CACHE_STOCK_TTL']))
+    # 图片 URL 在缓存之外计算，变体生成后立即生效；复制行避免修改缓存中的对象
+    books = [dict(book, image_url=image_url(book['image_filename'], 'thumb')) for book in page.items]
 
-    return render_template('manage_books.html', books=books)
+    return render_template('manage_books.html', books=books, page=page)
 
 @app.route('/admin/manage_borrow_records')
+@read_only
 def manage_borrow_records():
     if 'admin_logged_in' not in session:
         return redirect(url_for('home'))
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
 
-    #查询所有借阅记录
-    query = """
-        SELECT * FROM borrow_record_view
-    """
-    cursor.execute(query)
-    borrow_records = cursor.fetchall()
+    with db_cursor(dictionary=True) as (connection, cursor):
+        #分页查询借阅记录；用户和书籍的选择改由 typeahead 接口按需加载
+        page = keyset_page(cursor, "SELECT * FROM borrow_record_view", [], [],
+                           'borrow_id', 'borrow_id', after=after, before=before, page_size=page_size)
 
-    #查询所有用户用于选择
-    cursor.execute("SELECT id, username FROM users")
-    users = cursor.fetchall()
+    return render_template('manage_borrow_records.html', borrow_records=page.items, page=page)
 
-    #查询所有书籍用于选择
-    cursor.execute("SELECT id, title FROM books")
-    books = cursor.fetchall()
+@app.route('/api/typeahead/users')
+@read_only
+def typeahead_users():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
 
-    cursor.close()
-    connection.close()
+    q = request.args.get('q', '').strip()
+    limit = app.config['TYPEAHEAD_LIMIT']
 
-    return render_template('manage_borrow_records.html', borrow_records=borrow_records, users=users, books=books)
+    with db_cursor(dictionary=True) as (connection, cursor):
+        # 用户名前缀匹配，走 username 唯一索引
+        cursor.execute(
+            "SELECT id, username FROM users WHERE username LIKE %s ORDER BY username LIMIT %s",
+            (escape_like(q) + '%', limit)
+        )
+        users = cursor.fetchall()
 
-@app.route('/admin/add_borrow_record', methods=['POST'])
-def add_borrow_record():
+    return jsonify({"success": True, "users": users})
+
+@app.route('/api/typeahead/books')
+@read_only
+def typeahead_books():
     if 'admin_logged_in' not in session:
-        return redirect(url_for('home'))
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
 
-    user_id = request.form.get('user_id')
-    book_id = request.form.get('book_id')
+    q = request.args.get('q', '').strip()
+    limit = app.config['TYPEAHEAD_LIMIT']
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    with db_cursor(dictionary=True) as (connection, cursor):
+        # 书名前缀匹配，走 idx_books_title；输入纯数字时同时按 id 查找
+        cursor.execute(
+            "SELECT id, title, quantity FROM books WHERE title LIKE %s ORDER BY title LIMIT %s",
+            (escape_like(q) + '%', limit)
+        )
+        books = cursor.fetchall()
+        if q.isdigit() and all(book['id'] != int(q) for book in books):
+            cursor.execute("SELECT id, title, quantity FROM books WHERE id = %s", (int(q),))
+            books = cursor.fetchall() + books
 
-    # 检查借阅记录是否已存在
-    cursor.execute(
-        "SELECT COUNT(*) AS count FROM borrow_records WHERE user_id = %s AND book_id = %s",
-        (user_id, book_id)
-    )
-    record_exists = cursor.fetchone()['count'] > 0
+    return jsonify({"success": True, "books": books})
 
-    # 查询书籍库存是否大于0
-    cursor.execute(
-        "SELECT quantity FROM books WHERE id = %s",
-        (book_id,)
-    )
-    book = cursor.fetchone()
-    if book:
-        book_quantity = book['quantity']
-    else:
-        book_quantity = 0
+@app.route('/admin/add_borrow_record', methods=['POST'])
+def add_borrow_record():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('home'))
 
-    if record_exists:
-        cursor.close()
-        connection.close()
-        return jsonify({"success": False, "message": "该借阅记录已存在！"}), 400
+    try:
+        user_id = int(request.form.get('user_id'))
+        book_id = int(request.form.get('book_id'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "用户或书籍编号无效"}), 400
 
-    if book_quantity <= 0:
-        cursor.close()
-        connection.close()
-        return jsonify({"success": False, "message": "书籍库存不足，无法添加借阅记录！"}), 400
+    # 重复借阅和库存检查都在批量借书过程中加锁完成
+    result = run_batch(circulation.borrow_books, user_id, [book_id], admin=True)[0]
+    if not result['success']:
+        return jsonify({"success": False, "message": result['message']}), 400
 
-    cursor.execute("CALL borrow_book(%s, %s)", (user_id, book_id))
+    return jsonify({"success": True, "message": "借阅记录添加成功！"}), 200
 
-    connection.commit()
+@app.route('/admin/borrow_batch', methods=['POST'])
+def admin_borrow_batch():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
 
-    cursor.close()
-    connection.close()
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id = int(data.get('user_id'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "用户编号无效"}), 400
+    return batch_response(circulation.borrow_books, user_id, data.get('book_ids'), admin=True)
 
-    # 触发备份
-    backup_database()
+@app.route('/admin/return_batch', methods=['POST'])
+def admin_return_batch():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
 
-    return jsonify({"success": True, "message": "借阅记录添加成功！"}), 200
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id = int(data.get('user_id'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "用户编号无效"}), 400
+    return batch_response(circulation.return_books, user_id, data.get('book_ids'), admin=True)
 
 @app.route('/admin/delete_borrow_record', methods=['POST'])
 def delete_borrow_record():
@@ -567,31 +1102,18 @@ def delete_borrow_record():
 
     borrow_record_id = request.form.get('borrow_record_id')
 
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    # 获取book_id和user_id
-    cursor.execute(
-        "SELECT book_id, user_id FROM borrow_records WHERE id = %s",
-        (borrow_record_id,)
-    )
-    record = cursor.fetchone()
-    if not record:
-        cursor.close()
-        connection.close()
-        return redirect(url_for('manage_borrow_records'))
-    book_id = record['book_id']
-    user_id = record['user_id']
-
-    # 调用还书存储过程（原子操作：还书+删除记录+加库存）
-    cursor.execute("CALL return_book(%s, %s)", (user_id, book_id))
-    connection.commit()
+    with db_cursor(dictionary=True) as (connection, cursor):
+        # 获取book_id和user_id
+        cursor.execute(
+            "SELECT book_id, user_id FROM borrow_records WHERE id = %s",
+            (borrow_record_id,)
+        )
+        record = cursor.fetchone()
+        if not record:
+            return redirect(url_for('manage_borrow_records'))
 
-    cursor.close()
-    connection.close()
-
-    # 触发备份
-    backup_database()
+    # 还书过程是原子操作：还书+删除记录+加库存
+    run_batch(circulation.return_books, record['user_id'], [record['book_id']], admin=True)
 
     return redirect(url_for('manage_borrow_records'))
 
@@ -602,22 +1124,17 @@ def api_delete_user():
 
     user_id = request.json.get('user_id')
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
     try:
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        connection.commit()
-        
-        # 触发备份
-        backup_database()
-        
-        return jsonify({"success": True, "message": "用户删除成功"}), 200
+        with db_cursor() as (connection, cursor):
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            connection.commit()
     except mysql.connector.errors.DatabaseError as e:
         return jsonify({"success": False, "message": str(e)}), 400
-    finally:
-        cursor.close()
-        connection.close()
+
+    # 触发备份
+    backup_scheduler.mark_dirty()
+
+    return jsonify({"success": True, "message": "用户删除成功"}), 200
 
 @app.route('/api/delete_book', methods=['DELETE'])
 def api_delete_book():
@@ -626,22 +1143,19 @@ def api_delete_book():
 
     book_id = request.json.get('book_id')
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
     try:
-        cursor.execute("DELETE FROM books WHERE id = %s", (book_id,))
-        connection.commit()
-        
-        # 触发备份
-        backup_database()
-        
-        return jsonify({"success": True, "message": "图书删除成功"}), 200
+        with db_cursor() as (connection, cursor):
+            cursor.execute("DELETE FROM books WHERE id = %s", (book_id,))
+            connection.commit()
     except mysql.connector.errors.DatabaseError as e:
         return jsonify({"success": False, "message": str(e)}), 400
-    finally:
-        cursor.close()
-        connection.close()
+
+    catalog_cache.invalidate_books()
+
+    # 触发备份
+    backup_scheduler.mark_dirty()
+
+    return jsonify({"success": True, "message": "图书删除成功"}), 200
 
 @app.route('/api/edit_book', methods=['POST'])
 def api_edit_book():
@@ -656,48 +1170,54 @@ def api_edit_book():
     if not all([book_id, title, quantity]):
         return jsonify({"success": False, "message": "缺少必要的字段"}), 400
 
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    image_filename = None
+    if image:
+        # 按内容哈希保存图片，相同图片只存一份
+        try:
+            image_filename = image_store.save(image)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
     try:
-        # 更新书籍信息
-        cursor.execute(
-            """
-            UPDATE books
-            SET title = %s, quantity = %s
-            WHERE id = %s
-            """,
-            (title, quantity, book_id)
-        )
-
-        # 更新图片（如果提供）
-        if image:
-            image_filename = image.filename
-            image.save(os.path.join('static', image_filename))
+        with db_cursor() as (connection, cursor):
+            # 已拆分库存的图书按新数量重新分配各分片
+            circulation.set_split_quantity(cursor, [int(book_id)], {int(book_id): int(quantity)})
+            # 更新书籍信息
             cursor.execute(
                 """
                 UPDATE books
-                SET image_filename = %s
+                SET title = %s, quantity = %s
                 WHERE id = %s
                 """,
-                (image_filename, book_id)
+                (title, quantity, book_id)
             )
 
-        connection.commit()
-        
-        # 触发备份
-        backup_database()
-        
+            # 更新图片（如果提供）
+            if image_filename:
+                cursor.execute(
+                    """
+                    UPDATE books
+                    SET image_filename = %s
+                    WHERE id = %s
+                    """,
+                    (image_filename, book_id)
+                )
+
+            connection.commit()
     except Exception as e:
-        connection.rollback()
         return jsonify({"success": False, "message": f"更新失败: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
+
+    # 书名、图片变化也会影响借阅者的"我的图书"，它们依赖 books 命名空间
+    catalog_cache.invalidate_books()
+    sold_out_cache.clear(int(book_id))
+
+    # 触发备份
+    backup_scheduler.mark_dirty()
 
     return jsonify({"success": True, "message": "图书信息更新成功"}), 200
 
 @app.route('/admin/filter_book', methods = ['POST'])
+@read_only
 def admin_filter_book():
     if 'admin_logged_in' not in session:
         return jsonify({"success": False, "message": "未登录管理员账号"}), 401
@@ -707,28 +1227,35 @@ def admin_filter_book():
         quantity = int(quantity)
     except(ValueError, TypeError):
         quantity = 0
-
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    sql_query = """
-        select * from books where title like %s and quantity >= %s
-    """
-
-    like_pattern = f"%{title}%"
-    cursor.execute(sql_query, (like_pattern, quantity))
-    books = cursor.fetchall()
-
-    cursor.close()
-    connection.close()
-
-    for book in books:
-        if book.get('image_filename'):
-            book['image_url'] = url_for('static', filename=book['image_filename'])
-        else:
-            book['image_url'] = None
-
-    return jsonify({"success": True, "books": books})
+    after, before, page_size = parse_page_args(request.form, app.config['ADMIN_PAGE_SIZE'])
+    offset = parse_offset(request.form)
+
+    def load():
+        with db_cursor(dictionary=True) as (connection, cursor):
+            # 书名走全文索引按相关度排序，未填写书名时只按库存筛选
+            page = search_books(cursor, title, quantity, offset, page_size)
+            searching = page is not None
+            if not searching:
+                page = keyset_page(cursor, MANAGE_BOOKS_SELECT,
+                                   ["quantity >= %s"], [quantity], 'id', 'id',
+                                   after=after, before=before, page_size=page_size)
+
+        # 翻页时需要附带的参数，检索结果用 offset，其余用 id 游标
+        next_page = prev_page = None
+        if page.next_cursor is not None:
+            next_page = {"offset": page.next_cursor} if searching else {"after": page.next_cursor}
+        if page.prev_cursor is not None:
+            prev_page = {"offset": page.prev_cursor} if searching else {"before": page.prev_cursor}
+        return {"books": page.items, "next_page": next_page, "prev_page": prev_page}
+
+    result = catalog_cache.get_or_load(
+        ('books',), f'filter_book:{title}:{quantity}:{offset}:{after}:{before}:{page_size}', load,
+        ttl=app.config['CACHE_STOCK_TTL'])
+
+    books = [dict(book, image_url=image_url(book['image_filename'], 'thumb')) for book in result['books']]
+
+    return jsonify({"success": True, "books": books,
+                    "next_page": result['next_page'], "prev_page": result['prev_page']})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+静态资源管道。
+
+页面样式和脚本放在 static/css、static/js 中，第三方库（Bootstrap、axios、
+Font Awesome）下载到 static/vendor 中随代码一起部署，运行时不再访问任何 CDN。
+构建时把这些文件复制到 static/dist，文件名中加入内容哈希，并生成 gzip
+（以及安装了 brotli 包时的 br）预压缩版本和 manifest.json。
+
+模板通过 asset_url('css/admin.css') 引用资源：构建过的资源由 /assets/ 提供，
+带 ETag 和一年的 immutable 缓存头，按 Accept-Encoding 直接发送预压缩文件；
+未构建时回退到 static 下的原文件。第三方库尚未下载时启动会给出警告，
+ASSET_ALLOW_CDN = True 时这些文件回退到原 CDN 地址。
+
+    python assets.py vendor   下载第三方库到 static/vendor（在能访问外网的机器上执行一次并提交）
+    python assets.py build    生成 static/dist（部署前执行，修改 css / js 后需要重新执行）
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+import urllib.request
+
+from flask import send_from_directory
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成 gzip 预压缩文件
+    brotli = None
+
+_FONTAWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+_BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha3/dist'
+
+# static 下的本地路径 -> 下载地址
+VENDOR = {
+    'vendor/bootstrap/css/bootstrap.min.css': f'{_BOOTSTRAP}/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js': f'{_BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'vendor/axios/axios.min.js': 'https://cdn.jsdelivr.net/npm/axios@1.6.8/dist/axios.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{_FONTAWESOME}/css/all.min.css',
+}
+for _font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility'):
+    for _ext in ('woff2', 'ttf'):
+        VENDOR[f'vendor/fontawesome/webfonts/{_font}.{_ext}'] = f'{_FONTAWESOME}/webfonts/{_font}.{_ext}'
+
+SOURCE_DIRS = ('css', 'js', 'vendor')
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.ttf', '.map'}
+# 预压缩文件的扩展名，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+?)\1\s*\)')
+
+
+def fingerprint(path, content):
+    base, ext = os.path.splitext(path)
+    return f"{base}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def download_vendor(static_dir):
+    """下载 VENDOR 中列出的第三方文件"""
+    for path, url in VENDOR.items():
+        target = os.path.join(static_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=60) as response, open(target + '.tmp', 'wb') as out:
+            shutil.copyfileobj(response, out)
+        os.replace(target + '.tmp', target)
+        print(f"{path} <- {url}")
+
+
+def _rewrite_css_urls(path, content, manifest):
+    """把 CSS 中引用的相对路径替换为带指纹的文件名（如 Font Awesome 的字体）"""
+    directory = os.path.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        target, sep, suffix = url.partition('?')
+        if '#' in target:
+            target, _, fragment = target.partition('#')
+            suffix = '#' + fragment
+            sep = ''
+        if re.match(r'^([a-z]+:|/)', target):
+            return match.group(0)
+        resolved = os.path.normpath(os.path.join(directory, target)).replace(os.sep, '/')
+        if resolved not in manifest:
+            return match.group(0)
+        relative = os.path.relpath(manifest[resolved], directory or '.').replace(os.sep, '/')
+        return f"url({quote}{relative}{sep}{suffix}{quote})"
+
+    return _CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _write_compressed(target, content):
+    if os.path.splitext(target)[1] not in COMPRESSIBLE:
+        return
+    with open(target + '.gz', 'wb') as out:
+        out.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(target + '.br', 'wb') as out:
+            out.write(brotli.compress(content))
+
+
+def build(static_dir):
+    """重新生成 static/dist，返回 manifest（原路径 -> 带指纹的路径）"""
+    sources = []
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(static_dir, source_dir)):
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                sources.append(os.path.relpath(full, static_dir).replace(os.sep, '/'))
+    # CSS 最后处理，此时它引用的字体、图片已经有了指纹
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = _rewrite_css_urls(path, content, manifest)
+        output = fingerprint(path, content)
+        target = os.path.join(dist_dir, output)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as out:
+            out.write(content)
+        _write_compressed(target, content)
+        manifest[path] = output
+
+    with open(os.path.join(dist_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def missing_vendor(static_dir, manifest):
+    """既没有下载到 static/vendor、也不在构建清单中的第三方文件"""
+    return [path for path in VENDOR
+            if manifest.lookup(path) is None and not os.path.exists(os.path.join(static_dir, path))]
+
+
+class AssetManifest:
+    """读取 static/dist/manifest.json，文件变化（重新构建）后自动重新加载"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST_DIR)
+        self._path = os.path.join(self.dist_dir, MANIFEST_FILE)
+        self._mtime = None
+        self._manifest = {}
+        self._fingerprinted = set()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._path).st_mtime
+        except FileNotFoundError:
+            self._mtime, self._manifest, self._fingerprinted = None, {}, set()
+            return
+        if mtime != self._mtime:
+            with open(self._path, encoding='utf-8') as f:
+                self._manifest = json.load(f)
+            self._fingerprinted = set(self._manifest.values())
+            self._mtime = mtime
+
+    def lookup(self, path):
+        """原路径对应的带指纹路径，未构建时返回 None"""
+        self._load()
+        return self._manifest.get(path)
+
+    def is_fingerprinted(self, path):
+        self._load()
+        return path in self._fingerprinted
+
+
+def send_asset(manifest, filename, accept_encoding, max_age):
+    """
+    发送带指纹的资源。客户端接受 br / gzip 时直接发送预压缩文件；
+    ETag 由文件名中的哈希和编码组成，If-None-Match 命中时返回 304。
+    """
+    chosen, encoding = filename, None
+    for name, suffix in ENCODINGS:
+        if name in accept_encoding and os.path.exists(os.path.join(manifest.dist_dir, filename + suffix)):
+            chosen, encoding = filename + suffix, name
+            break
+
+    digest = os.path.splitext(filename)[0].rsplit('.', 1)[-1]
+    response = send_from_directory(
+        manifest.dist_dir, chosen,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        etag=f"{digest}-{encoding or 'identity'}",
+        conditional=True,
+        max_age=max_age
+    )
+    response.headers.pop('Content-Disposition', None)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+if __name__ == '__main__':
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    if len(sys.argv) < 2 or sys.argv[1] not in ('vendor', 'build'):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == 'vendor':
+        download_vendor(static_dir)
+    else:
+        result = build(static_dir)
+        print(f"Built {len(result)} assets into {os.path.join(static_dir, DIST_DIR)}")
@@ -0,0 +1,505 @@
+"""
+异步部署模式（ASGI）。
+
+    pip install quart aiomysql asgiref hypercorn
+    hypercorn async_app:application --bind 0.0.0.0:5000
+
+登录、借阅页面、借还书、管理列表页和 JSON 接口由 Quart 协程处理，通过 aiomysql 连接池
+访问数据库；等待数据库时协程挂起而不占用线程，一个进程可以同时处理数千个请求。
+其余路由（图书和用户的增删改、导入导出、备份还原、静态资源等）仍由 app.py 中的
+Flask 视图处理，经 asgiref 在线程池中运行。两边共用 SECRET_KEY 和 cookie 会话格式，
+登录状态互通，缓存、指标、备份调度器等也是 app.py 中的同一批对象。
+备份由备份调度器的后台线程执行 mysqldump，不会阻塞事件循环。
+
+同步模式（python app.py 或 gunicorn app:app）不受影响。
+"""
+import os
+import time
+
+from quart import Quart, request, session, jsonify, redirect, url_for, render_template, g
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException
+
+import app as sync_app
+import circulation
+from config import Config
+from hash_util import generate_hash
+from async_db import AsyncDatabase
+from pagination import Page, parse_page_args, keyset_query, keyset_result
+from search import boolean_query, search_query, search_result, parse_offset, SEARCH_BOOKS_SELECT
+from catalog import available_books_query, escape_like
+from assets import VENDOR
+
+flask_app = sync_app.app
+catalog_cache = sync_app.catalog_cache
+
+app = Quart(__name__)
+app.config.from_object(Config)
+app.secret_key = Config.SECRET_KEY
+
+database = AsyncDatabase(
+    minsize=app.config['ASYNC_DB_POOL_MINSIZE'],
+    maxsize=app.config['ASYNC_DB_POOL_MAXSIZE'],
+    recycle=app.config['DB_POOL_RECYCLE'],
+    instrument=sync_app.db_instrument,
+    host=app.config['MYSQL_HOST'],
+    user=app.config['MYSQL_USER'],
+    password=app.config['MYSQL_PASSWORD'],
+    db=app.config['MYSQL_DB']
+)
+
+@app.before_serving
+async def start_database():
+    await database.start()
+
+@app.after_serving
+async def close_database():
+    await database.close()
+
+@app.template_global()
+def image_url(image_filename, size=None):
+    """图片的 URL，size 为 IMAGE_VARIANTS 中的名称，变体未生成时返回原图"""
+    path = sync_app.image_store.url_path(image_filename, size)
+    return url_for('static', filename=path) if path else None
+
+@app.template_global()
+def asset_url(path):
+    """静态资源的 URL：优先使用构建后带指纹的文件，其次是 static 下的原文件"""
+    fingerprinted = sync_app.asset_manifest.lookup(path)
+    if fingerprinted:
+        return url_for('asset', filename=fingerprinted)
+    if path in VENDOR and app.config['ASSET_ALLOW_CDN'] \
+            and not os.path.exists(os.path.join(flask_app.root_path, 'static', path)):
+        return VENDOR[path]
+    return url_for('static', filename=path)
+
+async def fetch_page(cursor, query, params, key_field, after, before, page_size):
+    await cursor.execute(query, params)
+    return keyset_result(await cursor.fetchall(), key_field, after, before, page_size)
+
+async def keyset_page(cursor, select_sql, conditions, params, key_column, key_field,
+                      after=None, before=None, page_size=20):
+    """pagination.keyset_page 的异步版本"""
+    query, params = keyset_query(select_sql, conditions, params, key_column, after, before, page_size)
+    return await fetch_page(cursor, query, params, key_field, after, before, page_size)
+
+async def search_page(cursor, select_sql, conditions, params, text, offset, page_size):
+    """search.search_page 的异步版本；输入没有有效词时返回 None"""
+    query = boolean_query(text)
+    if query is None:
+        return None
+    sql, params = search_query(select_sql, conditions, params, query, offset, page_size)
+    await cursor.execute(sql, params)
+    return search_result(await cursor.fetchall(), offset, page_size)
+
+async def run_batch(action, user_id, book_ids, admin=False):
+    """执行批量借书 / 还书，有成功项时使缓存失效并触发一次备份；admin 为管理员代办"""
+    sync_app.inventory_sync.start()
+    sync_app.loan_history_job.start()
+    async with database.connection() as connection:
+        results = await action(connection, user_id, book_ids,
+                               retry=sync_app.circulation_retry, sold_out=sync_app.sold_out_cache, admin=admin)
+    # record_batch 会递增缓存版本号，Redis 后端时不在事件循环中阻塞
+    return await catalog_cache.offload(sync_app.record_batch, action.__name__.replace('_async', ''),
+                                       user_id, results)
+
+async def batch_response(action, user_id, book_ids, admin=False):
+    """批量接口的公共处理：校验参数、执行并返回逐本结果"""
+    try:
+        book_ids = circulation.parse_book_ids(book_ids, app.config['BATCH_MAX_ITEMS'])
+        results = await run_batch(action, user_id, book_ids, admin)
+    except circulation.BatchError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as err:
+        return jsonify({"success": False, "message": str(err)}), 500
+
+    return jsonify({"success": all(item['success'] for item in results), "results": results})
+
+@app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+async def record_request_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        sync_app.request_latency.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                         method=request.method, status=response.status_code)
+    return response
+
+@app.before_request
+async def check_login():
+    # 与同步模式相同的登录校验
+    if request.endpoint == 'home':
+        if 'user_logged_in' in session:
+            return redirect(url_for('user_dashboard'))
+        elif 'admin_logged_in' in session:
+            return redirect(url_for('admin_dashboard'))
+    if request.endpoint not in ['home', 'user_login', 'admin_login', 'static', 'asset', 'metrics']:
+        if 'user_logged_in' not in session and 'admin_logged_in' not in session:
+            return redirect(url_for('home'))
+
+@app.route('/')
+async def home():
+    return await render_template('index.html')
+
+@app.route('/api/user_login', methods=['POST'])
+async def user_login():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    hashed_password = generate_hash(password)
+
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        await cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+        user = await cursor.fetchone()
+
+        if user:
+            if user['password_hash'] == hashed_password:
+                session['user_logged_in'] = True
+                session['username'] = username
+                session['user_id'] = user['id']
+                return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 200
+            else:
+                return jsonify({"success": False, "message": "密码错误"}), 401
+
+        # 若不存在 创建新用户
+        await cursor.execute(
+            "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+            (username, hashed_password)
+        )
+        user_id = cursor.lastrowid
+
+    session['user_logged_in'] = True
+    session['username'] = username
+    session['user_id'] = user_id
+    sync_app.backup_scheduler.mark_dirty()
+
+    return jsonify({"success": True, "redirect": url_for('user_dashboard')}), 201
+
+@app.route('/api/admin_login', methods=['POST'])
+async def admin_login():
+    data = await request.get_json()
+    hashed_password = generate_hash(data.get('password'))
+
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        await cursor.execute("SELECT * FROM admins WHERE username = %s AND password_hash = %s",
+                             (data.get('username'), hashed_password))
+        admin = await cursor.fetchone()
+
+    if admin:
+        session['admin_logged_in'] = True
+        return jsonify({"success": True, "redirect": url_for('admin_dashboard')}), 200
+    return jsonify({"success": False, "message": "用户名或密码错误"}), 401
+
+@app.route('/user')
+async def user_dashboard():
+    if 'user_logged_in' not in session:
+        return redirect(url_for('home'))
+    return await render_template('user.html', username=session.get('username', '用户'))
+
+@app.route('/logout', methods=['POST'])
+async def logout():
+    session.clear()
+    return redirect(url_for('home'))
+
+@app.route('/user/borrow_books')
+async def borrow_books():
+    if 'user_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    user_id = session.get('user_id')
+    title = request.args.get('q', '').strip()
+    after, before, page_size = parse_page_args(request.args, app.config['BORROW_BOOKS_PAGE_SIZE'])
+    offset = parse_offset(request.args)
+
+    async def load():
+        select_sql, conditions, params = available_books_query(user_id)
+        async with database.cursor(dictionary=True) as (connection, cursor):
+            page = await search_page(cursor, select_sql, conditions, params, title, offset, page_size)
+            searching = page is not None
+            if not searching:
+                page = await keyset_page(cursor, select_sql, conditions, params, 'b.id', 'book_id',
+                                         after=after, before=before, page_size=page_size)
+        return {'page': page.to_dict(), 'searching': searching}
+
+    # 与同步模式使用相同的缓存键，两种模式可以共用缓存
+    result = await catalog_cache.get_or_load_async(
+        ('books', f'user:{user_id}'),
+        f'borrow_books:{user_id}:{title}:{offset}:{after}:{before}:{page_size}', load,
+        ttl=app.config['CACHE_STOCK_TTL'])
+    page = Page(**result['page'])
+
+    return await render_template('borrow_books.html', books=page.items, page=page, q=title,
+                                 searching=result['searching'])
+
+@app.route('/user/my_books')
+async def my_books():
+    if 'user_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    user_id = session.get('user_id')
+
+    async def load():
+        async with database.cursor(dictionary=True) as (connection, cursor):
+            await cursor.execute("SELECT * FROM user_borrowed_books_view WHERE user_id = %s", (user_id,))
+            return await cursor.fetchall()
+
+    books = await catalog_cache.get_or_load_async(('books', f'user:{user_id}'), f'my_books:{user_id}', load)
+    return await render_template('my_books.html', books=books)
+
+@app.route('/user/borrow', methods=['POST'])
+async def borrow_book():
+    if 'user_logged_in' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'message': '用户未登录'}), 401
+
+    try:
+        book_id = int((await request.form).get('book_id'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '图书编号无效'})
+
+    try:
+        result = (await run_batch(circulation.borrow_books_async, user_id, [book_id]))[0]
+    except Exception as err:
+        return jsonify({'success': False, 'message': str(err)})
+
+    return jsonify({'success': result['success'], 'message': result['message']})
+
+@app.route('/user/return', methods=['POST'])
+async def return_book():
+    if 'user_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    user_id = session.get('user_id')
+    try:
+        book_id = int((await request.form).get('book_id'))
+    except (TypeError, ValueError):
+        return redirect(url_for('my_books'))
+
+    await run_batch(circulation.return_books_async, user_id, [book_id])
+    return redirect(url_for('my_books'))
+
+@app.route('/api/borrow_batch', methods=['POST'])
+async def api_borrow_batch():
+    if 'user_logged_in' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
+
+    data = await request.get_json(silent=True) or {}
+    return await batch_response(circulation.borrow_books_async, session.get('user_id'), data.get('book_ids'))
+
+@app.route('/api/return_batch', methods=['POST'])
+async def api_return_batch():
+    if 'user_logged_in' not in session:
+        return jsonify({'success': False, 'message': '请先登录'}), 401
+
+    data = await request.get_json(silent=True) or {}
+    return await batch_response(circulation.return_books_async, session.get('user_id'), data.get('book_ids'))
+
+@app.route('/admin/manage_users')
+async def manage_users():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        page = await keyset_page(cursor, "SELECT id, username, active_borrow_count FROM users", [], [],
+                                 'id', 'id', after=after, before=before, page_size=page_size)
+
+    return await render_template('manage_users.html', users=page.items, page=page)
+
+@app.route('/admin/manage_books')
+async def manage_books():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
+
+    async def load():
+        async with database.cursor(dictionary=True) as (connection, cursor):
+            page = await keyset_page(cursor, sync_app.MANAGE_BOOKS_SELECT, [], [],
+                                     'id', 'id', after=after, before=before, page_size=page_size)
+        return page.to_dict()
+
+    page = Page(**await catalog_cache.get_or_load_async(
+        ('books',), f'manage_books:{after}:{before}:{page_size}', load, ttl=app.config['CACHE_STOCK_TTL']))
+    books = [dict(book, image_url=image_url(book['image_filename'], 'thumb')) for book in page.items]
+
+    return await render_template('manage_books.html', books=books, page=page)
+
+@app.route('/admin/manage_borrow_records')
+async def manage_borrow_records():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    after, before, page_size = parse_page_args(request.args, app.config['ADMIN_PAGE_SIZE'])
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        page = await keyset_page(cursor, "SELECT * FROM borrow_record_view", [], [],
+                                 'borrow_id', 'borrow_id', after=after, before=before, page_size=page_size)
+
+    return await render_template('manage_borrow_records.html', borrow_records=page.items, page=page)
+
+@app.route('/api/typeahead/users')
+async def typeahead_users():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    q = request.args.get('q', '').strip()
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        await cursor.execute(
+            "SELECT id, username FROM users WHERE username LIKE %s ORDER BY username LIMIT %s",
+            (escape_like(q) + '%', app.config['TYPEAHEAD_LIMIT'])
+        )
+        users = await cursor.fetchall()
+
+    return jsonify({"success": True, "users": users})
+
+@app.route('/api/typeahead/books')
+async def typeahead_books():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    q = request.args.get('q', '').strip()
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        await cursor.execute(
+            "SELECT id, title, quantity FROM books WHERE title LIKE %s ORDER BY title LIMIT %s",
+            (escape_like(q) + '%', app.config['TYPEAHEAD_LIMIT'])
+        )
+        books = list(await cursor.fetchall())
+        if q.isdigit() and all(book['id'] != int(q) for book in books):
+            await cursor.execute("SELECT id, title, quantity FROM books WHERE id = %s", (int(q),))
+            books = list(await cursor.fetchall()) + books
+
+    return jsonify({"success": True, "books": books})
+
+@app.route('/admin/add_borrow_record', methods=['POST'])
+async def add_borrow_record():
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('home'))
+
+    form = await request.form
+    try:
+        user_id = int(form.get('user_id'))
+        book_id = int(form.get('book_id'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "用户或书籍编号无效"}), 400
+
+    result = (await run_batch(circulation.borrow_books_async, user_id, [book_id], admin=True))[0]
+    if not result['success']:
+        return jsonify({"success": False, "message": result['message']}), 400
+
+    return jsonify({"success": True, "message": "借阅记录添加成功！"}), 200
+
+async def admin_batch(action):
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    data = await request.get_json(silent=True) or {}
+    try:
+        user_id = int(data.get('user_id'))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "用户编号无效"}), 400
+    return await batch_response(action, user_id, data.get('book_ids'), admin=True)
+
+@app.route('/admin/borrow_batch', methods=['POST'])
+async def admin_borrow_batch():
+    return await admin_batch(circulation.borrow_books_async)
+
+@app.route('/admin/return_batch', methods=['POST'])
+async def admin_return_batch():
+    return await admin_batch(circulation.return_books_async)
+
+@app.route('/admin/filter_book', methods=['POST'])
+async def admin_filter_book():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+
+    form = await request.form
+    title = form.get('title', '')
+    try:
+        quantity = int(form.get('quantity', 0))
+    except (ValueError, TypeError):
+        quantity = 0
+    after, before, page_size = parse_page_args(form, app.config['ADMIN_PAGE_SIZE'])
+    offset = parse_offset(form)
+
+    async def load():
+        async with database.cursor(dictionary=True) as (connection, cursor):
+            page = await search_page(cursor, SEARCH_BOOKS_SELECT, ["b.quantity >= %s"], [quantity],
+                                     title, offset, page_size)
+            searching = page is not None
+            if not searching:
+                page = await keyset_page(cursor, sync_app.MANAGE_BOOKS_SELECT,
+                                         ["quantity >= %s"], [quantity], 'id', 'id',
+                                         after=after, before=before, page_size=page_size)
+
+        next_page = prev_page = None
+        if page.next_cursor is not None:
+            next_page = {"offset": page.next_cursor} if searching else {"after": page.next_cursor}
+        if page.prev_cursor is not None:
+            prev_page = {"offset": page.prev_cursor} if searching else {"before": page.prev_cursor}
+        return {"books": page.items, "next_page": next_page, "prev_page": prev_page}
+
+    result = await catalog_cache.get_or_load_async(
+        ('books',), f'filter_book:{title}:{quantity}:{offset}:{after}:{before}:{page_size}', load,
+        ttl=app.config['CACHE_STOCK_TTL'])
+    books = [dict(book, image_url=image_url(book['image_filename'], 'thumb')) for book in result['books']]
+
+    return jsonify({"success": True, "books": books,
+                    "next_page": result['next_page'], "prev_page": result['prev_page']})
+
+@app.route('/admin/cache_stats')
+async def cache_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+    return jsonify({"success": True, "stats": await catalog_cache.offload(catalog_cache.stats)})
+
+@app.route('/admin/db_pool_stats')
+async def db_pool_stats():
+    if 'admin_logged_in' not in session:
+        return jsonify({"success": False, "message": "未登录管理员账号"}), 401
+    # 异步模式下同时报告两个连接池：协程使用 aiomysql，委托给 Flask 的路由使用同步连接池
+    return jsonify({"success": True, "stats": database.stats(), "sync_stats": sync_app.db_pool.stats()})
+
+# 以上路由由协程处理；其余 URL 规则原样登记到 Quart，使模板中的 url_for 可以生成它们，
+# 实际请求由 Dispatcher 转交给 Flask
+NATIVE_ENDPOINTS = set(app.view_functions) - {'static'}
+
+def _delegated(**kwargs):
+    raise RuntimeError("handled by the Flask application")
+
+for rule in flask_app.url_map.iter_rules():
+    if rule.endpoint not in app.view_functions:
+        app.add_url_rule(rule.rule, endpoint=rule.endpoint, view_func=_delegated,
+                         methods=sorted(rule.methods - {'HEAD', 'OPTIONS'}))
+
+
+class Dispatcher:
+    """ASGI 入口：协程实现的路由交给 Quart，其余 HTTP 请求交给在线程池中运行的 Flask"""
+
+    def __init__(self, quart_app, wsgi_app):
+        self.quart_app = quart_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.url_map = wsgi_app.url_map
+
+    def is_native(self, scope):
+        adapter = self.url_map.bind('localhost')
+        try:
+            endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return False
+        return endpoint in NATIVE_ENDPOINTS
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self.is_native(scope):
+            await self.wsgi_app(scope, receive, send)
+        else:
+            # lifespan 事件也交给 Quart，以便启动和关闭连接池
+            await self.quart_app(scope, receive, send)
+
+
+application = Dispatcher(app, flask_app)
@@ -0,0 +1,134 @@
+"""
+异步模式（async_app.py）使用的 aiomysql 连接池。
+
+与 db_pool.ConnectionPool 的用法保持一致：
+
+    async with database.cursor(dictionary=True) as (connection, cursor):
+        await cursor.execute(...)
+        rows = await cursor.fetchall()
+
+连接池开启 autocommit，只读查询不会留下未结束的事务；需要事务的写操作
+（如借还书的存储过程）显式调用 begin() / commit()。
+传入 DatabaseInstrument 时与同步模式一样记录借出等待时间和每条语句的耗时。
+"""
+import time
+from contextlib import asynccontextmanager
+
+try:
+    import aiomysql
+except ImportError:  # 只在异步模式下需要
+    aiomysql = None
+
+
+class AsyncInstrumentedCursor:
+    """包装 aiomysql 游标，记录 execute / executemany 的耗时"""
+
+    def __init__(self, cursor, instrument):
+        self._cursor = cursor
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _timed(self, sql, coroutine):
+        start = time.perf_counter()
+        try:
+            result = await coroutine
+        except Exception as e:
+            self._instrument.observe_query(sql, time.perf_counter() - start, e)
+            raise
+        self._instrument.observe_query(sql, time.perf_counter() - start)
+        return result
+
+    async def execute(self, query, args=None):
+        return await self._timed(query, self._cursor.execute(query, args))
+
+    async def executemany(self, query, args):
+        return await self._timed(query, self._cursor.executemany(query, args))
+
+
+class AsyncConnection:
+    """连接池借出的连接；cursor() 按需返回字典游标并挂上观测钩子"""
+
+    def __init__(self, connection, instrument=None):
+        self._connection = connection
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def cursor(self, dictionary=False):
+        cursor = await self._connection.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor)
+        if self._instrument is not None:
+            return AsyncInstrumentedCursor(cursor, self._instrument)
+        return cursor
+
+
+class AsyncDatabase:
+    """
+    - minsize / maxsize: 常驻连接数和连接总数上限，连接耗尽时协程挂起等待，不占用线程
+    - recycle: 连接最长存活秒数，应小于 MySQL 的 wait_timeout
+    start() / close() 需要在事件循环中调用（Quart 的 before_serving / after_serving）。
+    """
+
+    def __init__(self, minsize=5, maxsize=50, recycle=3600, instrument=None, **connect_kwargs):
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.recycle = recycle
+        self.instrument = instrument
+        self._connect_kwargs = connect_kwargs
+        self._pool = None
+        self._stats = {'checkouts': 0, 'wait_time_total': 0.0, 'wait_time_max': 0.0}
+
+    async def start(self):
+        if aiomysql is None:
+            raise RuntimeError("aiomysql is required for the async mode: pip install aiomysql")
+        self._pool = await aiomysql.create_pool(
+            minsize=self.minsize,
+            maxsize=self.maxsize,
+            pool_recycle=self.recycle,
+            autocommit=True,
+            charset='utf8mb4',
+            **self._connect_kwargs
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.perf_counter()
+        async with self._pool.acquire() as connection:
+            waited = time.perf_counter() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            if self.instrument is not None:
+                self.instrument.observe_checkout(waited)
+            yield AsyncConnection(connection, self.instrument)
+
+    @asynccontextmanager
+    async def cursor(self, dictionary=False):
+        """async with database.cursor(dictionary=True) as (connection, cursor): ..."""
+        async with self.connection() as connection:
+            cursor = await connection.cursor(dictionary)
+            try:
+                yield connection, cursor
+            finally:
+                await cursor.close()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['minsize'] = self.minsize
+        stats['maxsize'] = self.maxsize
+        if self._pool is not None:
+            stats['size'] = self._pool.size
+            stats['idle'] = self._pool.freesize
+            stats['in_use'] = self._pool.size - self._pool.freesize
+        stats['wait_time_avg'] = (
+            stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        )
+        return stats
@@ -0,0 +1,868 @@
+import os
+import io
+import re
+import gzip
+import json
+import hashlib
+import shutil
+import subprocess
+import threading
+import time
+import atexit
+from datetime import datetime, date
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只保证进程内串行
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # 未安装时只能使用 gzip / 不压缩
+    zstandard = None
+
+
+class BackupScheduler:
+    """
+    后台备份调度器。
+
+    写操作只调用 mark_dirty() 标记"数据已变更"并立即返回；后台线程把一段时间内的
+    多次标记合并成一次备份，两次备份的开始时间至少间隔 window 秒。
+    同一进程内只有一个工作线程，多个 worker 进程之间通过 backup 目录下的文件锁
+    保证同一时刻只有一个 mysqldump 在运行。
+    """
+
+    def __init__(self, job, window=60, lock_path=None):
+        self.job = job
+        self.window = window
+        self.lock_path = lock_path
+        self._reset()
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pending = 0
+        self._running = False
+        self._last_start = None
+        self._status = {
+            'last_success_at': None,
+            'last_success_file': None,
+            'last_error': None,
+            'last_error_at': None,
+            'last_duration': None,
+            'runs': 0,
+            'failures': 0,
+            'coalesced': 0,
+        }
+
+    def _ensure_worker(self):
+        if self._pid != os.getpid():
+            # fork 后线程不会被继承，重新初始化
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name='backup-scheduler', daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self):
+        """标记数据已变更，需要在下一个窗口内备份"""
+        with self._cond:
+            self._ensure_worker()
+            if self._pending:
+                self._status['coalesced'] += 1
+            self._pending += 1
+            self._cond.notify()
+
+    def _next_start(self):
+        if self._last_start is None:
+            return time.monotonic()
+        return self._last_start + self.window
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending or self._running:
+                        self._cond.wait()
+                        continue
+                    # 等到窗口结束，期间到达的标记全部合并进这一次备份
+                    delay = self._next_start() - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                self._pending = 0
+                self._running = True
+                self._last_start = time.monotonic()
+            try:
+                self._run_job()
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+
+    def _run_job(self):
+        lock_file = None
+        start = time.monotonic()
+        try:
+            if fcntl is not None and self.lock_path:
+                os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+                lock_file = open(self.lock_path, 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            result = self.job()
+            with self._cond:
+                self._status['runs'] += 1
+                self._status['last_success_at'] = datetime.now().isoformat(timespec='seconds')
+                self._status['last_success_file'] = result
+                self._status['last_duration'] = round(time.monotonic() - start, 3)
+        except Exception as e:
+            with self._cond:
+                self._status['failures'] += 1
+                self._status['last_error'] = str(e)
+                self._status['last_error_at'] = datetime.now().isoformat(timespec='seconds')
+                self._status['last_duration'] = round(time.monotonic() - start, 3)
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def flush(self, timeout=None):
+        """进程退出前等待进行中的备份，并同步执行尚未处理的备份"""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._cond.wait(remaining)
+            if not self._pending:
+                return
+            self._pending = 0
+            self._running = True
+            self._last_start = time.monotonic()
+        try:
+            self._run_job()
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            status = dict(self._status)
+            status['queue_depth'] = self._pending
+            status['in_flight'] = self._running
+            status['window'] = self.window
+        return status
+
+
+# 增量备份跟踪的表，顺序即插入顺序（先父表后子表），删除时倒序
+INCREMENTAL_TABLES = ['users', 'books', 'borrow_records']
+# 复合主键的表按图书整组跟踪：change_log.row_id 记录 book_id，回放时先删除该书的全部行再写入当前行
+GROUPED_TABLES = {'book_inventory_slots': 'book_id', 'book_circulation_stats': 'book_id'}
+# 借还时累加的统计表，行数有限且变化频繁，不写 change_log，每次增量整表写入
+SNAPSHOT_TABLES = ['circulation_counters', 'circulation_snapshot']
+# 每日借还次数只有当天的行会变化，增量写入上一次备份当天及之后的行
+DAILY_TABLE = 'circulation_daily'
+# 只追加的借阅历史，不写 change_log，按自增 id 的高水位导出新增的行
+APPEND_ONLY_TABLE = 'loan_events'
+
+# 压缩格式对应的文件后缀
+COMPRESSION_SUFFIXES = {
+    'none': '.sql',
+    'gzip': '.sql.gz',
+    'zstd': '.sql.zst',
+}
+
+# 流式复制时每次读写的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# information_schema.INNODB_TRX 的刷新间隔（秒），读取高水位后按此间隔轮询未结束的事务
+TRX_CACHE_REFRESH = 0.2
+
+
+def sql_literal(value):
+    """把 Python 值转换为可以直接写入 SQL 文件的字面量"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "X'" + bytes(value).hex() + "'"
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    text = str(value)
+    for src, dst in (('\\', '\\\\'), ("'", "\\'"), ('\0', '\\0'),
+                     ('\n', '\\n'), ('\r', '\\r'), ('\x1a', '\\Z')):
+        text = text.replace(src, dst)
+    return "'" + text + "'"
+
+
+def _write_rows(f, table, rows, ignore=False, batch_size=500):
+    """把字典游标取出的行写成多值 INSERT，每条最多 batch_size 行"""
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        columns = list(batch[0].keys())
+        values = ', '.join('(' + ', '.join(sql_literal(row[c]) for c in columns) + ')' for row in batch)
+        f.write(f"INSERT {'IGNORE ' if ignore else ''}INTO {table} "
+                f"({', '.join(f'`{c}`' for c in columns)}) VALUES {values};\n")
+
+
+def is_backup_file(name):
+    return name.startswith(('backup_', 'incr_')) and name.endswith(tuple(COMPRESSION_SUFFIXES.values()))
+
+
+def backup_time(name):
+    """从文件名 backup_YYYYmmdd_HHMMSS.sql[.gz] 中解析备份时间，避免 stat 文件"""
+    stem = name.split('.', 1)[0]
+    return datetime.strptime(stem.split('_', 1)[1], '%Y%m%d_%H%M%S')
+
+
+def open_backup(filepath, mode='rb'):
+    """按后缀打开备份文件，返回（解）压缩后的二进制流"""
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, mode)
+    if filepath.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("zstd backups require the 'zstandard' package")
+        raw = open(filepath, mode)
+        if 'w' in mode:
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(filepath, mode)
+
+
+def read_header(filepath):
+    """读取备份文件开头 `-- key: value` 形式的元数据"""
+    header = {}
+    with io.TextIOWrapper(open_backup(filepath, 'rb'), encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('-- '):
+                break
+            key, sep, value = line[3:].partition(':')
+            if sep:
+                header[key.strip()] = value.strip()
+    return header
+
+
+def file_sha256(filepath):
+    """计算备份文件（压缩后内容）的 sha256"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_DUMP_INSERT = re.compile(rb"^INSERT INTO `([^`]+)` VALUES ")
+_SQL_STRING = re.compile(rb"'(?:[^'\\]|\\.)*'")
+
+
+def count_dump_rows(line, counts):
+    """统计 mysqldump 扩展 INSERT 语句中的行数，累加到 counts[表名]"""
+    match = _DUMP_INSERT.match(line)
+    if not match:
+        return
+    # 去掉字符串字面量后，行与行之间的分隔符 "),(" 不会再被误判
+    values = _SQL_STRING.sub(b"''", line[match.end():])
+    table = match.group(1).decode('utf-8')
+    counts[table] = counts.get(table, 0) + values.count(b'),(') + 1
+
+
+class RetentionPolicy:
+    """
+    备份保留策略：
+
+    - keep_last: 无条件保留最近的 N 个备份
+    - hourly / daily / weekly: 在最近 N 个小时 / 天 / 周里，每个时间段保留最新的一个
+    - max_total_bytes: 以上规则保留下来的文件总大小超过上限时，从最旧的开始删除
+
+    增量文件依赖其基准和之前的增量：保留增量时一并保留整条链，基准被删除时其增量也一起删除。
+    """
+
+    def __init__(self, keep_last=10, hourly=24, daily=7, weekly=4, max_total_bytes=None):
+        self.keep_last = keep_last
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self.max_total_bytes = max_total_bytes
+
+    def select(self, backups):
+        """
+        backups: [(name, created_at, size, base)]，base 为增量文件的基准名，全量为 None。
+        返回需要保留的文件名集合。
+        """
+        ordered = sorted(backups, key=lambda b: b[1], reverse=True)
+        keep = {b[0] for b in ordered[:self.keep_last]}
+
+        tiers = (
+            (self.hourly, lambda t: t.strftime('%Y%m%d%H')),
+            (self.daily, lambda t: t.strftime('%Y%m%d')),
+            (self.weekly, lambda t: t.strftime('%G%V')),
+        )
+        for limit, bucket_of in tiers:
+            seen = set()
+            for name, created_at, _, _ in ordered:
+                bucket = bucket_of(created_at)
+                if bucket in seen:
+                    continue
+                if len(seen) >= limit:
+                    break
+                seen.add(bucket)
+                keep.add(name)
+
+        # 增量只有连同基准和之前的所有增量一起才能回放
+        bases = {b[0]: b[3] for b in ordered}
+        times = {b[0]: b[1] for b in ordered}
+        for name in list(keep):
+            base = bases.get(name)
+            if base:
+                keep.add(base)
+                keep |= {n for n, b in bases.items() if b == base and times[n] <= times[name]}
+        keep = {name for name in keep if not bases.get(name) or bases[name] in times}
+
+        if self.max_total_bytes is not None:
+            sizes = {b[0]: b[2] for b in ordered}
+            total = sum(sizes[name] for name in keep)
+            # 以整条链（全量 + 其增量）为单位从最旧的开始删除，最新的链永远保留
+            newest_chain = bases.get(ordered[0][0]) or ordered[0][0]
+            for name, _, _, base in reversed(ordered):
+                if total <= self.max_total_bytes:
+                    break
+                if base or name not in keep or name == newest_chain:
+                    continue
+                for n in [name] + [n for n in keep if bases.get(n) == name]:
+                    keep.discard(n)
+                    total -= sizes[n]
+        return keep
+
+
+class BackupManager:
+    """
+    负责 mysqldump 全量备份、基于 change_log 的增量备份以及还原。
+
+    mode='full'：每次都做全量备份（原有行为）。
+    mode='incremental'：每 full_interval 秒做一次全量基准备份，其余时间只把
+    change_log 中记录的 users/books/borrow_records 变更行导出为增量文件。
+    还原时可以选择基准或任一增量文件，按时间顺序回放到指定时间点。
+
+    备份在导出的同时流式压缩（compression 为 'none' / 'gzip' / 'zstd'），还原时
+    边解压边写入 mysql 客户端，不落临时文件。
+
+    每个备份都会记录到 manifest.jsonl（文件名、类型、大小、各表行数、耗时、
+    sha256），列表与还原都以清单为准；还原前校验校验和，并支持先还原到临时库试跑。
+    """
+
+    STATE_FILE = 'incremental_state.json'
+    MANIFEST_FILE = 'manifest.jsonl'
+
+    def __init__(self, config, backup_dir, connect, mode='full', full_interval=86400,
+                 compression='gzip', retention=None, drain_timeout=60):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown backup compression: {compression}")
+        self.config = config
+        self.backup_dir = backup_dir
+        self.connect = connect
+        self.mode = mode
+        self.full_interval = full_interval
+        self.compression = compression
+        self.retention = retention
+        self.drain_timeout = drain_timeout
+        self._manifest_cache = (None, [])
+
+    def _client_args(self, program):
+        return [
+            program,
+            f"-h{self.config['MYSQL_HOST']}",
+            f"-u{self.config['MYSQL_USER']}",
+            f"-p{self.config['MYSQL_PASSWORD']}",
+        ]
+
+    def _path(self, filename):
+        return os.path.join(self.backup_dir, filename)
+
+    def _new_filename(self, prefix, created_at):
+        return f"{prefix}_{created_at.strftime('%Y%m%d_%H%M%S')}{COMPRESSION_SUFFIXES[self.compression]}"
+
+    def _load_state(self):
+        try:
+            with open(self._path(self.STATE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_state(self, state):
+        tmp_path = self._path(self.STATE_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(self.STATE_FILE))
+
+    def clear_state(self):
+        """还原之后 change_log 与备份链不再对应，下一次备份重新做基准"""
+        try:
+            os.remove(self._path(self.STATE_FILE))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _has_change_log_triggers(cursor):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TRIGGERS "
+            "WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME LIKE 'log\\_%'"
+        )
+        return cursor.fetchone()[0] > 0
+
+    def _watermarks(self):
+        """
+        当前的 change_log 高水位、loan_events 高水位和数据库日期。
+
+        自增 id 在插入时分配、提交后才可见：读取 MAX(id) 时尚未提交的事务可能持有更小的 id，
+        之后再提交就会落在高水位以下而永远不被导出。因此读取高水位后等待当时已经写入数据的
+        事务全部结束（提交或回滚）才返回，调用方随后新开的读视图一定包含高水位以下的全部行。
+        需要 PROCESS 权限读取 information_schema.INNODB_TRX。
+        """
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+            change_id = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0), CURDATE() FROM {APPEND_ONLY_TABLE}")
+            event_id, today = cursor.fetchone()
+            # INNODB_TRX 是最多 0.1 秒刷新一次的缓存，先等待一个刷新周期，保证看到的是读取高水位之后的状态
+            time.sleep(TRX_CACHE_REFRESH)
+            cursor.execute(
+                "SELECT trx_id FROM information_schema.INNODB_TRX "
+                "WHERE trx_rows_modified > 0 AND trx_mysql_thread_id <> CONNECTION_ID()"
+            )
+            pending = [row[0] for row in cursor.fetchall()]
+            deadline = time.monotonic() + self.drain_timeout
+            while pending:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Timed out waiting for {len(pending)} open transactions before the backup")
+                time.sleep(TRX_CACHE_REFRESH)
+                placeholders = ', '.join(['%s'] * len(pending))
+                cursor.execute(f"SELECT trx_id FROM information_schema.INNODB_TRX WHERE trx_id IN ({placeholders})",
+                               pending)
+                pending = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            return change_id, event_id, today
+        finally:
+            connection.close()
+
+    # ---- 备份清单 ----
+
+    def load_manifest(self):
+        """读取备份清单，文件未变化时直接返回缓存；清单不存在时由目录重建"""
+        path = self._path(self.MANIFEST_FILE)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if not os.path.exists(self.backup_dir):
+                return []
+            self._write_manifest(self._rebuild_manifest())
+            st = os.stat(path)
+
+        key = (st.st_mtime_ns, st.st_size)
+        if self._manifest_cache[0] != key:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            self._manifest_cache = (key, entries)
+        return self._manifest_cache[1]
+
+    def _write_manifest(self, entries):
+        """先写临时文件再原子替换，读者不会看到写了一半的清单"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        tmp_path = self._path(self.MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(self.MANIFEST_FILE))
+
+    def _rebuild_manifest(self):
+        """为升级前生成、没有清单记录的备份文件补建条目（行数与耗时未知）"""
+        entries = []
+        for name in os.listdir(self.backup_dir):
+            if not is_backup_file(name):
+                continue
+            header = read_header(self._path(name))
+            entries.append({
+                'filename': name,
+                'type': 'incremental' if header.get('type') == 'incremental' else 'full',
+                'base': header.get('base'),
+                'created_at': backup_time(name).isoformat(timespec='seconds'),
+                'size': os.path.getsize(self._path(name)),
+                'sha256': file_sha256(self._path(name)),
+                'row_counts': None,
+                'duration': None,
+                'to_change_id': int(header['to_change_id']) if 'to_change_id' in header else None,
+            })
+        entries.sort(key=lambda e: e['created_at'])
+        return entries
+
+    def _record(self, entry):
+        entries = [e for e in self.load_manifest() if e['filename'] != entry['filename']]
+        self._write_manifest(entries + [entry])
+
+    def manifest_entry(self, filename):
+        for entry in self.load_manifest():
+            if entry['filename'] == filename:
+                return entry
+        return None
+
+    def list_backups(self):
+        """按备份时间倒序返回清单中的备份条目"""
+        return sorted(self.load_manifest(), key=lambda e: e['created_at'], reverse=True)
+
+    # ---- 备份 ----
+
+    def backup(self):
+        """执行一次备份，返回生成的文件名；增量模式下没有变更时返回 None"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        # 先确保清单存在（必要时由已有文件重建），再写入新的备份
+        self.load_manifest()
+        start = time.monotonic()
+        entry = None
+        if self.mode == 'incremental':
+            state = self._load_state()
+            if state and time.time() - state['base_created_at'] < self.full_interval:
+                entry = self._incremental_backup(state)
+                if entry is None:
+                    return None
+        if entry is None:
+            entry = self._full_backup()
+
+        filepath = self._path(entry['filename'])
+        entry['size'] = os.path.getsize(filepath)
+        entry['sha256'] = file_sha256(filepath)
+        entry['duration'] = round(time.monotonic() - start, 3)
+        self._record(entry)
+        return entry['filename']
+
+    def _full_backup(self):
+        # 先记录 change_log 高水位（并等待高水位以下的事务结束）再导出：期间发生的变更会在
+        # 下一次增量中重复出现，而增量回放是幂等的，因此不会丢失；高水位以下的行都已包含在导出中
+        change_id = event_id = today = None
+        if self.mode == 'incremental':
+            change_id, event_id, today = self._watermarks()
+
+        created_at = datetime.now()
+        filename = self._new_filename('backup', created_at)
+        filepath = self._path(filename)
+
+        # 注意：mysqldump 需要在系统环境变量中，或者指定完整路径
+        command = self._client_args('mysqldump') + [
+            '--single-transaction',
+            '--routines', # 导出存储过程和函数
+            '--events',   # 导出定时事件
+            self.config['MYSQL_DB']
+        ]
+        # mysqldump 的输出直接流经压缩器写入文件，内存占用与库大小无关；
+        # 顺带统计每张表导出的行数写入清单
+        row_counts = {}
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        try:
+            with open_backup(filepath, 'wb') as out:
+                for line in process.stdout:
+                    out.write(line)
+                    count_dump_rows(line, row_counts)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            os.remove(filepath)
+            raise subprocess.CalledProcessError(returncode, command[0])
+
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            if change_id is None:
+                # 全量模式不使用 change_log：清空残留的变更（如从增量模式切换过来），旧的增量链也随之失效
+                cursor.execute("DELETE FROM change_log")
+                self.clear_state()
+            elif self._has_change_log_triggers(cursor):
+                self._save_state({
+                    'base': filename,
+                    'base_created_at': time.time(),
+                    'last_change_id': change_id,
+                    'last_event_id': event_id,
+                    'daily_from': today.isoformat(),
+                })
+                # 基准之前的变更已经包含在全量备份中
+                cursor.execute("DELETE FROM change_log WHERE id <= %s", (change_id,))
+            else:
+                # 没有触发器时 change_log 不会记录变更，不能在这个基准上做增量
+                print("Warning: change_log triggers are missing, run initialize_db.py to enable incremental backups")
+                self.clear_state()
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        return {
+            'filename': filename,
+            'type': 'full',
+            'base': None,
+            'created_at': created_at.isoformat(timespec='seconds'),
+            'row_counts': row_counts,
+            'to_change_id': change_id,
+        }
+
+    def _incremental_backup(self, state):
+        to_change_id, to_event_id, today = self._watermarks()
+        from_change_id = state['last_change_id']
+        if to_change_id <= from_change_id:
+            return None
+        # 新连接的读视图晚于 _watermarks 等待结束的事务，高水位以下的行都已可见
+        connection = self.connect()
+        try:
+            cursor = connection.cursor(dictionary=True)
+            # 旧版本的状态文件没有这两项，第一次增量导出全部借阅历史和每日计数（回放是幂等的）
+            from_event_id = state.get('last_event_id', 0)
+            daily_from = state.get('daily_from', '1970-01-01')
+
+            cursor.execute(
+                """
+                SELECT table_name, row_id FROM change_log
+                WHERE id > %s AND id <= %s
+                GROUP BY table_name, row_id
+                """,
+                (from_change_id, to_change_id)
+            )
+            changed = {table: set() for table in INCREMENTAL_TABLES + list(GROUPED_TABLES)}
+            for row in cursor.fetchall():
+                changed.setdefault(row['table_name'], set()).add(row['row_id'])
+
+            # 取出变更行的当前状态；查不到的行说明已被删除
+            current = {}
+            for table, ids in changed.items():
+                key = GROUPED_TABLES.get(table, 'id')
+                current[table] = []
+                id_list = sorted(ids)
+                for i in range(0, len(id_list), 500):
+                    chunk = id_list[i:i + 500]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    cursor.execute(f"SELECT * FROM {table} WHERE {key} IN ({placeholders})", chunk)
+                    current[table].extend(cursor.fetchall())
+            for table in SNAPSHOT_TABLES:
+                cursor.execute(f"SELECT * FROM {table}")
+                current[table] = cursor.fetchall()
+            cursor.execute(f"SELECT * FROM {DAILY_TABLE} WHERE day >= %s", (daily_from,))
+            current[DAILY_TABLE] = cursor.fetchall()
+            cursor.execute(
+                f"SELECT * FROM {APPEND_ONLY_TABLE} WHERE id > %s AND id <= %s ORDER BY id",
+                (from_event_id, to_event_id)
+            )
+            current[APPEND_ONLY_TABLE] = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        created_at = datetime.now()
+        filename = self._new_filename('incr', created_at)
+        row_counts = {}
+        with io.TextIOWrapper(open_backup(self._path(filename), 'wb'), encoding='utf-8') as f:
+            f.write("-- type: incremental\n")
+            f.write(f"-- base: {state['base']}\n")
+            f.write(f"-- created_at: {created_at.isoformat(timespec='seconds')}\n")
+            f.write(f"-- from_change_id: {from_change_id}\n")
+            f.write(f"-- to_change_id: {to_change_id}\n")
+            f.write("SET FOREIGN_KEY_CHECKS=0;\n")
+            # 回放时计数列只在随后的 upsert 中更新，删除时它们仍是基准时的值，
+            # 设置 @restoring_backup 让 prevent_*_deletion 触发器跳过借出数检查
+            f.write("SET @restoring_backup = 1;\n")
+            # 先删除子表再删除父表
+            for table in reversed(INCREMENTAL_TABLES):
+                alive = {row['id'] for row in current[table]}
+                deleted = sorted(changed[table] - alive)
+                if deleted:
+                    f.write(f"DELETE FROM {table} WHERE id IN ({', '.join(map(str, deleted))});\n")
+            # 用 INSERT ... ON DUPLICATE KEY UPDATE 而不是 REPLACE，REPLACE 会先删除行
+            for table in INCREMENTAL_TABLES:
+                row_counts[table] = len(current[table])
+                for row in current[table]:
+                    columns = list(row.keys())
+                    values = ', '.join(sql_literal(row[c]) for c in columns)
+                    updates = ', '.join(f"`{c}` = VALUES(`{c}`)" for c in columns if c != 'id')
+                    f.write(
+                        f"INSERT INTO {table} ({', '.join(f'`{c}`' for c in columns)}) "
+                        f"VALUES ({values}) ON DUPLICATE KEY UPDATE {updates};\n"
+                    )
+            # 整组替换：先删除变更图书的全部行，再写入这些图书的当前行
+            for table, key in GROUPED_TABLES.items():
+                if changed[table]:
+                    f.write(f"DELETE FROM {table} WHERE {key} IN ({', '.join(map(str, sorted(changed[table])))});\n")
+                _write_rows(f, table, current[table])
+                row_counts[table] = len(current[table])
+            for table in SNAPSHOT_TABLES:
+                f.write(f"DELETE FROM {table};\n")
+                _write_rows(f, table, current[table])
+                row_counts[table] = len(current[table])
+            f.write(f"DELETE FROM {DAILY_TABLE} WHERE day >= {sql_literal(daily_from)};\n")
+            _write_rows(f, DAILY_TABLE, current[DAILY_TABLE])
+            row_counts[DAILY_TABLE] = len(current[DAILY_TABLE])
+            # 借阅历史只追加，重复回放时跳过已有的行
+            _write_rows(f, APPEND_ONLY_TABLE, current[APPEND_ONLY_TABLE], ignore=True)
+            row_counts[APPEND_ONLY_TABLE] = len(current[APPEND_ONLY_TABLE])
+            f.write("SET @restoring_backup = NULL;\n")
+            f.write("SET FOREIGN_KEY_CHECKS=1;\n")
+
+        state['last_change_id'] = to_change_id
+        state['last_event_id'] = to_event_id
+        state['daily_from'] = today.isoformat()
+        self._save_state(state)
+        return {
+            'filename': filename,
+            'type': 'incremental',
+            'base': state['base'],
+            'created_at': created_at.isoformat(timespec='seconds'),
+            'row_counts': row_counts,
+            'to_change_id': to_change_id,
+        }
+
+    def prune(self):
+        """按保留策略清理 backup 目录并同步更新清单，返回被删除的文件名"""
+        if self.retention is None:
+            return []
+        entries = self.load_manifest()
+        if not entries:
+            return []
+        backups = [
+            (e['filename'], datetime.fromisoformat(e['created_at']), e['size'], e['base'])
+            for e in entries
+        ]
+
+        # 当前增量链的基准必须保留，否则后续增量无法回放
+        keep = self.retention.select(backups)
+        state = self._load_state()
+        if state:
+            keep.add(state['base'])
+
+        removed = [e['filename'] for e in entries if e['filename'] not in keep]
+        if removed:
+            self._write_manifest([e for e in entries if e['filename'] in keep])
+            for name in removed:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    # ---- 还原 ----
+
+    def restore_chain(self, filename, until=None):
+        """
+        计算还原 filename 需要依次回放的文件：基准 + 时间不晚于目标的增量。
+        until 为 datetime 时，进一步截止到该时间点。只接受清单中登记过的文件。
+        """
+        entry = self.manifest_entry(filename)
+        if entry is None:
+            raise FileNotFoundError(f"Backup file not found: {filename}")
+
+        if entry['type'] == 'incremental':
+            base = entry['base']
+            target = datetime.fromisoformat(entry['created_at'])
+            if until is not None:
+                target = min(target, until)
+        else:
+            base = filename
+            target = until
+
+        chain = [base]
+        if base == filename and until is None:
+            return chain
+        incrementals = [
+            e for e in self.load_manifest()
+            if e['type'] == 'incremental' and e['base'] == base
+            and (target is None or datetime.fromisoformat(e['created_at']) <= target)
+        ]
+        incrementals.sort(key=lambda e: (e['to_change_id'] or 0, e['created_at']))
+        chain.extend(e['filename'] for e in incrementals)
+        return chain
+
+    def verify(self, chain):
+        """校验链上每个文件都存在且 sha256 与清单一致"""
+        for name in chain:
+            entry = self.manifest_entry(name)
+            filepath = self._path(name)
+            if entry is None or not os.path.exists(filepath):
+                raise FileNotFoundError(f"Backup file not found: {name}")
+            if entry.get('sha256') and file_sha256(filepath) != entry['sha256']:
+                raise ValueError(f"Checksum mismatch for backup file: {name}")
+
+    def _pipe_into_mysql(self, filepath, db_name=None):
+        """边解压边写入 mysql 客户端的标准输入"""
+        # 注意：mysql 客户端需要在系统环境变量中
+        command = self._client_args('mysql') + [db_name or self.config['MYSQL_DB']]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            with open_backup(filepath, 'rb') as f:
+                shutil.copyfileobj(f, process.stdin, CHUNK_SIZE)
+        finally:
+            process.stdin.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command[0])
+
+    def restore(self, filename, until=None):
+        """校验后按 restore_chain 的顺序把文件依次导入 mysql，返回回放的文件列表"""
+        chain = self.restore_chain(filename, until)
+        self.verify(chain)
+        for name in chain:
+            self._pipe_into_mysql(self._path(name))
+
+        self.clear_state()
+        return chain
+
+    def dry_run_restore(self, filename, until=None):
+        """
+        把备份还原到临时库 <db>_restore_check 中，比对各表行数后删除临时库，
+        用来证明备份可用，不触碰生产库。返回检查报告。
+        """
+        chain = self.restore_chain(filename, until)
+        self.verify(chain)
+
+        scratch_db = f"{self.config['MYSQL_DB']}_restore_check"
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{scratch_db}`")
+            cursor.execute(f"CREATE DATABASE `{scratch_db}`")
+            try:
+                for name in chain:
+                    self._pipe_into_mysql(self._path(name), scratch_db)
+
+                cursor.execute(
+                    "SELECT table_name FROM information_schema.tables "
+                    "WHERE table_schema = %s AND table_type = 'BASE TABLE'",
+                    (scratch_db,)
+                )
+                tables = [row[0] for row in cursor.fetchall()]
+                restored_counts = {}
+                for table in tables:
+                    cursor.execute(f"SELECT COUNT(*) FROM `{scratch_db}`.`{table}`")
+                    restored_counts[table] = cursor.fetchone()[0]
+            finally:
+                cursor.execute(f"DROP DATABASE IF EXISTS `{scratch_db}`")
+            cursor.close()
+        finally:
+            connection.close()
+
+        # 只有单个全量备份能与清单中的行数逐表比对
+        expected = self.manifest_entry(chain[0]).get('row_counts') if len(chain) == 1 else None
+        mismatches = {}
+        if expected:
+            for table, count in expected.items():
+                if restored_counts.get(table) != count:
+                    mismatches[table] = {'expected': count, 'restored': restored_counts.get(table)}
+        return {
+            'chain': chain,
+            'row_counts': restored_counts,
+            'mismatches': mismatches,
+            'ok': not mismatches,
+        }
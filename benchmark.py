@@ -0,0 +1,439 @@
+"""
+借阅热点路径的基准测试。
+
+对一个正在运行的应用（建议使用单独的测试库，并把 BACKUP_WINDOW 调大以免备份干扰结果）
+发起并发 HTTP 请求，场景包括：
+
+    login        大量用户和管理员同时登录（user_login / admin_login）
+    hot_borrow   许多用户同时借阅同一本库存很少的书，统计成功数和超卖数
+    browse       用户翻阅 borrow_books 的各个分页和检索
+    admin        管理员翻阅图书、用户、借阅记录管理页面
+
+压测前按 --books / --users 在 Config 指定的数据库中生成带 bench 前缀的图书和用户
+（已存在时复用，--reseed 重新生成）。每个场景报告吞吐量、p50/p95/p99 延迟和错误数，
+结果写入 JSON 文件，附带当前 git 提交，便于比较两次提交：
+
+    python benchmark.py run --url http://127.0.0.1:5000 --books 100000 --users 2000 -o before.json
+    python benchmark.py compare before.json after.json
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import urllib.parse
+import urllib.request
+import http.cookiejar
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from config import Config
+from hash_util import generate_hash
+
+SCENARIOS = ('login', 'hot_borrow', 'browse', 'admin')
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_ADMIN = 'bench_admin'
+BENCH_USER_PREFIX = 'bench_user_'
+BENCH_BOOK_PREFIX = '基准测试图书 '
+HOT_BOOK_TITLE = '基准测试热门图书'
+SEED_CHUNK_SIZE = 5000
+
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数，输入需已排序"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, duration, **extra):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    result = {
+        'requests': count,
+        'errors': errors,
+        'duration': round(duration, 3),
+        'throughput': round(count / duration, 2) if duration > 0 else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / count * 1000, 3) if count else None,
+            'p50': round(percentile(latencies, 50) * 1000, 3) if count else None,
+            'p95': round(percentile(latencies, 95) * 1000, 3) if count else None,
+            'p99': round(percentile(latencies, 99) * 1000, 3) if count else None,
+            'max': round(latencies[-1] * 1000, 3) if count else None,
+        },
+    }
+    result.update(extra)
+    return result
+
+
+class Client:
+    """带独立 cookie 的 HTTP 客户端，一个客户端对应一个会话"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, json_body=None, form=None, params=None):
+        """返回 (状态码, 响应体, 耗时秒数)；网络错误时状态码为 None"""
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        data, headers = None, {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self._opener.open(req, timeout=self.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        except (urllib.error.URLError, OSError):
+            body, status = b'', None
+        return status, body, time.perf_counter() - start
+
+    def login(self, path, username):
+        status, body, _ = self.request('POST', path,
+                                       json_body={'username': username, 'password': BENCH_PASSWORD})
+        if status not in (200, 201):
+            raise RuntimeError(f"登录失败 {username}: {status} {body[:200]!r}")
+
+
+def run_concurrently(tasks, concurrency):
+    """并发执行返回 (状态码, 耗时, 是否成功) 的任务，返回延迟列表、错误数、总耗时和全部结果"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda task: task(), tasks))
+    duration = time.perf_counter() - start
+    latencies = [seconds for _, seconds, _ in results]
+    errors = sum(1 for _, _, ok in results if not ok)
+    return latencies, errors, duration, results
+
+
+def connect():
+    return mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB
+    )
+
+
+def _insert_chunked(cursor, connection, sql, rows):
+    for i in range(0, len(rows), SEED_CHUNK_SIZE):
+        cursor.executemany(sql, rows[i:i + SEED_CHUNK_SIZE])
+        connection.commit()
+
+
+def seed(books, users, reseed=False, seed_value=0):
+    """生成基准数据，返回 {'book_ids': [...], 'usernames': [...]}"""
+    rng = random.Random(seed_value)
+    password_hash = generate_hash(BENCH_PASSWORD)
+    connection = connect()
+    cursor = connection.cursor()
+    try:
+        if reseed:
+            # 删除触发器检查借出数计数列，先像 reset_hot_book 一样清掉基准用户的借阅记录和计数，
+            # 热门图书的分片先合并回 books，分片上的借出增量计入计数列后一并扣减
+            cursor.execute("SELECT id FROM books WHERE title = %s", (HOT_BOOK_TITLE,))
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.callproc('split_book_inventory', (row[0], 0, None))
+            cursor.execute("""
+                UPDATE books b
+                JOIN (SELECT r.book_id, COUNT(*) AS n FROM borrow_records r JOIN users u ON u.id = r.user_id
+                      WHERE u.username LIKE %s GROUP BY r.book_id) x ON x.book_id = b.id
+                SET b.active_borrow_count = b.active_borrow_count - x.n
+            """, (BENCH_USER_PREFIX + '%',))
+            cursor.execute("DELETE r FROM borrow_records r JOIN users u ON u.id = r.user_id WHERE u.username LIKE %s",
+                           (BENCH_USER_PREFIX + '%',))
+            cursor.execute("INSERT INTO circulation_counters (name, shard, value) VALUES ('active_loans', 0, %s) AS new "
+                           "ON DUPLICATE KEY UPDATE value = value + new.value", (-cursor.rowcount,))
+            cursor.execute("UPDATE users SET active_borrow_count = 0 WHERE username LIKE %s", (BENCH_USER_PREFIX + '%',))
+            # 其余借阅记录随用户、图书级联删除
+            cursor.execute("DELETE FROM users WHERE username LIKE %s", (BENCH_USER_PREFIX + '%',))
+            cursor.execute("DELETE FROM books WHERE title LIKE %s OR title = %s",
+                           (BENCH_BOOK_PREFIX + '%', HOT_BOOK_TITLE))
+            connection.commit()
+
+        cursor.execute("INSERT IGNORE INTO admins (username, password_hash) VALUES (%s, %s)",
+                       (BENCH_ADMIN, password_hash))
+
+        cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE %s", (BENCH_USER_PREFIX + '%',))
+        existing = cursor.fetchone()[0]
+        _insert_chunked(cursor, connection,
+                        "INSERT IGNORE INTO users (username, password_hash) VALUES (%s, %s)",
+                        [(f"{BENCH_USER_PREFIX}{i}", password_hash) for i in range(existing, users)])
+
+        cursor.execute("SELECT COUNT(*) FROM books WHERE title LIKE %s", (BENCH_BOOK_PREFIX + '%',))
+        existing = cursor.fetchone()[0]
+        _insert_chunked(cursor, connection,
+                        "INSERT INTO books (title, quantity) VALUES (%s, %s)",
+                        [(f"{BENCH_BOOK_PREFIX}{i}", rng.randint(1, 20)) for i in range(existing, books)])
+
+        cursor.execute("SELECT id FROM books WHERE title = %s", (HOT_BOOK_TITLE,))
+        if cursor.fetchone() is None:
+            cursor.execute("INSERT INTO books (title, quantity) VALUES (%s, 0)", (HOT_BOOK_TITLE,))
+        connection.commit()
+
+        cursor.execute("SELECT id FROM books WHERE title LIKE %s ORDER BY id", (BENCH_BOOK_PREFIX + '%',))
+        book_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        connection.close()
+    return {'book_ids': book_ids, 'usernames': [f"{BENCH_USER_PREFIX}{i}" for i in range(users)]}
+
+
+def reset_hot_book(quantity, slots=0):
+    """清空热门图书的借阅记录，把库存设为 quantity 并拆分为 slots 个分片，返回图书 id"""
+    connection = connect()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM books WHERE title = %s", (HOT_BOOK_TITLE,))
+        book_id = cursor.fetchone()[0]
+        # 直接删除借阅记录时同时扣减借出数计数列（每个用户至多借一本）和统计中的在借总数
+        cursor.execute("UPDATE users u JOIN borrow_records r ON r.user_id = u.id "
+                       "SET u.active_borrow_count = u.active_borrow_count - 1 WHERE r.book_id = %s", (book_id,))
+        cursor.execute("DELETE FROM borrow_records WHERE book_id = %s", (book_id,))
+        cursor.execute("INSERT INTO circulation_counters (name, shard, value) VALUES ('active_loans', 0, %s) AS new "
+                       "ON DUPLICATE KEY UPDATE value = value + new.value", (-cursor.rowcount,))
+        cursor.callproc('split_book_inventory', (book_id, slots, quantity))
+        cursor.execute("UPDATE books SET active_borrow_count = 0 WHERE id = %s", (book_id,))
+        connection.commit()
+        return book_id
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def hot_book_state(book_id):
+    """(借阅记录数, 剩余库存)"""
+    connection = connect()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM borrow_records WHERE book_id = %s", (book_id,))
+        borrowed = cursor.fetchone()[0]
+        # 拆分库存时以各分片之和为准
+        cursor.execute(
+            "SELECT COALESCE((SELECT SUM(quantity) FROM book_inventory_slots WHERE book_id = %s), quantity) "
+            "FROM books WHERE id = %s", (book_id, book_id))
+        quantity = cursor.fetchone()[0]
+        return borrowed, quantity
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def _get_task(client, path, params=None):
+    def task():
+        status, _, seconds = client.request('GET', path, params=params)
+        return status, seconds, status == 200
+    return task
+
+
+def scenario_login(args, data, rng):
+    def user_task(username):
+        def task():
+            status, _, seconds = Client(args.url).request(
+                'POST', '/api/user_login', json_body={'username': username, 'password': BENCH_PASSWORD})
+            return status, seconds, status == 200
+        return task
+
+    def admin_task():
+        status, _, seconds = Client(args.url).request(
+            'POST', '/api/admin_login', json_body={'username': BENCH_ADMIN, 'password': BENCH_PASSWORD})
+        return status, seconds, status == 200
+
+    # 每 10 次登录中有一次是管理员
+    tasks = [admin_task if i % 10 == 0 else user_task(rng.choice(data['usernames']))
+             for i in range(args.requests)]
+    latencies, errors, duration, _ = run_concurrently(tasks, args.concurrency)
+    return summarize(latencies, errors, duration)
+
+
+def scenario_hot_borrow(args, data, rng):
+    book_id = reset_hot_book(args.hot_quantity, args.hot_slots)
+    usernames = rng.sample(data['usernames'], min(args.requests, len(data['usernames'])))
+    # 登录不计入本场景的延迟
+    clients = []
+    for username in usernames:
+        client = Client(args.url)
+        client.login('/api/user_login', username)
+        clients.append(client)
+
+    def borrow_task(client):
+        def task():
+            status, body, seconds = client.request('POST', '/user/borrow', form={'book_id': book_id})
+            try:
+                borrowed = status == 200 and json.loads(body).get('success') is True
+            except ValueError:
+                borrowed = False
+            # 库存不足是预期结果，只有 HTTP 错误算作错误
+            return borrowed, seconds, status == 200
+        return task
+
+    latencies, errors, duration, results = run_concurrently(
+        [borrow_task(client) for client in clients], args.concurrency)
+    successes = sum(1 for borrowed, _, _ in results if borrowed is True)
+    records, quantity = hot_book_state(book_id)
+    oversold = max(0, records - args.hot_quantity) + max(0, -quantity)
+    return summarize(latencies, errors, duration,
+                     hot_quantity=args.hot_quantity, hot_slots=args.hot_slots, successes=successes,
+                     borrow_records=records, remaining_quantity=quantity, oversold=oversold)
+
+
+def scenario_browse(args, data, rng):
+    clients = []
+    for username in rng.sample(data['usernames'], min(args.concurrency, len(data['usernames']))):
+        client = Client(args.url)
+        client.login('/api/user_login', username)
+        clients.append(client)
+
+    book_ids = data['book_ids']
+    tasks = []
+    for i in range(args.requests):
+        client = clients[i % len(clients)]
+        kind = rng.random()
+        if kind < 0.3 or not book_ids:
+            params = None
+        elif kind < 0.8:
+            params = {'after': rng.choice(book_ids)}
+        else:
+            params = {'q': f"{BENCH_BOOK_PREFIX.strip()} {rng.randint(0, max(len(book_ids) - 1, 0))}"}
+        tasks.append(_get_task(client, '/user/borrow_books', params))
+    latencies, errors, duration, _ = run_concurrently(tasks, args.concurrency)
+    return summarize(latencies, errors, duration)
+
+
+def scenario_admin(args, data, rng):
+    clients = []
+    for _ in range(args.concurrency):
+        client = Client(args.url)
+        client.login('/api/admin_login', BENCH_ADMIN)
+        clients.append(client)
+
+    book_ids = data['book_ids'] or [0]
+    pages = ('/admin/manage_books', '/admin/manage_users', '/admin/manage_borrow_records')
+    tasks = []
+    for i in range(args.requests):
+        path = pages[i % len(pages)]
+        params = {'after': rng.choice(book_ids)} if path == '/admin/manage_books' and rng.random() < 0.7 else None
+        tasks.append(_get_task(clients[i % len(clients)], path, params))
+    latencies, errors, duration, _ = run_concurrently(tasks, args.concurrency)
+    return summarize(latencies, errors, duration)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    data = seed(args.books, args.users, reseed=args.reseed, seed_value=args.seed)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'url': args.url,
+            'books': args.books,
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'hot_slots': args.hot_slots,
+            'seed': args.seed,
+            'python': platform.python_version(),
+        },
+        'scenarios': {},
+    }
+    handlers = {
+        'login': scenario_login,
+        'hot_borrow': scenario_hot_borrow,
+        'browse': scenario_browse,
+        'admin': scenario_admin,
+    }
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name} ...", file=sys.stderr)
+        results['scenarios'][name] = handlers[name](args, data, rng)
+        summary = results['scenarios'][name]
+        print(f"  {summary['throughput']} req/s, p95 {summary['latency_ms']['p95']} ms, "
+              f"errors {summary['errors']}", file=sys.stderr)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    oversold = results['scenarios'].get('hot_borrow', {}).get('oversold', 0)
+    return 1 if oversold else 0
+
+
+def compare(old_path, new_path):
+    """逐场景比较两次结果的吞吐量和延迟"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for name, after in new['scenarios'].items():
+        before = old['scenarios'].get(name)
+        if before is None:
+            continue
+        print(name)
+        metrics = [('throughput', before['throughput'], after['throughput'])]
+        metrics += [(key, before['latency_ms'][key], after['latency_ms'][key]) for key in ('p50', 'p95', 'p99')]
+        metrics += [('errors', before['errors'], after['errors'])]
+        if 'oversold' in after:
+            metrics.append(('oversold', before.get('oversold'), after['oversold']))
+        for key, a, b in metrics:
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ''
+            print(f"  {key:<10} {a!s:>12} -> {b!s:<12} {change}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='借阅热点路径基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='执行基准测试')
+    run_parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                            help=f"要执行的场景，默认全部：{', '.join(SCENARIOS)}")
+    run_parser.add_argument('--url', default='http://127.0.0.1:5000')
+    run_parser.add_argument('--books', type=int, default=10000, help='基准图书数量')
+    run_parser.add_argument('--users', type=int, default=1000, help='基准用户数量')
+    run_parser.add_argument('--concurrency', type=int, default=20)
+    run_parser.add_argument('--requests', type=int, default=500, help='每个场景的请求数')
+    run_parser.add_argument('--hot-quantity', type=int, default=5, help='热门图书的初始库存')
+    run_parser.add_argument('--hot-slots', type=int, default=0, help='热门图书的库存分片数，0 表示不拆分')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--reseed', action='store_true', help='删除并重新生成基准数据')
+    run_parser.add_argument('-o', '--output', help='结果 JSON 文件，默认输出到标准输出')
+
+    compare_parser = subparsers.add_parser('compare', help='比较两次结果')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    unknown = set(getattr(args, 'scenarios', None) or ()) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+    if args.command == 'compare':
+        compare(args.old, args.new)
+    else:
+        sys.exit(run(args))
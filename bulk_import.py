@@ -0,0 +1,250 @@
+"""
+批量导入图书。
+
+输入为 CSV（表头 title,quantity[,image]）、NDJSON（每行一个对象）或 JSON 数组，
+逐行读取并校验，按 chunk_size 分块：每块在一个事务中用 executemany 插入新书、
+更新已有书名的库存，然后提交。校验失败的行记录行号和原因后跳过，
+某一块写入失败时整块回滚，该块中的行全部记为失败，其余块不受影响。
+
+image 列为 static 目录下已有图片的文件名。书名比较忽略大小写和首尾空白，
+与 MySQL 默认排序规则一致；库中同名的多本书只更新 id 最小的一本。
+
+    python bulk_import.py books.csv [--format csv|ndjson|json] [--chunk-size 1000] [--add-quantity]
+"""
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+
+from circulation import set_split_quantity, split_books
+
+TITLE_MAX_LENGTH = 255
+FORMATS = ('csv', 'ndjson', 'json')
+
+
+def detect_format(filename, default='csv'):
+    """按扩展名判断输入格式"""
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if ext == 'jsonl':
+        return 'ndjson'
+    return ext if ext in FORMATS else default
+
+
+def iter_records(stream, fmt):
+    """从二进制流中逐条读取 (行号, 记录)；记录无法解析时产出 (行号, ValueError)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f"invalid JSON: {e}")
+    elif fmt == 'json':
+        # JSON 数组无法逐行解析，整体读入；大文件建议使用 NDJSON
+        records = json.load(text)
+        if not isinstance(records, list):
+            raise ValueError("JSON input must be an array of objects")
+        for index, record in enumerate(records, start=1):
+            yield index, record
+    else:
+        raise ValueError(f"unknown import format: {fmt}")
+
+
+def validate_record(record, image_dir=None):
+    """校验一条记录，返回 (title, quantity, image_filename)，不合法时抛出 ValueError"""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+
+    title = str(record.get('title') or '').strip()
+    if not title:
+        raise ValueError("title is required")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise ValueError(f"title is longer than {TITLE_MAX_LENGTH} characters")
+
+    try:
+        quantity = int(str(record.get('quantity', '')).strip())
+    except ValueError:
+        raise ValueError("quantity must be an integer")
+    if quantity < 0:
+        raise ValueError("quantity must not be negative")
+
+    image = str(record.get('image') or '').strip() or None
+    if image:
+        if os.path.basename(image) != image or image.startswith('.'):
+            raise ValueError("image must be a plain file name")
+        if image_dir and not os.path.exists(os.path.join(image_dir, image)):
+            raise ValueError(f"image {image} does not exist")
+    return title, quantity, image
+
+
+def title_key(title):
+    return title.strip().casefold()
+
+
+def _write_chunk(connection, chunk, add_quantity):
+    """在一个事务中写入一块已校验的行，返回 (inserted, updated)"""
+    # 块内同名的行合并：累加模式下数量相加，否则以最后一行为准
+    merged = {}
+    for title, quantity, image in chunk:
+        key = title_key(title)
+        if key in merged:
+            _, old_quantity, old_image = merged[key]
+            if add_quantity:
+                quantity += old_quantity
+            image = image or old_image
+        merged[key] = (title, quantity, image)
+
+    cursor = connection.cursor()
+    try:
+        titles = [title for title, _, _ in merged.values()]
+        placeholders = ', '.join(['%s'] * len(titles))
+
+        # 已拆分库存的图书：books.quantity 只是分片之和的镜像，可能落后于实际库存，
+        # 新的数量以各分片之和为基准。与借书一样先按 id 升序锁分片，再锁图书行
+        cursor.execute(f"SELECT id, title FROM books WHERE title IN ({placeholders})", titles)
+        quantity_by_id = {}
+        for book_id, title in cursor.fetchall():
+            if title_key(title) in merged:
+                quantity_by_id.setdefault(book_id, merged[title_key(title)][1])
+        split_quantities = {}
+        for book_id in sorted(split_books(cursor, list(quantity_by_id))):
+            cursor.execute("SELECT SUM(quantity) FROM book_inventory_slots WHERE book_id = %s FOR UPDATE",
+                           (book_id,))
+            total = cursor.fetchone()[0]
+            if total is not None:
+                quantity = quantity_by_id[book_id]
+                split_quantities[book_id] = int(total) + quantity if add_quantity else quantity
+        set_split_quantity(cursor, list(split_quantities), split_quantities)
+
+        cursor.execute(
+            f"SELECT id, title FROM books WHERE title IN ({placeholders}) ORDER BY id FOR UPDATE",
+            titles
+        )
+        existing = {}
+        for book_id, title in cursor.fetchall():
+            existing.setdefault(title_key(title), book_id)
+
+        inserts, updates, image_updates = [], [], []
+        updated = 0
+        for key, (title, quantity, image) in merged.items():
+            book_id = existing.get(key)
+            if book_id is None:
+                inserts.append((title, quantity, image))
+                continue
+            updated += 1
+            # 拆分库存的图书已由 split_book_inventory 写回 books.quantity
+            if book_id not in split_quantities:
+                updates.append((quantity, book_id))
+            if image:
+                image_updates.append((image, book_id))
+
+        if inserts:
+            cursor.executemany(
+                "INSERT INTO books (title, quantity, image_filename) VALUES (%s, %s, %s)", inserts)
+        if updates:
+            quantity_sql = "quantity + %s" if add_quantity else "%s"
+            cursor.executemany(f"UPDATE books SET quantity = {quantity_sql} WHERE id = %s", updates)
+        if image_updates:
+            cursor.executemany("UPDATE books SET image_filename = %s WHERE id = %s", image_updates)
+        connection.commit()
+        return len(inserts), updated
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_books(connection, records, chunk_size=1000, add_quantity=False, image_dir=None):
+    """
+    导入 iter_records() 产出的记录，返回导入报告：
+    {'rows', 'inserted', 'updated', 'failed', 'errors': [{'line', 'title', 'error'}]}
+    add_quantity 为 True 时把数量累加到已有书名上，否则直接覆盖库存。
+    输入流读取失败时不抛出异常，停止读取并在报告中记录，已写入的块保持提交。
+    """
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    chunk, chunk_lines = [], []
+
+    def flush():
+        try:
+            inserted, updated = _write_chunk(connection, chunk, add_quantity)
+            report['inserted'] += inserted
+            report['updated'] += updated
+        except Exception as e:
+            for line_no, (title, _, _) in zip(chunk_lines, chunk):
+                report['errors'].append({'line': line_no, 'title': title, 'error': f"write failed: {e}"})
+            report['failed'] += len(chunk)
+        chunk.clear()
+        chunk_lines.clear()
+
+    records = iter(records)
+    last_line = 0
+    while True:
+        try:
+            line_no, record = next(records)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            # 输入流中途无法读取（编码错误、CSV 格式错误等）：之前的块已经提交，
+            # 写入已读到的行后停止，错误记录在报告中
+            report['errors'].append({'line': last_line + 1, 'title': None,
+                                     'error': f"read failed after line {last_line}: {e}"})
+            report['failed'] += 1
+            break
+        last_line = line_no
+        report['rows'] += 1
+        try:
+            row = validate_record(record, image_dir)
+        except ValueError as e:
+            title = record.get('title') if isinstance(record, dict) else None
+            report['errors'].append({'line': line_no, 'title': title, 'error': str(e)})
+            report['failed'] += 1
+            continue
+        chunk.append(row)
+        chunk_lines.append(line_no)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量导入图书')
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--add-quantity', action='store_true', help='累加已有书名的库存而不是覆盖')
+    args = parser.parse_args()
+
+    # 复用应用的连接池、缓存和备份，导入完成后只备份一次
+    from app import app, get_db_connection, backup_database, catalog_cache
+
+    connection = get_db_connection()
+    try:
+        with open(args.file, 'rb') as f:
+            report = import_books(
+                connection,
+                iter_records(f, args.format or detect_format(args.file)),
+                chunk_size=args.chunk_size,
+                add_quantity=args.add_quantity,
+                image_dir=os.path.join(app.root_path, 'static')
+            )
+    finally:
+        connection.close()
+
+    if report['inserted'] or report['updated']:
+        catalog_cache.invalidate_books()
+        backup_database()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(1 if report['failed'] else 0)
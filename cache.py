@@ -0,0 +1,259 @@
+"""
+图书目录的读穿透缓存。
+
+缓存项按命名空间组织：'books' 覆盖所有图书行（列表页、筛选、检索结果），
+'user:<id>' 覆盖某个用户的借阅集合。每个命名空间有一个版本号，缓存键中带上
+所依赖命名空间的当前版本；写操作提交后只需递增相关命名空间的版本，旧缓存项
+就不会再被读到，随后由 LRU / TTL 自然淘汰。全局命名空间 'db' 在还原数据库
+后递增，使所有缓存一起失效。
+
+借还书只改变库存，不递增全局的 'books' 版本：只失效借阅者的 'user:<id>'，
+显示或按库存筛选的缓存项以较短的 ttl 写入（CACHE_STOCK_TTL），其他用户最多看到这么久之前的库存。
+
+后端：
+    RedisBackend   多个 worker 共享的 Redis，需要安装 redis 包（CACHE_BACKEND = 'auto' 时优先使用）
+    MemoryBackend  进程内 LRU + TTL，失效只作用于当前进程，只适合单进程部署
+    NullBackend    关闭缓存
+
+RedisBackend 的调用会阻塞，异步模式下经 CatalogCache.offload() 放到线程池中执行，不阻塞事件循环。
+"""
+import json
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # 未安装时只能使用进程内缓存
+    redis = None
+
+
+class MemoryBackend:
+    """进程内 LRU 缓存，每项带过期时间"""
+
+    # 只在内存中操作，异步模式下可以直接调用
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def incr(self, key):
+        # 版本号单独保存，不过期也不参与 LRU 淘汰，否则旧缓存项可能重新可见
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        return {
+            'backend': 'memory',
+            'size': size,
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class RedisBackend:
+    """Redis 共享缓存，值以 JSON 保存，淘汰由 Redis 的 TTL 和 maxmemory 策略负责"""
+
+    # 每次调用都是一次网络往返
+    blocking = True
+
+    def __init__(self, url, ttl=300, prefix='book_management:'):
+        if redis is None:
+            raise RuntimeError("redis cache backend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=ttl or None)
+
+    def version(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def stats(self):
+        info = self.client.info('stats')
+        return {
+            'backend': 'redis',
+            'evictions': info.get('evicted_keys'),
+            'expirations': info.get('expired_keys'),
+        }
+
+
+class NullBackend:
+    """不缓存任何内容"""
+
+    blocking = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def version(self, key):
+        return 0
+
+    def incr(self, key):
+        return 0
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+def create_backend(config):
+    """
+    根据 CACHE_BACKEND 配置创建缓存后端。
+    auto：能连上 CACHE_REDIS_URL 时使用 Redis，否则退回进程内缓存并给出警告。
+    """
+    kind = config.get('CACHE_BACKEND', 'auto')
+    if kind == 'auto':
+        if redis is not None:
+            try:
+                backend = RedisBackend(config['CACHE_REDIS_URL'], config.get('CACHE_TTL', 300))
+                backend.client.ping()
+                return backend
+            except redis.RedisError as e:
+                print(f"Warning: redis cache unavailable ({e})")
+        print("Warning: using the per-process memory cache; with several workers, "
+              "invalidations are not shared and pages may be stale for up to CACHE_TTL seconds")
+        kind = 'memory'
+    if kind == 'memory':
+        return MemoryBackend(config.get('CACHE_MAX_ENTRIES', 10000), config.get('CACHE_TTL', 300))
+    if kind == 'redis':
+        return RedisBackend(config['CACHE_REDIS_URL'], config.get('CACHE_TTL', 300))
+    if kind == 'none':
+        return NullBackend()
+    raise ValueError(f"unknown cache backend: {kind}")
+
+
+class CatalogCache:
+    """
+    带命名空间版本号的读穿透缓存。
+    load_ttl() 在每次加载后调用，返回该项的过期秒数（None 使用后端默认值），
+    用于缩短从只读副本读到的、可能落后于主库的结果的缓存时间。
+    """
+
+    def __init__(self, backend, load_ttl=None):
+        self.backend = backend
+        self.load_ttl = load_ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _version(self, namespace):
+        return self.backend.version('version:' + namespace)
+
+    def get_or_load(self, namespaces, key, loader, ttl=None):
+        """
+        读取依赖 namespaces 的缓存项 key，未命中时调用 loader() 加载并写入缓存。
+        loader 的返回值需要能被 JSON 序列化，以便共享后端使用。
+        ttl 为该项的最长过期秒数（如依赖库存的页面），None 使用后端默认值。
+        """
+        full_key, value = self._lookup(namespaces, key)
+        if value is None:
+            value = loader()
+            self.backend.set(full_key, value, self._ttl(ttl))
+        return value
+
+    async def get_or_load_async(self, namespaces, key, loader, ttl=None):
+        """异步模式下的 get_or_load，loader 为返回协程的函数"""
+        full_key, value = await self.offload(self._lookup, namespaces, key)
+        if value is None:
+            value = await loader()
+            await self.offload(self.backend.set, full_key, value, self._ttl(ttl))
+        return value
+
+    async def offload(self, func, *args):
+        """异步模式下调用可能访问后端的函数：后端会阻塞时放到线程池中执行"""
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _ttl(self, ttl=None):
+        ttls = [t for t in (ttl, self.load_ttl() if self.load_ttl is not None else None) if t is not None]
+        return min(ttls) if ttls else None
+
+    def _lookup(self, namespaces, key):
+        versions = ','.join(f"{ns}={self._version(ns)}" for ns in ('db',) + tuple(namespaces))
+        full_key = f"{key}|{versions}"
+        value = self.backend.get(full_key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return full_key, value
+
+    def invalidate(self, *namespaces):
+        """在写操作提交后调用，使依赖这些命名空间的缓存项全部失效"""
+        for namespace in namespaces:
+            self.backend.incr('version:' + namespace)
+        with self._lock:
+            self.invalidations += len(namespaces)
+
+    def invalidate_books(self):
+        self.invalidate('books')
+
+    def invalidate_user(self, user_id):
+        self.invalidate(f'user:{user_id}')
+
+    def invalidate_all(self):
+        self.invalidate('db')
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,102 @@
+"""
+面向读者的图书目录查询。
+
+"某用户可借阅的图书" 原先通过 available_books_per_user_view（users CROSS JOIN books）
+查询，MySQL 无法把 user_id 条件下推进视图，代价随 用户数 × 图书数 增长。
+这里改为以 books 主键为序、对 borrow_records(user_id, book_id) 做反连接，
+配合游标分页，每页只读取 page_size 行附近的数据，与用户总数无关。
+按书名检索时改用 search 模块的全文索引，同样叠加反连接条件。
+
+    python catalog.py explain [user_id]   输出执行计划并检查索引使用情况
+"""
+import sys
+import json
+
+from pagination import keyset_page
+from search import boolean_query, search_page
+
+AVAILABLE_BOOKS_SELECT = """
+    SELECT b.id AS book_id, b.title, b.image_filename, b.quantity
+    FROM books b
+"""
+
+# 反连接：借阅记录通过 idx_borrow_records_user_book 按 (user_id, book_id) 直接定位
+NOT_BORROWED_BY_USER = """
+    NOT EXISTS (
+        SELECT 1 FROM borrow_records br
+        WHERE br.user_id = %s AND br.book_id = b.id
+    )
+"""
+
+
+def escape_like(text):
+    """转义 LIKE 中的通配符"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def available_books_query(user_id):
+    """返回可借阅图书查询的 (select_sql, conditions, params)"""
+    return AVAILABLE_BOOKS_SELECT, ["b.quantity > 0", NOT_BORROWED_BY_USER], [user_id]
+
+
+def available_books_page(cursor, user_id, after=None, before=None, page_size=20):
+    """查询用户可借阅的图书（未借过且有库存），按图书 id 游标分页"""
+    select_sql, conditions, params = available_books_query(user_id)
+    return keyset_page(cursor, select_sql, conditions, params, 'b.id', 'book_id',
+                       after=after, before=before, page_size=page_size)
+
+
+def search_available_books(cursor, user_id, text, offset=0, page_size=20):
+    """按书名全文检索用户可借阅的图书，按相关度分页；输入没有有效词时返回 None"""
+    query = boolean_query(text)
+    if query is None:
+        return None
+    select_sql, conditions, params = available_books_query(user_id)
+    return search_page(cursor, select_sql, conditions, params, query, offset, page_size)
+
+
+def explain_available_books(cursor, user_id, page_size=20):
+    """
+    对可借阅图书查询执行 EXPLAIN，返回 (计划行, 问题列表)。
+    要求 books 走主键范围扫描，borrow_records 走 (user_id, book_id) 索引，
+    两者都不能是全表扫描。
+    """
+    select_sql, conditions, params = available_books_query(user_id)
+    query = (select_sql + " WHERE " + " AND ".join(conditions)
+             + " ORDER BY b.id LIMIT %s")
+    cursor.execute("EXPLAIN " + query, params + [page_size + 1])
+    columns = [d[0] for d in cursor.description]
+    plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    problems = []
+    for row in plan:
+        if row.get('type') == 'ALL':
+            problems.append(f"full table scan on {row.get('table')}")
+        if row.get('table') == 'br' and row.get('key') not in (
+                'idx_borrow_records_user_book', 'idx_borrow_records_user_id', 'idx_borrow_user_time'):
+            problems.append(f"borrow_records does not use a user_id index (key={row.get('key')})")
+    return plan, problems
+
+
+if __name__ == '__main__':
+    import mysql.connector
+    from config import Config
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'explain':
+        print(__doc__)
+        sys.exit(1)
+
+    user_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    connection = mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB
+    )
+    cursor = connection.cursor()
+    plan, problems = explain_available_books(cursor, user_id)
+    print(json.dumps({'plan': plan, 'problems': problems},
+                     ensure_ascii=False, indent=2, default=str))
+    cursor.close()
+    connection.close()
+    sys.exit(1 if problems else 0)
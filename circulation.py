@@ -0,0 +1,439 @@
+"""
+批量借书 / 还书。
+
+一批图书 id 通过一次 CALL 交给存储过程 borrow_books_batch / return_books_batch，
+在同一个事务中按 id 升序逐本处理，返回每本书的结果；单本借还也走这里。
+
+热门图书的处理：
+- 死锁（1213）和锁等待超时（1205）时整个事务回滚，按 RetryPolicy 退避加随机抖动后重试，
+  重试次数用尽后每本书返回 BUSY_MESSAGE，而不是把数据库错误原样交给用户；
+- 最近一次借阅已返回"库存不足"的图书记入 SoldOutCache，短时间内的借阅直接失败，不访问数据库；
+- 可以把一本书的库存拆分到 book_inventory_slots 的多行中（split_inventory），借书时用
+  SKIP LOCKED 锁定任一有余量的行，并发借阅不再排队等待同一行。此时 books.quantity
+  只是各行之和的镜像，由 sync_split_inventory 定期回写。
+
+users / books 的 active_borrow_count 由存储过程在借还时同步维护，删除前的检查和管理页面直接读取；
+拆分库存的图书借还时不锁 books 行，增量记在分片的 borrow_delta 上（见 active_borrows_sql）。
+计数与 borrow_records 不一致时（如还原备份后）由 reconcile_borrow_counts 检查并修复。
+
+每次成功借还由存储过程写入 loan_events（见 loan_history.py），管理员代办时传入 admin=True。
+"""
+import json
+import time
+import asyncio
+import random
+import threading
+
+import mysql.connector
+
+# 可以重试的 MySQL 错误码
+RETRYABLE_ERRORS = {1213: 'deadlock', 1205: 'lock_wait_timeout'}
+
+BUSY_MESSAGE = '借阅人数过多，请稍后重试'
+SOLD_OUT_MESSAGE = '图书库存不足，无法借阅'
+
+
+class BatchError(ValueError):
+    """批量请求的参数不合法"""
+
+
+def parse_book_ids(values, max_items):
+    """把请求中的图书 id 列表转换成去重后的整数列表，不合法时抛出 BatchError"""
+    if not isinstance(values, list) or not values:
+        raise BatchError("book_ids 必须是非空数组")
+    try:
+        book_ids = sorted({int(value) for value in values})
+    except (TypeError, ValueError):
+        raise BatchError("book_ids 只能包含整数")
+    if len(book_ids) > max_items:
+        raise BatchError(f"一次最多处理 {max_items} 本图书")
+    return book_ids
+
+
+class RetryPolicy:
+    """
+    死锁 / 锁等待超时的重试策略：最多重试 attempts 次，第 n 次重试前等待
+    [0, min(max_delay, base_delay * 2 ** n)) 之间的随机时间，避免冲突的事务同时重试。
+    on_retry(procedure, reason) 和 on_give_up(procedure, reason) 用于记录指标。
+    """
+
+    def __init__(self, attempts=3, base_delay=0.02, max_delay=0.5, on_retry=None, on_give_up=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_retry = on_retry
+        self.on_give_up = on_give_up
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class SoldOutCache:
+    """记录最近确认库存为 0 的图书，ttl 秒内的借阅直接失败；还书或修改库存时清除"""
+
+    def __init__(self, ttl=2, on_fast_fail=None):
+        self.ttl = ttl
+        self.on_fast_fail = on_fast_fail
+        self._lock = threading.Lock()
+        self._expires = {}
+        self.fast_failures = 0
+
+    def mark(self, book_id):
+        with self._lock:
+            self._expires[book_id] = time.monotonic() + self.ttl
+
+    def clear(self, book_id):
+        with self._lock:
+            self._expires.pop(book_id, None)
+
+    def check(self, book_id):
+        """图书是否仍处于售罄状态；是则计入一次快速失败"""
+        with self._lock:
+            expires = self._expires.get(book_id)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._expires[book_id]
+                return False
+            self.fast_failures += 1
+        if self.on_fast_fail:
+            self.on_fast_fail()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'sold_out_books': len(self._expires), 'fast_failures': self.fast_failures}
+
+
+def _call_batch_once(connection, procedure, user_id, book_ids, admin=False):
+    cursor = connection.cursor()
+    try:
+        cursor.callproc(procedure, (user_id, json.dumps(book_ids), admin))
+        results = []
+        for result in cursor.stored_results():
+            row = result.fetchone()
+            if row:
+                results = json.loads(row[0])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    # JSON 中的布尔值在部分版本中以 0 / 1 返回
+    for item in results:
+        item['success'] = bool(item['success'])
+    return results
+
+
+def error_code(error):
+    """MySQL 错误码：mysql.connector 为 errno，PyMySQL / aiomysql 为 args[0]"""
+    errno = getattr(error, 'errno', None)
+    if errno is None and error.args and isinstance(error.args[0], int):
+        errno = error.args[0]
+    return errno
+
+
+def _should_retry(error, retry, attempt, procedure):
+    """
+    判断失败的事务是否重试：返回 True 表示应当重试，False 表示重试次数已用尽，
+    不可重试的错误直接重新抛出。
+    """
+    reason = RETRYABLE_ERRORS.get(error_code(error))
+    if reason is None or retry is None:
+        raise error
+    if attempt >= retry.attempts:
+        if retry.on_give_up:
+            retry.on_give_up(procedure, reason)
+        return False
+    if retry.on_retry:
+        retry.on_retry(procedure, reason)
+    return True
+
+
+def _busy_results(book_ids):
+    return [{'book_id': book_id, 'success': False, 'message': BUSY_MESSAGE} for book_id in book_ids]
+
+
+def _call_batch(connection, procedure, user_id, book_ids, retry=None, admin=False):
+    attempt = 0
+    while True:
+        try:
+            return _call_batch_once(connection, procedure, user_id, book_ids, admin)
+        except mysql.connector.Error as e:
+            if not _should_retry(e, retry, attempt, procedure):
+                return _busy_results(book_ids)
+            time.sleep(retry.delay(attempt))
+            attempt += 1
+
+
+def _skip_sold_out(book_ids, sold_out):
+    """把处于售罄状态的图书直接记为失败，返回 (需要交给存储过程的 id, 已有结果)"""
+    if sold_out is None:
+        return book_ids, []
+    pending, results = [], []
+    for book_id in book_ids:
+        if sold_out.check(book_id):
+            results.append({'book_id': book_id, 'success': False, 'message': SOLD_OUT_MESSAGE})
+        else:
+            pending.append(book_id)
+    return pending, results
+
+
+def _finish_borrow(results, sold_out):
+    if sold_out is not None:
+        for item in results:
+            if item['message'] == SOLD_OUT_MESSAGE:
+                sold_out.mark(item['book_id'])
+    return sorted(results, key=lambda item: item['book_id'])
+
+
+def _finish_return(results, sold_out):
+    if sold_out is not None:
+        for item in results:
+            if item['success']:
+                sold_out.clear(item['book_id'])
+    return results
+
+
+def borrow_books(connection, user_id, book_ids, retry=None, sold_out=None, admin=False):
+    """
+    在一个事务中为用户借阅多本图书，返回 [{'book_id', 'success', 'message'}]。
+    admin 为 True 时借阅历史记为管理员添加（admin_add）。
+    """
+    book_ids, results = _skip_sold_out(book_ids, sold_out)
+    if book_ids:
+        results += _call_batch(connection, 'borrow_books_batch', user_id, book_ids, retry, admin)
+    return _finish_borrow(results, sold_out)
+
+
+def return_books(connection, user_id, book_ids, retry=None, sold_out=None, admin=False):
+    """
+    在一个事务中为用户归还多本图书，返回 [{'book_id', 'success', 'message'}]。
+    admin 为 True 时借阅历史记为管理员删除（admin_remove）。
+    """
+    results = _call_batch(connection, 'return_books_batch', user_id, book_ids, retry, admin)
+    return _finish_return(results, sold_out)
+
+
+# 异步模式（async_app.py）使用的版本，connection 为 async_db.AsyncConnection
+
+async def _call_batch_once_async(connection, procedure, user_id, book_ids, admin=False):
+    cursor = await connection.cursor()
+    try:
+        # 异步连接池开启了 autocommit，整个过程需要显式放在一个事务中
+        await connection.begin()
+        await cursor.execute(f"CALL {procedure}(%s, %s, %s)", (user_id, json.dumps(book_ids), admin))
+        row = await cursor.fetchone()
+        while await cursor.nextset():
+            pass
+        await connection.commit()
+    except Exception:
+        await connection.rollback()
+        raise
+    finally:
+        await cursor.close()
+
+    results = json.loads(row[0]) if row else []
+    for item in results:
+        item['success'] = bool(item['success'])
+    return results
+
+
+async def _call_batch_async(connection, procedure, user_id, book_ids, retry=None, admin=False):
+    attempt = 0
+    while True:
+        try:
+            return await _call_batch_once_async(connection, procedure, user_id, book_ids, admin)
+        except Exception as e:
+            if not _should_retry(e, retry, attempt, procedure):
+                return _busy_results(book_ids)
+            await asyncio.sleep(retry.delay(attempt))
+            attempt += 1
+
+
+async def borrow_books_async(connection, user_id, book_ids, retry=None, sold_out=None, admin=False):
+    book_ids, results = _skip_sold_out(book_ids, sold_out)
+    if book_ids:
+        results += await _call_batch_async(connection, 'borrow_books_batch', user_id, book_ids, retry, admin)
+    return _finish_borrow(results, sold_out)
+
+
+async def return_books_async(connection, user_id, book_ids, retry=None, sold_out=None, admin=False):
+    results = await _call_batch_async(connection, 'return_books_batch', user_id, book_ids, retry, admin)
+    return _finish_return(results, sold_out)
+
+
+def split_books(cursor, book_ids=None):
+    """已拆分库存的图书及其分片数 {book_id: slots}"""
+    sql = "SELECT book_id, COUNT(*) FROM book_inventory_slots"
+    params = ()
+    if book_ids is not None:
+        if not book_ids:
+            return {}
+        sql += f" WHERE book_id IN ({', '.join(['%s'] * len(book_ids))})"
+        params = tuple(book_ids)
+    cursor.execute(sql + " GROUP BY book_id", params)
+    return dict(cursor.fetchall())
+
+
+def split_inventory(connection, book_id, slots):
+    """
+    把图书的库存拆分到 slots 行中（先合并已有的分片），slots <= 1 时取消拆分。
+    返回拆分后的库存总数，图书不存在时返回 None。
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.callproc('split_book_inventory', (book_id, slots, None))
+        cursor.execute("SELECT quantity FROM books WHERE id = %s", (book_id,))
+        row = cursor.fetchone()
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+
+def set_split_quantity(cursor, book_ids, quantities=None):
+    """
+    管理员修改库存时调用（不提交事务）：对已拆分的图书按新的数量重新分配各分片。
+    quantities 为 {book_id: 数量}，省略时使用 books.quantity（如还原之后）。
+    需要在更新 books 之前调用，与借书一样按 id 升序先锁分片再锁图书行。
+    """
+    for book_id, slots in sorted(split_books(cursor, book_ids).items()):
+        quantity = None if quantities is None else quantities.get(book_id)
+        if quantity is None:
+            cursor.execute("SELECT quantity FROM books WHERE id = %s", (book_id,))
+            quantity = cursor.fetchone()[0]
+        cursor.callproc('split_book_inventory', (book_id, slots, quantity))
+
+
+def sync_split_inventory(connection):
+    """把各分片之和回写到 books.quantity，返回发生变化的图书数"""
+    cursor = connection.cursor()
+    changed = 0
+    try:
+        # 一致性读，不锁分片；每本书单独更新，只短暂持有 books 行锁
+        cursor.execute("SELECT book_id, SUM(quantity) FROM book_inventory_slots GROUP BY book_id")
+        for book_id, total in cursor.fetchall():
+            cursor.execute("UPDATE books SET quantity = %s WHERE id = %s AND quantity <> %s",
+                           (total, book_id, total))
+            changed += cursor.rowcount
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return changed
+
+
+def active_borrows_sql(alias='books'):
+    """图书当前借出数的 SQL 表达式：计数列加上拆分库存各分片的增量"""
+    return (f"{alias}.active_borrow_count + COALESCE((SELECT SUM(s.borrow_delta) "
+            f"FROM book_inventory_slots s WHERE s.book_id = {alias}.id), 0)")
+
+
+# 计数列与 borrow_records 实际行数不一致的行：(id, 计数列的当前值, 实际借出数)
+BORROW_COUNT_DRIFT = {
+    'books': f"""
+        SELECT b.id, {active_borrows_sql('b')} AS stored, COALESCE(r.n, 0) AS actual
+        FROM books b
+        LEFT JOIN (SELECT book_id, COUNT(*) AS n FROM borrow_records GROUP BY book_id) r ON r.book_id = b.id
+        HAVING stored <> actual
+    """,
+    'users': """
+        SELECT u.id, u.active_borrow_count AS stored, COALESCE(r.n, 0) AS actual
+        FROM users u
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM borrow_records GROUP BY user_id) r ON r.user_id = u.id
+        HAVING stored <> actual
+    """,
+}
+
+
+def find_borrow_count_drift(cursor):
+    """全表比对计数列和借阅记录，返回不一致的行（一致性读，不加锁）"""
+    drift = []
+    for table, sql in BORROW_COUNT_DRIFT.items():
+        cursor.execute(sql)
+        drift.extend({'table': table, 'id': row_id, 'stored': int(stored), 'actual': int(actual)}
+                     for row_id, stored, actual in cursor.fetchall())
+    return drift
+
+
+def _repair_book_count(cursor, book_id):
+    # 与借书相同的加锁顺序：分片、图书行、借阅记录
+    cursor.execute("SELECT COALESCE(SUM(borrow_delta), 0) FROM book_inventory_slots "
+                   "WHERE book_id = %s FOR UPDATE", (book_id,))
+    delta = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM books WHERE id = %s FOR UPDATE", (book_id,))
+    if cursor.fetchone() is None:
+        return
+    cursor.execute("SELECT COUNT(*) FROM borrow_records WHERE book_id = %s FOR SHARE", (book_id,))
+    actual = cursor.fetchone()[0]
+    cursor.execute("UPDATE books SET active_borrow_count = %s WHERE id = %s", (actual - delta, book_id))
+
+
+def _repair_user_count(cursor, user_id):
+    # 与借书相同的加锁顺序：先用户行，再借阅记录
+    cursor.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+    if cursor.fetchone() is None:
+        return
+    cursor.execute("SELECT COUNT(*) FROM borrow_records WHERE user_id = %s FOR SHARE", (user_id,))
+    actual = cursor.fetchone()[0]
+    cursor.execute("UPDATE users SET active_borrow_count = %s WHERE id = %s", (actual, user_id))
+
+
+def reconcile_borrow_counts(connection, repair=True):
+    """
+    检查 active_borrow_count 是否与 borrow_records 一致，repair 时逐行加锁重新统计并修正。
+    返回检查时发现的不一致行。
+    """
+    cursor = connection.cursor()
+    try:
+        drift = find_borrow_count_drift(cursor)
+        connection.commit()
+        if repair:
+            # 每行单独提交，借还书只会在这一行上短暂等待
+            for item in drift:
+                if item['table'] == 'books':
+                    _repair_book_count(cursor, item['id'])
+                else:
+                    _repair_user_count(cursor, item['id'])
+                connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return drift
+
+
+class InventorySync:
+    """后台线程，每 interval 秒执行一次 job()（同步拆分库存的镜像），首次调用 start() 时启动"""
+
+    def __init__(self, job, interval=5):
+        self.job = job
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # fork 后线程不会被继承，is_alive() 为 False 时重新启动
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='inventory-sync', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.job()
+            except Exception as e:
+                print(f"Inventory sync failed: {e}")
@@ -6,4 +6,108 @@ class Config:
     MYSQL_HOST = 'localhost'
     MYSQL_USER = 'root'
     MYSQL_PASSWORD = 'your_password'
-    MYSQL_DB = 'book'
\ No newline at end of file
+    MYSQL_DB = 'book'
+
+    # 数据库连接池配置
+    DB_POOL_SIZE = 5            # 常驻连接数
+    DB_POOL_MAX_OVERFLOW = 10   # 高峰期允许额外创建的连接数
+    DB_POOL_RECYCLE = 3600      # 连接最长存活秒数，应小于 MySQL 的 wait_timeout
+    DB_POOL_PRE_PING = True     # 借出前检测连接是否可用
+    DB_POOL_TIMEOUT = 30        # 连接耗尽时最长等待秒数
+
+    # 只读副本：如 [{'host': 'replica1', 'port': 3306}]，user / password / database 默认与主库相同；
+    # 复制延迟超过 REPLICA_MAX_LAG 秒的副本暂不使用，每 REPLICA_CHECK_INTERVAL 秒检查一次
+    MYSQL_REPLICAS = []
+    REPLICA_MAX_LAG = 5
+    REPLICA_CHECK_INTERVAL = 5
+    # 用户写操作后 READ_YOUR_WRITES_WINDOW 秒内的读请求仍发往主库；从副本读到的结果只缓存 REPLICA_CACHE_TTL 秒
+    READ_YOUR_WRITES_WINDOW = 5
+    REPLICA_CACHE_TTL = 10
+
+    # 异步模式（async_app.py）的 aiomysql 连接池：常驻连接数和连接总数上限
+    ASYNC_DB_POOL_MINSIZE = 5
+    ASYNC_DB_POOL_MAXSIZE = 50
+
+    # 备份调度配置：写操作后的备份会被合并，两次备份至少间隔 BACKUP_WINDOW 秒
+    BACKUP_WINDOW = 60
+
+    # 备份模式：'full' 每次全量 mysqldump；'incremental' 定期全量基准 + change_log 增量
+    # （变更日志触发器只在增量模式下安装，修改后需要重新运行 initialize_db.py；
+    #  增量模式读取高水位时要等待未提交的事务，数据库用户需要 PROCESS 权限）
+    BACKUP_MODE = 'full'
+    BACKUP_FULL_INTERVAL = 86400  # 增量模式下两次全量基准之间的最长秒数
+
+    # 备份压缩：'none' / 'gzip' / 'zstd'（zstd 需要安装 zstandard）
+    BACKUP_COMPRESSION = 'gzip'
+
+    # 备份保留策略，每次备份后执行
+    BACKUP_KEEP_LAST = 10           # 无条件保留最近 N 个
+    BACKUP_KEEP_HOURLY = 24         # 最近 N 小时每小时保留一个
+    BACKUP_KEEP_DAILY = 7           # 最近 N 天每天保留一个
+    BACKUP_KEEP_WEEKLY = 4          # 最近 N 周每周保留一个
+    BACKUP_MAX_TOTAL_BYTES = 10 * 1024 ** 3  # 备份总大小上限，None 表示不限制
+
+    # 用户借阅页每页显示的图书数
+    BORROW_BOOKS_PAGE_SIZE = 20
+
+    # 管理页面每页显示的条数，以及 typeahead 接口返回的候选数
+    ADMIN_PAGE_SIZE = 50
+    TYPEAHEAD_LIMIT = 10
+
+    # 图书目录读缓存：auto 优先使用 redis（多个 worker 共享），连不上时退回进程内缓存；
+    # memory 为进程内 LRU，只适合单进程部署；none 关闭缓存
+    CACHE_BACKEND = 'auto'
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_TTL = 300
+    # 显示或按库存筛选的页面的缓存秒数：借还书不使全局图书缓存失效，其他用户看到的库存最多落后这么久
+    CACHE_STOCK_TTL = 10
+    CACHE_REDIS_URL = 'redis://localhost:6379/0'
+
+    # 批量导入时每个事务写入的行数
+    IMPORT_CHUNK_SIZE = 1000
+
+    # 流式导出时每批从数据库读取的行数
+    EXPORT_FETCH_SIZE = 1000
+
+    # 批量借书 / 还书一次最多处理的图书数
+    BATCH_MAX_ITEMS = 50
+
+    # 热门图书借阅：死锁 / 锁等待超时的重试次数和退避时间（秒），确认售罄后直接拒绝借阅的秒数
+    CIRCULATION_RETRY_ATTEMPTS = 3
+    CIRCULATION_RETRY_BASE_DELAY = 0.02
+    CIRCULATION_RETRY_MAX_DELAY = 0.5
+    CIRCULATION_SOLD_OUT_TTL = 2
+    # 拆分库存的默认分片数，以及把分片之和回写 books.quantity 的间隔秒数
+    INVENTORY_SPLIT_SLOTS = 8
+    INVENTORY_SYNC_INTERVAL = 5
+
+    # 借阅统计：汇总快照（热门图书、库存、用户在借分布）的刷新间隔秒数，热门图书条数，每日借还显示的天数
+    STATS_ROLLUP_INTERVAL = 300
+    STATS_TOP_BOOKS = 10
+    STATS_DAYS = 30
+
+    # 借阅历史（loan_events）：预建分区的月数；保留的月数，更早的分区由后台维护线程
+    # 换出为归档表（LOAN_EVENTS_ARCHIVE 为 False 时直接删除）；维护间隔秒数
+    LOAN_EVENTS_PARTITIONS_AHEAD = 3
+    LOAN_EVENTS_RETENTION_MONTHS = 24
+    LOAN_EVENTS_ARCHIVE = True
+    LOAN_EVENTS_MAINTAIN_INTERVAL = 86400
+
+    # 封面图片变体：名称 -> 最大宽高；WebP 不可用时自动使用 JPEG
+    IMAGE_VARIANTS = {'thumb': (160, 160), 'medium': (480, 480)}
+    IMAGE_VARIANT_FORMAT = 'webp'
+    IMAGE_QUALITY = 80
+    IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+    # 带指纹的静态资源（/assets/）的缓存时间
+    ASSET_CACHE_MAX_AGE = 365 * 24 * 3600
+    # 第三方库未下载到 static/vendor 时是否回退到 CDN；执行 python assets.py vendor 并提交 static/vendor 后可改为 False
+    ASSET_ALLOW_CDN = True
+
+    # /metrics 的访问令牌；为 None 时只允许本机（127.0.0.1 / ::1）访问
+    METRICS_TOKEN = None
+
+    # 按请求开启的性能剖析：报告保存目录，同一语句重复多少次视为 N+1，无 LIMIT 查询多少行视为过大
+    PROFILE_DIR = 'profiles'
+    PROFILE_REPEAT_THRESHOLD = 5
+    PROFILE_UNBOUNDED_ROWS = 1000
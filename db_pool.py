@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+
+
+class PoolTimeoutError(Exception):
+    """等待空闲连接超时"""
+
+
+class PooledConnection:
+    """
+    对 mysql.connector 连接的包装：close() 不会真正断开，而是归还给连接池，
+    因此原有 `connection.close()` 的写法可以保持不变。
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._last_used = time.monotonic()
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._pool.instrument is not None:
+            cursor = self._pool.instrument.wrap_cursor(cursor)
+        return cursor
+
+    @property
+    def pool(self):
+        """借出该连接的连接池"""
+        return self._pool
+
+    def close(self):
+        if self._checked_out:
+            self._checked_out = False
+            self._pool._return(self)
+
+
+class ConnectionPool:
+    """
+    带溢出、空闲回收、借出前健康检查的 MySQL 连接池。
+
+    - size: 常驻连接数
+    - max_overflow: 超出 size 后允许临时创建的连接数，归还时直接关闭
+    - recycle: 连接存活超过该秒数后在借出时重建，避免被服务端 wait_timeout 断开
+    - pre_ping: 借出前 ping 一次，失效则重连
+    - timeout: 连接耗尽时等待的最长秒数
+    - instrument: 可选的观测钩子，提供 observe_checkout(秒) 和 wrap_cursor(游标)
+
+    连接池按进程隔离：gunicorn 等预先 fork 的 worker 第一次借用时会发现 pid 变化，
+    丢弃从父进程继承的连接（不关闭 socket，避免影响父进程）并重新建立。
+    """
+
+    def __init__(self, size=5, max_overflow=10, recycle=3600, pre_ping=True, timeout=30,
+                 instrument=None, **connect_kwargs):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self.instrument = instrument
+        self._connect_kwargs = connect_kwargs
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()
+        self._total = 0
+        self._stats = {
+            'checkouts': 0,
+            'checkins': 0,
+            'connects': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # 子进程中：继承来的 socket 属于父进程，直接丢弃引用
+            self._reset()
+
+    def _create(self):
+        raw = mysql.connector.connect(**self._connect_kwargs)
+        with self._lock:
+            self._stats['connects'] += 1
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _is_stale(self, conn):
+        if self.recycle and time.monotonic() - conn._created_at > self.recycle:
+            with self._lock:
+                self._stats['recycled'] += 1
+            return True
+        if self.pre_ping:
+            try:
+                conn._raw.ping(reconnect=False)
+            except mysql.connector.Error:
+                with self._lock:
+                    self._stats['ping_failures'] += 1
+                return True
+        return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+
+    def connect(self):
+        """借出一个连接，用完后调用 close() 归还"""
+        self._check_fork()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        with self._available:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                self._available.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        try:
+            if conn is not None and self._is_stale(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._create()
+        except Exception:
+            with self._available:
+                self._total -= 1
+                self._available.notify()
+            raise
+
+        conn._checked_out = True
+        conn._last_used = time.monotonic()
+        if self.instrument is not None:
+            self.instrument.observe_checkout(waited)
+        return conn
+
+    def _return(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # 丢弃未提交的事务，避免污染下一个使用者
+            if conn._raw.in_transaction:
+                conn._raw.rollback()
+            healthy = True
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._available:
+            self._stats['checkins'] += 1
+            if healthy and len(self._idle) < self.size:
+                self._idle.append(conn)
+            else:
+                self._total -= 1
+                self._discard(conn)
+            self._available.notify()
+
+    def cursor(self, **cursor_kwargs):
+        """with pool.cursor(dictionary=True) as (connection, cursor): ..."""
+        return pooled_cursor(self.connect, **cursor_kwargs)
+
+    def dispose(self):
+        """关闭所有空闲连接"""
+        with self._available:
+            while self._idle:
+                self._discard(self._idle.pop())
+                self._total -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['max_overflow'] = self.max_overflow
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._total - len(self._idle)
+            stats['wait_time_avg'] = (
+                stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+            )
+            stats['pid'] = self._pid
+        return stats
+
+
+@contextmanager
+def pooled_cursor(connect, **cursor_kwargs):
+    """
+    调用 connect() 借出连接并返回游标，退出时无论是否异常都会关闭游标并归还连接；
+    异常时会先回滚。
+    """
+    connection = connect()
+    cursor = None
+    try:
+        cursor = connection.cursor(**cursor_kwargs)
+        yield connection, cursor
+    except Exception:
+        try:
+            connection.rollback()
+        except mysql.connector.Error:
+            pass
+        raise
+    finally:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        connection.close()
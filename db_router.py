@@ -0,0 +1,136 @@
+"""
+读写分离：只读请求发往只读副本，写操作和存储过程调用始终使用主库。
+
+后台线程每隔 check_interval 秒对每个副本执行 SHOW REPLICA STATUS，
+复制停止、延迟超过 max_lag 秒或无法连接的副本暂不使用，下一次检查通过后自动恢复；
+没有可用副本或借出副本连接失败时回退到主库，因此副本故障只影响读请求的分担，不影响可用性。
+"""
+import time
+import threading
+
+import mysql.connector
+
+from db_pool import PoolTimeoutError
+
+
+class ReplicaRouter:
+    """
+    - primary: 主库连接池
+    - replicas: {副本名称: 连接池}
+    - max_lag: 允许的最大复制延迟秒数
+    - check_interval: 检查副本状态的间隔秒数
+    副本在第一次检查通过前不会被使用。
+    """
+
+    def __init__(self, primary, replicas=None, max_lag=5, check_interval=5):
+        self.primary = primary
+        self.replicas = dict(replicas or {})
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next = 0
+        self._routes = {'primary': 0, 'replica': 0, 'fallback': 0}
+        self._status = {
+            name: {'healthy': False, 'lag': None, 'error': None, 'checked_at': None, 'reads': 0}
+            for name in self.replicas
+        }
+
+    def start(self):
+        """启动副本状态检查线程，fork 后的子进程中首次调用时重新启动"""
+        if not self.replicas or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='replica-monitor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.check_interval)
+
+    def check(self):
+        """检查一遍所有副本的复制延迟"""
+        for name, pool in self.replicas.items():
+            try:
+                lag = self._replica_lag(pool)
+                error = None if lag is not None else '复制未运行'
+            except (mysql.connector.Error, PoolTimeoutError) as e:
+                lag, error = None, str(e)
+            healthy = error is None and lag <= self.max_lag
+            if error is None and not healthy:
+                error = f'复制延迟 {lag} 秒，超过 {self.max_lag} 秒'
+            with self._lock:
+                self._status[name].update(healthy=healthy, lag=lag, error=error, checked_at=time.time())
+
+    @staticmethod
+    def _replica_lag(pool):
+        """副本落后主库的秒数；未配置复制或复制线程停止时返回 None"""
+        connection = pool.connect()
+        try:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except mysql.connector.Error:
+                    # MySQL 8.0.22 之前的版本
+                    cursor.execute("SHOW SLAVE STATUS")
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
+        # 多源复制时每个通道一行，取最慢的通道
+        lags = [row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master')) for row in rows]
+        if not lags or any(lag is None for lag in lags):
+            return None
+        return max(lags)
+
+    def _candidates(self):
+        """按轮询顺序排列的健康副本"""
+        with self._lock:
+            healthy = [name for name, status in self._status.items() if status['healthy']]
+            if not healthy:
+                return []
+            start = self._next % len(healthy)
+            self._next += 1
+        return healthy[start:] + healthy[:start]
+
+    def connect(self, read_only=False):
+        """借出连接：read_only 时优先使用副本，否则（以及副本不可用时）使用主库"""
+        if read_only and self.replicas:
+            self.start()
+            for name in self._candidates():
+                try:
+                    connection = self.replicas[name].connect()
+                except mysql.connector.Error as e:
+                    # 连接失败的副本在下一次检查通过前不再使用
+                    with self._lock:
+                        self._status[name].update(healthy=False, error=str(e))
+                    continue
+                except PoolTimeoutError:
+                    continue
+                with self._lock:
+                    self._routes['replica'] += 1
+                    self._status[name]['reads'] += 1
+                return connection
+            route = 'fallback'
+        else:
+            route = 'primary'
+        connection = self.primary.connect()
+        with self._lock:
+            self._routes[route] += 1
+        return connection
+
+    def is_replica(self, connection):
+        """connection 是否借自只读副本"""
+        return connection.pool is not self.primary
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_lag': self.max_lag,
+                'routes': dict(self._routes),
+                'replicas': {name: dict(status) for name, status in self._status.items()},
+            }
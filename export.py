@@ -0,0 +1,116 @@
+"""
+以 CSV / NDJSON 流式导出图书目录和借阅记录。
+
+查询使用非缓冲游标，按 fetch_size 分批从服务端读取，每批编码后立即交给响应，
+内存占用与表的大小无关。结果始终按主键升序输出，中断后把最后收到的 id
+作为 after 参数重新请求即可从断点继续。
+
+支持的参数：
+    format        csv（默认）或 ndjson
+    user_id       只导出该用户的借阅记录
+    book_id       只导出该图书（或该图书的借阅记录）
+    min_id/max_id 主键范围（闭区间）
+    after         断点续传游标，只导出主键大于它的行
+    limit         最多导出的行数
+"""
+import io
+import csv
+import json
+
+EXPORTS = {
+    'books': {
+        'select': "SELECT id, title, quantity, image_filename FROM books",
+        'columns': ['id', 'title', 'quantity', 'image_filename'],
+        'key': 'id',
+        'filters': {'book_id': 'id'},
+    },
+    'borrow_records': {
+        'select': "SELECT borrow_id, user_id, user_name, book_id, book_title FROM borrow_record_view",
+        'columns': ['borrow_id', 'user_id', 'user_name', 'book_id', 'book_title'],
+        'key': 'borrow_id',
+        'filters': {'user_id': 'user_id', 'book_id': 'book_id'},
+    },
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def export_query(name, args):
+    """根据导出名称和请求参数生成 (sql, params, columns)，参数不合法时抛出 ValueError"""
+    export = EXPORTS.get(name)
+    if export is None:
+        raise ValueError(f"unknown export: {name}")
+
+    key = export['key']
+    conditions, params = [], []
+    for arg, column in export['filters'].items():
+        value = _int_arg(args, arg)
+        if value is not None:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    for arg, op in (('min_id', '>='), ('max_id', '<='), ('after', '>')):
+        value = _int_arg(args, arg)
+        if value is not None:
+            conditions.append(f"{key} {op} %s")
+            params.append(value)
+
+    sql = export['select']
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {key}"
+    limit = _int_arg(args, 'limit')
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(max(0, limit))
+    return sql, params, export['columns']
+
+
+def stream_rows(cursor, sql, params, fetch_size=1000):
+    """在非缓冲游标上执行查询，按批产出结果行"""
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def encode_csv(batches, columns):
+    """把结果批次编码为 CSV 文本块，首块为表头"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def encode_ndjson(batches, columns):
+    """把结果批次编码为 NDJSON 文本块，每行一个对象"""
+    for rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+            for row in rows
+        )
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
@@ -0,0 +1,204 @@
+"""
+图书封面图片处理。
+
+上传的图片按内容的 sha256 保存到 static/images/<前两位>/<hash>.<ext>，
+同一张图片无论上传多少次、叫什么名字都只存一份，也不会互相覆盖。
+保存后由后台线程生成缩略图和中等尺寸的变体：
+
+    images/ab/<hash>.jpg              原图
+    images/ab/<hash>_thumb_160.webp   缩略图（管理页面表格）
+    images/ab/<hash>_medium_480.webp  中等尺寸（借阅页面卡片）
+
+文件名由内容和尺寸决定，内容变化必然得到新的 URL，因此 images/ 下的文件可以
+使用一年的 immutable 缓存头。变体尚未生成（或未安装 Pillow）时模板回退到原图。
+
+    python image_util.py generate   为 books 中所有内容寻址的图片补齐变体
+"""
+import os
+import sys
+import queue
+import hashlib
+import tempfile
+import threading
+
+try:
+    from PIL import Image, features
+except ImportError:  # 未安装时只保存原图，不生成变体
+    Image = None
+    features = None
+
+IMAGE_DIR = 'images'
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+CHUNK_SIZE = 64 * 1024
+
+
+def variant_format(preferred):
+    """Pillow 不支持 WebP 编码时退回 JPEG"""
+    if preferred == 'webp' and (features is None or not features.check('webp')):
+        return 'jpeg'
+    return preferred
+
+
+def variant_filename(image_filename, name, size, fmt):
+    """变体相对 static 的路径；只有内容寻址的图片才有变体"""
+    base, _ = os.path.splitext(image_filename)
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f"{base}_{name}_{max(size)}.{ext}"
+
+
+def is_content_addressed(image_filename):
+    return bool(image_filename) and image_filename.replace('\\', '/').startswith(IMAGE_DIR + '/')
+
+
+class ImageStore:
+    """内容寻址的图片存储，以及生成变体的后台线程"""
+
+    def __init__(self, static_dir, variants, fmt='webp', quality=80):
+        self.static_dir = static_dir
+        self.variants = variants
+        self.format = variant_format(fmt)
+        self.quality = quality
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        # 计数在请求线程和后台线程中都会修改，读写都在 _stats_lock 下进行
+        self._stats_lock = threading.Lock()
+        self.stats = {'stored': 0, 'deduplicated': 0, 'variants': 0, 'failures': 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def save(self, file_storage):
+        """
+        保存上传的图片，返回相对 static 的路径；扩展名不允许时抛出 ValueError。
+        边读边计算哈希写入临时文件，再原子地移动到最终位置。
+        """
+        ext = os.path.splitext(file_storage.filename or '')[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"不支持的图片格式: {ext or '无扩展名'}")
+        if ext == '.jpeg':
+            ext = '.jpg'
+
+        image_root = os.path.join(self.static_dir, IMAGE_DIR)
+        os.makedirs(image_root, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=image_root, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            hex_digest = digest.hexdigest()
+            relative = f"{IMAGE_DIR}/{hex_digest[:2]}/{hex_digest}{ext}"
+            target = os.path.join(self.static_dir, relative)
+            if os.path.exists(target):
+                os.remove(tmp_path)
+                self._count('deduplicated')
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+                self._count('stored')
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.enqueue(relative)
+        return relative
+
+    def enqueue(self, image_filename):
+        """把缺少变体的图片交给后台线程处理"""
+        if Image is None or not is_content_addressed(image_filename):
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='image-worker', daemon=True)
+                self._worker.start()
+        self._queue.put(image_filename)
+
+    def _run(self):
+        while True:
+            image_filename = self._queue.get()
+            try:
+                self.generate_variants(image_filename)
+            except Exception as e:
+                self._count('failures')
+                print(f"Image variant generation failed for {image_filename}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def generate_variants(self, image_filename):
+        """生成全部缺少的变体，已存在的跳过"""
+        source = os.path.join(self.static_dir, image_filename)
+        with Image.open(source) as original:
+            original.load()
+            for name, size in self.variants.items():
+                target = os.path.join(self.static_dir,
+                                      variant_filename(image_filename, name, size, self.format))
+                if os.path.exists(target):
+                    continue
+                image = original.copy()
+                image.thumbnail(size)
+                if self.format == 'jpeg' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                tmp_path = target + '.tmp'
+                image.save(tmp_path, format=self.format.upper(), quality=self.quality)
+                os.replace(tmp_path, target)
+                self._count('variants')
+
+    def url_path(self, image_filename, size=None):
+        """模板中使用的图片路径：变体已生成则用变体，否则用原图"""
+        if not image_filename:
+            return None
+        if size in self.variants and is_content_addressed(image_filename):
+            variant = variant_filename(image_filename, size, self.variants[size], self.format)
+            if os.path.exists(os.path.join(self.static_dir, variant)):
+                return variant
+        return image_filename
+
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(stats, queue_depth=self._queue.qsize(), format=self.format,
+                    pillow=Image is not None)
+
+
+if __name__ == '__main__':
+    import mysql.connector
+    from config import Config
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'generate':
+        print(__doc__)
+        sys.exit(1)
+    if Image is None:
+        print("Pillow is not installed")
+        sys.exit(1)
+
+    store = ImageStore(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'),
+        Config.IMAGE_VARIANTS, Config.IMAGE_VARIANT_FORMAT, Config.IMAGE_QUALITY
+    )
+    connection = mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB
+    )
+    cursor = connection.cursor()
+    cursor.execute("SELECT DISTINCT image_filename FROM books WHERE image_filename LIKE %s",
+                   (IMAGE_DIR + '/%',))
+    filenames = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    connection.close()
+
+    for filename in filenames:
+        try:
+            store.generate_variants(filename)
+        except Exception as e:
+            print(f"{filename}: {e}")
+    print(store.status())
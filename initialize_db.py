@@ -1,6 +1,77 @@
+import os
+import re
+import random
+import argparse
+import tempfile
+import time
 import mysql.connector
 from mysql.connector import Error
 from config import Config
+from hash_util import generate_hash
+from stats import rebuild_active_loans
+from loan_history import ensure_partitions
+from circulation import reconcile_borrow_counts
+
+# 变更日志跟踪的表及写入 change_log.row_id 的列：复合主键的表记录 book_id，增量备份按图书整组导出
+CHANGE_LOG_TABLES = {
+    'users': 'id',
+    'books': 'id',
+    'borrow_records': 'id',
+    'book_inventory_slots': 'book_id',
+    'book_circulation_stats': 'book_id',
+}
+CHANGE_LOG_EVENTS = (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+
+
+def create_change_log_triggers(cursor):
+    """变更日志触发器：记录 CHANGE_LOG_TABLES 中每一行的增删改，用于增量备份"""
+    for table, key in CHANGE_LOG_TABLES.items():
+        for event, row in CHANGE_LOG_EVENTS:
+            trigger_name = f"log_{table}_{event.lower()}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+            cursor.execute(f'''
+            CREATE TRIGGER {trigger_name}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            INSERT INTO change_log (table_name, row_id) VALUES ('{table}', {row}.{key})
+            ''')
+
+
+# 后来加入的列：CREATE TABLE IF NOT EXISTS 不会修改已有的表，升级时逐列补齐
+UPGRADE_COLUMNS = (
+    ('users', 'active_borrow_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('books', 'active_borrow_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('book_inventory_slots', 'borrow_delta', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+
+def add_missing_columns(cursor):
+    """为已有数据库补上 UPGRADE_COLUMNS 中缺少的列，返回补上的 [(表名, 列名)]"""
+    cursor.execute(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    existing = {(table.lower(), column.lower()) for table, column in cursor.fetchall()}
+    added = []
+    for table, column, definition in UPGRADE_COLUMNS:
+        if (table, column) not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            added.append((table, column))
+    return added
+
+
+def drop_change_log_triggers(cursor):
+    for table in CHANGE_LOG_TABLES:
+        for event, _ in CHANGE_LOG_EVENTS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS log_{table}_{event.lower()}")
+
+
+def apply_change_log_triggers(cursor):
+    """只有增量备份模式需要变更日志；全量模式删除触发器，借还时不再额外写入 change_log"""
+    if Config.BACKUP_MODE == 'incremental':
+        create_change_log_triggers(cursor)
+    else:
+        drop_change_log_triggers(cursor)
+
 
 def initialize_database():
     try:
@@ -30,50 +101,277 @@ def initialize_database():
                     except Error as err:
                         print(f"Warning executing statement: {err}")
 
+            # 已有数据库升级：补上新加的计数列，存储过程和触发器依赖这些列
+            for table, column in add_missing_columns(cursor):
+                print(f"Added column {table}.{column}")
 
+            # 预建借阅历史的按月分区
+            ensure_partitions(cursor)
 
-            # 创建存储过程：借书
+            # 单本借还书的旧存储过程直接修改 books.quantity，绕过拆分库存和借阅统计，
+            # 单本借还已改由批量过程处理，升级时删除
             cursor.execute("DROP PROCEDURE IF EXISTS borrow_book")
-            create_proc_borrow = '''
-            CREATE PROCEDURE borrow_book(IN p_user_id INT, IN p_book_id INT)
+            cursor.execute("DROP PROCEDURE IF EXISTS return_book")
+
+            # 创建存储过程：批量借书 / 还书
+            # p_book_ids 为图书 id 的 JSON 数组；先锁定用户行，再按 id 升序逐本锁定图书行，两个过程加锁顺序一致，
+            # 并发批次之间不会互相死锁。单本失败不影响其他图书，结果以 JSON 数组返回。
+            # 同时维护 users / books 的 active_borrow_count，拆分库存的图书记在分片的 borrow_delta 上。
+            # 借阅统计：每本书的借阅次数在持有该书的锁时累加；全局计数和每日计数在事务末尾一次写入，
+            # 此时不再申请图书锁，不会与其他批次形成循环等待。
+            # 每次成功借还在同一事务中向 loan_events 追加一条事件，p_by_admin 为真时记为管理员代办
+            # （admin_add / admin_remove）；归还时删除 borrow_records 中的记录，该表只保留在借的记录。
+            cursor.execute("DROP PROCEDURE IF EXISTS borrow_books_batch")
+            create_proc_borrow_batch = '''
+            CREATE PROCEDURE borrow_books_batch(IN p_user_id INT, IN p_book_ids JSON, IN p_by_admin BOOLEAN)
+            BEGIN
+                DECLARE done INT DEFAULT 0;
+                DECLARE v_book_id INT;
+                DECLARE v_found INT;
+                DECLARE v_quantity INT;
+                DECLARE v_borrowed INT;
+                DECLARE v_slots INT;
+                DECLARE v_slot INT;
+                DECLARE v_changed INT DEFAULT 0;
+                DECLARE v_shard INT DEFAULT MOD(CONNECTION_ID(), 16);
+                DECLARE v_sold_out INT DEFAULT 0;
+                DECLARE v_success BOOLEAN;
+                DECLARE v_message VARCHAR(255);
+                DECLARE v_results JSON DEFAULT JSON_ARRAY();
+                DECLARE book_cursor CURSOR FOR
+                    SELECT DISTINCT jt.book_id
+                    FROM JSON_TABLE(p_book_ids, '$[*]' COLUMNS (book_id INT PATH '$')) jt
+                    ORDER BY jt.book_id;
+                DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+
+                -- 同一用户的并发批次在此排队，避免外键共享锁升级为更新借出数时的排他锁而死锁
+                SELECT COUNT(*) INTO v_found FROM users WHERE id = p_user_id FOR UPDATE;
+
+                OPEN book_cursor;
+                book_loop: LOOP
+                    FETCH book_cursor INTO v_book_id;
+                    IF done THEN
+                        LEAVE book_loop;
+                    END IF;
+
+                    -- 先用不加锁的一致性读判断，库存已为 0 时不排队等待行锁
+                    SELECT COUNT(*), MAX(quantity) INTO v_found, v_quantity
+                    FROM books WHERE id = v_book_id;
+                    SELECT COUNT(*) INTO v_slots
+                    FROM book_inventory_slots WHERE book_id = v_book_id;
+
+                    SET v_success = FALSE;
+                    IF v_found = 0 THEN
+                        SET v_message = '图书不存在';
+                    ELSEIF v_slots = 0 AND v_quantity <= 0 THEN
+                        SET v_message = '图书库存不足，无法借阅';
+                        SET v_sold_out = v_sold_out + 1;
+                    ELSE
+                        IF v_slots = 0 THEN
+                            SELECT MAX(quantity) INTO v_quantity
+                            FROM books WHERE id = v_book_id FOR UPDATE;
+                        END IF;
+                        SELECT COUNT(*) INTO v_borrowed
+                        FROM borrow_records WHERE user_id = p_user_id AND book_id = v_book_id FOR UPDATE;
+
+                        IF v_quantity IS NULL THEN
+                            -- 一致性读之后、加锁之前图书已被删除
+                            SET v_message = '图书不存在';
+                        ELSEIF v_borrowed > 0 THEN
+                            SET v_message = '您已借阅过该书，不能重复借阅';
+                        ELSEIF v_slots > 0 THEN
+                            -- 拆分库存：跳过其他事务正在使用的分片，都被占用时再等待
+                            SET v_slot = NULL;
+                            SELECT slot INTO v_slot FROM book_inventory_slots
+                            WHERE book_id = v_book_id AND quantity > 0 LIMIT 1 FOR UPDATE SKIP LOCKED;
+                            IF v_slot IS NULL THEN
+                                SELECT slot INTO v_slot FROM book_inventory_slots
+                                WHERE book_id = v_book_id AND quantity > 0 LIMIT 1 FOR UPDATE;
+                            END IF;
+                            -- 未找到分片会触发 NOT FOUND 处理器，恢复游标状态
+                            SET done = 0;
+                            IF v_slot IS NULL THEN
+                                SET v_message = '图书库存不足，无法借阅';
+                                SET v_sold_out = v_sold_out + 1;
+                            ELSE
+                                UPDATE book_inventory_slots SET quantity = quantity - 1, borrow_delta = borrow_delta + 1
+                                WHERE book_id = v_book_id AND slot = v_slot;
+                                INSERT INTO borrow_records (user_id, book_id) VALUES (p_user_id, v_book_id);
+                                INSERT INTO loan_events (event_type, user_id, book_id, borrow_id)
+                                VALUES (IF(p_by_admin, 'admin_add', 'borrow'), p_user_id, v_book_id, LAST_INSERT_ID());
+                                INSERT INTO book_circulation_stats (book_id, shard, borrows) VALUES (v_book_id, v_slot + 1, 1)
+                                ON DUPLICATE KEY UPDATE borrows = borrows + 1;
+                                SET v_changed = v_changed + 1;
+                                SET v_success = TRUE;
+                                SET v_message = '借书成功';
+                            END IF;
+                        ELSEIF v_quantity <= 0 THEN
+                            SET v_message = '图书库存不足，无法借阅';
+                            SET v_sold_out = v_sold_out + 1;
+                        ELSE
+                            UPDATE books SET quantity = quantity - 1, active_borrow_count = active_borrow_count + 1
+                            WHERE id = v_book_id;
+                            INSERT INTO borrow_records (user_id, book_id) VALUES (p_user_id, v_book_id);
+                            INSERT INTO loan_events (event_type, user_id, book_id, borrow_id)
+                            VALUES (IF(p_by_admin, 'admin_add', 'borrow'), p_user_id, v_book_id, LAST_INSERT_ID());
+                            INSERT INTO book_circulation_stats (book_id, shard, borrows) VALUES (v_book_id, 0, 1)
+                            ON DUPLICATE KEY UPDATE borrows = borrows + 1;
+                            SET v_changed = v_changed + 1;
+                            SET v_success = TRUE;
+                            SET v_message = '借书成功';
+                        END IF;
+                    END IF;
+
+                    SET v_results = JSON_ARRAY_APPEND(v_results, '$',
+                        JSON_OBJECT('book_id', v_book_id, 'success', v_success, 'message', v_message));
+                END LOOP;
+                CLOSE book_cursor;
+
+                IF v_changed > 0 THEN
+                    UPDATE users SET active_borrow_count = active_borrow_count + v_changed WHERE id = p_user_id;
+                END IF;
+                IF v_changed > 0 OR v_sold_out > 0 THEN
+                    INSERT INTO circulation_counters (name, shard, value)
+                    VALUES ('borrows', v_shard, v_changed), ('active_loans', v_shard, v_changed),
+                           ('sold_out_rejections', v_shard, v_sold_out) AS new
+                    ON DUPLICATE KEY UPDATE value = value + new.value;
+                    INSERT INTO circulation_daily (day, shard, borrows) VALUES (CURDATE(), v_shard, v_changed)
+                    ON DUPLICATE KEY UPDATE borrows = borrows + v_changed;
+                END IF;
+
+                SELECT v_results AS results;
+            END
+            '''
+            cursor.execute(create_proc_borrow_batch)
+
+            cursor.execute("DROP PROCEDURE IF EXISTS return_books_batch")
+            create_proc_return_batch = '''
+            CREATE PROCEDURE return_books_batch(IN p_user_id INT, IN p_book_ids JSON, IN p_by_admin BOOLEAN)
             BEGIN
-                DECLARE rows_affected INT;
-                DECLARE has_borrowed INT DEFAULT 0;
-
-                SELECT COUNT(*) INTO has_borrowed FROM borrow_records WHERE user_id = p_user_id AND book_id = p_book_id;
-
-                IF has_borrowed > 0 THEN
-                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '您已借阅过该书，不能重复借阅';
-                ELSE
-                    UPDATE books SET quantity = quantity - 1 WHERE id = p_book_id AND quantity > 0;
-                    SELECT ROW_COUNT() INTO rows_affected;
-                    
-                    IF rows_affected > 0 THEN
-                        INSERT INTO borrow_records (user_id, book_id) VALUES (p_user_id, p_book_id);
+                DECLARE done INT DEFAULT 0;
+                DECLARE v_book_id INT;
+                DECLARE v_found INT;
+                DECLARE v_borrow_id INT;
+                DECLARE v_slots INT;
+                DECLARE v_slot INT;
+                DECLARE v_changed INT DEFAULT 0;
+                DECLARE v_shard INT DEFAULT MOD(CONNECTION_ID(), 16);
+                DECLARE v_success BOOLEAN;
+                DECLARE v_message VARCHAR(255);
+                DECLARE v_results JSON DEFAULT JSON_ARRAY();
+                DECLARE book_cursor CURSOR FOR
+                    SELECT DISTINCT jt.book_id
+                    FROM JSON_TABLE(p_book_ids, '$[*]' COLUMNS (book_id INT PATH '$')) jt
+                    ORDER BY jt.book_id;
+                DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+
+                -- 同一用户的并发批次在此排队，避免外键共享锁升级为更新借出数时的排他锁而死锁
+                SELECT COUNT(*) INTO v_found FROM users WHERE id = p_user_id FOR UPDATE;
+
+                OPEN book_cursor;
+                book_loop: LOOP
+                    FETCH book_cursor INTO v_book_id;
+                    IF done THEN
+                        LEAVE book_loop;
+                    END IF;
+
+                    SELECT COUNT(*) INTO v_slots
+                    FROM book_inventory_slots WHERE book_id = v_book_id;
+                    IF v_slots = 0 THEN
+                        SELECT COUNT(*) INTO v_found
+                        FROM books WHERE id = v_book_id FOR UPDATE;
                     ELSE
-                        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '图书库存不足，无法借阅';
+                        SELECT COUNT(*) INTO v_found
+                        FROM books WHERE id = v_book_id;
                     END IF;
+                    SELECT MIN(id) INTO v_borrow_id
+                    FROM borrow_records WHERE user_id = p_user_id AND book_id = v_book_id FOR UPDATE;
+
+                    SET v_success = FALSE;
+                    IF v_found = 0 THEN
+                        SET v_message = '图书不存在';
+                    ELSEIF v_borrow_id IS NULL THEN
+                        SET v_message = '未借阅该书';
+                    ELSE
+                        IF v_slots = 0 THEN
+                            UPDATE books SET quantity = quantity + 1, active_borrow_count = active_borrow_count - 1
+                            WHERE id = v_book_id;
+                        ELSE
+                            SET v_slot = NULL;
+                            SELECT slot INTO v_slot FROM book_inventory_slots
+                            WHERE book_id = v_book_id LIMIT 1 FOR UPDATE SKIP LOCKED;
+                            IF v_slot IS NULL THEN
+                                SELECT slot INTO v_slot FROM book_inventory_slots
+                                WHERE book_id = v_book_id LIMIT 1 FOR UPDATE;
+                            END IF;
+                            SET done = 0;
+                            UPDATE book_inventory_slots SET quantity = quantity + 1, borrow_delta = borrow_delta - 1
+                            WHERE book_id = v_book_id AND slot = v_slot;
+                        END IF;
+                        INSERT INTO loan_events (event_type, user_id, book_id, borrow_id)
+                        VALUES (IF(p_by_admin, 'admin_remove', 'return'), p_user_id, v_book_id, v_borrow_id);
+                        DELETE FROM borrow_records WHERE id = v_borrow_id;
+                        SET v_changed = v_changed + 1;
+                        SET v_success = TRUE;
+                        SET v_message = '还书成功';
+                    END IF;
+
+                    SET v_results = JSON_ARRAY_APPEND(v_results, '$',
+                        JSON_OBJECT('book_id', v_book_id, 'success', v_success, 'message', v_message));
+                END LOOP;
+                CLOSE book_cursor;
+
+                IF v_changed > 0 THEN
+                    UPDATE users SET active_borrow_count = active_borrow_count - v_changed WHERE id = p_user_id;
+                    INSERT INTO circulation_counters (name, shard, value)
+                    VALUES ('returns', v_shard, v_changed), ('active_loans', v_shard, -v_changed) AS new
+                    ON DUPLICATE KEY UPDATE value = value + new.value;
+                    INSERT INTO circulation_daily (day, shard, returns) VALUES (CURDATE(), v_shard, v_changed)
+                    ON DUPLICATE KEY UPDATE returns = returns + v_changed;
                 END IF;
+
+                SELECT v_results AS results;
             END
             '''
-            cursor.execute(create_proc_borrow)
+            cursor.execute(create_proc_return_batch)
 
-            # 创建存储过程：还书
-            cursor.execute("DROP PROCEDURE IF EXISTS return_book")
-            create_proc_return = '''
-            CREATE PROCEDURE return_book(IN p_user_id INT, IN p_book_id INT)
+            # 拆分库存：先锁定该书全部分片（与借书相同，先分片后图书行），
+            # 以 p_quantity（为 NULL 时取已有分片之和，未拆分时取 books.quantity）为总数，
+            # 写回 books.quantity 并平均分配到 p_slots 个分片，p_slots <= 1 时取消拆分；
+            # 已有分片上的借出数增量合并到 books.active_borrow_count
+            cursor.execute("DROP PROCEDURE IF EXISTS split_book_inventory")
+            create_proc_split = '''
+            CREATE PROCEDURE split_book_inventory(IN p_book_id INT, IN p_slots INT, IN p_quantity INT)
             BEGIN
-                DECLARE borrow_id INT;
-                SELECT id INTO borrow_id FROM borrow_records WHERE user_id = p_user_id AND book_id = p_book_id LIMIT 1;
-                IF borrow_id IS NOT NULL THEN
-                    UPDATE books SET quantity = quantity + 1 WHERE id = p_book_id;
-                    DELETE FROM borrow_records WHERE id = borrow_id;
+                DECLARE v_existing INT;
+                DECLARE v_total INT;
+                DECLARE v_delta INT;
+                DECLARE v_quantity INT;
+                DECLARE i INT DEFAULT 0;
+
+                SELECT COUNT(*), SUM(quantity), SUM(borrow_delta) INTO v_existing, v_total, v_delta
+                FROM book_inventory_slots WHERE book_id = p_book_id FOR UPDATE;
+                SELECT MAX(quantity) INTO v_quantity FROM books WHERE id = p_book_id FOR UPDATE;
+
+                IF v_quantity IS NOT NULL THEN
+                    SET v_quantity = COALESCE(p_quantity, IF(v_existing > 0, v_total, v_quantity));
+                    UPDATE books SET quantity = v_quantity, active_borrow_count = active_borrow_count + COALESCE(v_delta, 0)
+                    WHERE id = p_book_id;
+                    DELETE FROM book_inventory_slots WHERE book_id = p_book_id;
+                    IF p_slots > 1 THEN
+                        WHILE i < p_slots DO
+                            INSERT INTO book_inventory_slots (book_id, slot, quantity)
+                            VALUES (p_book_id, i, FLOOR(v_quantity / p_slots) + IF(i < MOD(v_quantity, p_slots), 1, 0));
+                            SET i = i + 1;
+                        END WHILE;
+                    END IF;
                 END IF;
             END
             '''
-            cursor.execute(create_proc_return)
+            cursor.execute(create_proc_split)
 
-            # 单独执行触发器
+            # 单独执行触发器，借出数直接读取计数列，不再统计 borrow_records。
+            # 回放增量备份时直接删除行，计数列不会随之更新，回放脚本设置 @restoring_backup 跳过检查
             # 触发器 1
             cursor.execute("DROP TRIGGER IF EXISTS prevent_book_deletion")
             create_trigger1 = '''
@@ -82,11 +380,13 @@ def initialize_database():
             FOR EACH ROW
             BEGIN
                 DECLARE active_borrows INT DEFAULT 0;
-                SELECT COUNT(*) INTO active_borrows 
-                FROM borrow_records 
-                WHERE book_id = OLD.id;
-                IF active_borrows > 0 THEN
-                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '该图书有未归还记录，无法删除';
+                IF @restoring_backup IS NULL THEN
+                    SELECT OLD.active_borrow_count + COALESCE(SUM(borrow_delta), 0) INTO active_borrows
+                    FROM book_inventory_slots
+                    WHERE book_id = OLD.id;
+                    IF active_borrows > 0 THEN
+                        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '该图书有未归还记录，无法删除';
+                    END IF;
                 END IF;
             END
             '''
@@ -99,18 +399,23 @@ def initialize_database():
             BEFORE DELETE ON users
             FOR EACH ROW
             BEGIN
-                DECLARE active_borrow_count INT DEFAULT 0;
-                SELECT COUNT(*) INTO active_borrow_count 
-                FROM borrow_records 
-                WHERE user_id = OLD.id;
-                IF active_borrow_count > 0 THEN
+                IF OLD.active_borrow_count > 0 AND @restoring_backup IS NULL THEN
                     SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '用户有未归还的图书，请先处理借阅记录再删除';
                 END IF;
             END
             '''
             cursor.execute(create_trigger2)
 
+            apply_change_log_triggers(cursor)
+
             connection.commit()
+
+            # 按 borrow_records 补齐借出数和在借总数：新加的列为 0，已有数据库升级后需要对账
+            drift = reconcile_borrow_counts(connection)
+            rebuild_active_loans(cursor)
+            connection.commit()
+            if drift:
+                print(f"Reconciled {len(drift)} borrow counts.")
             print("Database initialized successfully.")
 
     except Error as e:
@@ -122,5 +427,254 @@ def initialize_database():
             connection.close()
             print("MySQL connection closed.")
 
+# ---------------------------------------------------------------------------
+# 大规模测试数据生成
+#
+#     python initialize_db.py seed --books 1000000 --users 200000 --borrows 5000000 --truncate
+#
+# 相同的 --seed 总是生成相同的数据。图书和用户的热度服从幂律分布（--skew 越大越集中），
+# 少数热门图书和重度借阅者占据大部分借阅记录；每个用户借阅的图书互不重复，与存储过程的约束一致。
+# 加载期间删除非外键所需的二级索引和变更日志触发器、关闭外键和唯一性检查，
+# 加载完成后按 schema.sql 重建索引和触发器。加载后 change_log 与数据不再对应，需要先做一次全量备份。
+# ---------------------------------------------------------------------------
+
+SEED_PASSWORD = 'user123'
+# 外键需要的索引在加载期间保留
+FOREIGN_KEY_INDEXES = {'idx_borrow_records_user_id', 'idx_borrow_records_book_id'}
+
+TITLE_PREFIXES = ['新编', '图解', '简明', '实用', '现代', '经典', '趣味', '中国', '世界', '少年',
+                  '深入浅出', '从零开始学', '漫话', '话说', '大众']
+TITLE_SUBJECTS = ['数据结构', '算法', '线性代数', '高等数学', '宋词', '唐诗', '红楼梦', '三国', '天文学',
+                  '经济学', '心理学', '哲学', '人工智能', '机器学习', '操作系统', '数据库', '编译原理',
+                  '量子力学', '植物学', '园艺', '烹饪', '摄影', '书法', '围棋', '中医', '法律', '历史', '地理']
+TITLE_SUFFIXES = ['导论', '教程', '入门', '精要', '手册', '讲义', '十讲', '百问', '通识', '研究', '史话',
+                  '故事', '图鉴', '习题集', '']
+
+
+def seed_title(rng):
+    title = f"{rng.choice(TITLE_PREFIXES)}{rng.choice(TITLE_SUBJECTS)}{rng.choice(TITLE_SUFFIXES)}"
+    if rng.random() < 0.3:
+        title += f"（第{rng.randint(1, 12)}版）"
+    return title
+
+
+class SkewedPicker:
+    """
+    从 1..n 中按幂律分布抽取 id：rank = n * random() ** skew 使小的 rank 更常被抽中，
+    再用 (a * rank + c) mod n 这一置换把热门 id 打散到整个范围，不需要在内存中保存置换表。
+    """
+
+    def __init__(self, n, skew, rng):
+        self.n = n
+        self.skew = skew
+        self.rng = rng
+        self.a = rng.randrange(1, n) if n > 1 else 1
+        while _gcd(self.a, n) != 1:
+            self.a = rng.randrange(1, n)
+        self.c = rng.randrange(n)
+
+    def id_of_rank(self, rank):
+        return (self.a * rank + self.c) % self.n + 1
+
+    def pick(self):
+        return self.id_of_rank(min(self.n - 1, int(self.n * self.rng.random() ** self.skew)))
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def generate_books(count, rng):
+    for book_id in range(1, count + 1):
+        # 库存多为个位数，少量为 0
+        yield book_id, seed_title(rng), rng.choice((0, 1, 1, 2, 2, 3, 3, 5, 5, 10))
+
+
+def generate_users(count):
+    password_hash = generate_hash(SEED_PASSWORD)
+    for user_id in range(1, count + 1):
+        yield user_id, f"reader{user_id:07d}", password_hash
+
+
+def borrow_counts(users, borrows, books, skew, rng):
+    """按用户的热度排名分配借阅数，总数约为 borrows，单个用户不超过图书总数的一半"""
+    exponent = 1 - 1 / skew if skew > 1 else 0
+    weights_total = sum((rank + 1) ** -exponent for rank in range(users))
+    cap = max(1, books // 2)
+    for rank in range(users):
+        expected = borrows * (rank + 1) ** -exponent / weights_total
+        count = int(expected) + (1 if rng.random() < expected - int(expected) else 0)
+        yield rank, min(count, cap)
+
+
+def generate_borrow_records(users, books, borrows, skew, rng):
+    user_picker = SkewedPicker(users, skew, rng)
+    book_picker = SkewedPicker(books, skew, rng)
+    record_id = 0
+    for rank, count in borrow_counts(users, borrows, books, skew, rng):
+        user_id = user_picker.id_of_rank(rank)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(book_picker.pick())
+        for book_id in sorted(chosen):
+            record_id += 1
+            yield record_id, user_id, book_id
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_insert(connection, cursor, table, columns, rows, batch_size):
+    """executemany 会把 INSERT 改写成多行 VALUES，每批一个事务"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    total = 0
+    for batch in _batches(rows, batch_size):
+        cursor.executemany(sql, batch)
+        connection.commit()
+        total += len(batch)
+    return total
+
+
+def bulk_load_file(connection, cursor, table, columns, rows):
+    """写入临时的制表符分隔文件后用 LOAD DATA LOCAL INFILE 一次加载"""
+    fd, path = tempfile.mkstemp(suffix=f'_{table}.tsv')
+    total = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+            for row in rows:
+                f.write('\t'.join(str(value) for value in row) + '\n')
+                total += 1
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+            (path,)
+        )
+        connection.commit()
+    finally:
+        os.remove(path)
+    return total
+
+
+def secondary_indexes():
+    """schema.sql 中定义的、加载期间可以删除的二级索引：[(索引名, 表名, 建索引语句)]"""
+    with open('schema.sql', 'r', encoding='utf-8') as file:
+        schema = file.read()
+    indexes = []
+    for match in re.finditer(r'CREATE\s+(?:FULLTEXT\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)[^;]*', schema, re.IGNORECASE):
+        if match.group(1) not in FOREIGN_KEY_INDEXES:
+            indexes.append((match.group(1), match.group(2), match.group(0)))
+    return indexes
+
+
+def existing_indexes(cursor):
+    cursor.execute(
+        "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def seed_database(books, users, borrows, skew=2.0, seed=42, method='insert', batch_size=5000, truncate=False):
+    connection = mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB,
+        allow_local_infile=(method == 'load')
+    )
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT (SELECT COUNT(*) FROM books) + (SELECT COUNT(*) FROM users) "
+                       "+ (SELECT COUNT(*) FROM borrow_records)")
+        if cursor.fetchone()[0] and not truncate:
+            print("books / users / borrow_records are not empty, use --truncate to replace them")
+            return False
+
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        if truncate:
+            for table in ('borrow_records', 'book_inventory_slots', 'book_circulation_stats', 'books', 'users',
+                          'circulation_counters', 'circulation_daily', 'circulation_snapshot', 'loan_events',
+                          'change_log'):
+                cursor.execute(f"TRUNCATE TABLE {table}")
+
+        drop_change_log_triggers(cursor)
+        indexes = [index for index in secondary_indexes() if index[0] in existing_indexes(cursor)]
+        for name, table, _ in indexes:
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}")
+        connection.commit()
+
+        # 每张表使用独立的随机序列，修改一张表的规模不影响其他表的内容
+        plans = (
+            ('books', ('id', 'title', 'quantity'), generate_books(books, random.Random(f"{seed}:books"))),
+            ('users', ('id', 'username', 'password_hash'), generate_users(users)),
+            ('borrow_records', ('id', 'user_id', 'book_id'),
+             generate_borrow_records(users, books, borrows, skew, random.Random(f"{seed}:borrows"))
+             if users and books else iter(())),
+        )
+        for table, columns, rows in plans:
+            start = time.perf_counter()
+            if method == 'load':
+                total = bulk_load_file(connection, cursor, table, columns, rows)
+            else:
+                total = bulk_insert(connection, cursor, table, columns, rows, batch_size)
+            print(f"{table}: {total} rows in {time.perf_counter() - start:.1f}s")
+
+        for name, table, statement in indexes:
+            start = time.perf_counter()
+            cursor.execute(statement)
+            print(f"Rebuilt index {name} on {table} in {time.perf_counter() - start:.1f}s")
+        # 借出数计数列按加载的借阅记录一次性计算
+        for table, column in (('books', 'book_id'), ('users', 'user_id')):
+            cursor.execute(f"""
+                UPDATE {table} t
+                JOIN (SELECT {column}, COUNT(*) AS n FROM borrow_records GROUP BY {column}) r ON r.{column} = t.id
+                SET t.active_borrow_count = r.n
+            """)
+        rebuild_active_loans(cursor)
+        apply_change_log_triggers(cursor)
+        connection.commit()
+        print("Seeding finished. change_log no longer matches the data, take a full backup before "
+              "relying on incremental backups.")
+        return True
+    finally:
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.execute("SET SESSION unique_checks = 1")
+        cursor.close()
+        connection.close()
+
+
+def seed_main(argv):
+    parser = argparse.ArgumentParser(prog='initialize_db.py seed', description='生成大规模测试数据')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--borrows', type=int, default=500000)
+    parser.add_argument('--skew', type=float, default=2.0, help='热度集中程度，1 为均匀分布')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--method', choices=('insert', 'load'), default='insert',
+                        help='insert: 多行 INSERT 分批提交；load: LOAD DATA LOCAL INFILE（需服务端开启 local_infile）')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--truncate', action='store_true', help='清空已有的图书、用户和借阅记录')
+    args = parser.parse_args(argv)
+    if args.skew < 1:
+        parser.error('--skew must be >= 1')
+    seed_database(args.books, args.users, args.borrows, args.skew, args.seed,
+                  args.method, args.batch_size, args.truncate)
+
+
 if __name__ == '__main__':
-    initialize_database()
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'seed':
+        seed_main(sys.argv[2:])
+    else:
+        initialize_database()
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+借阅历史：只追加的 loan_events 表。
+
+借还书存储过程在同一事务中为每次成功的借书 / 还书写入一条事件
+（borrow / return，管理员代办时为 admin_add / admin_remove），borrow_records 只保留在借的记录。
+
+loan_events 按 event_at 按月做 RANGE 分区（分区名 pYYYYMM，最后一个分区 p_future 兜底），
+主键为 (id, event_at)，没有外键。维护操作都是分区级的元数据操作，与分区内的行数无关。
+应用的后台线程（MaintenanceJob）定期执行 maintain，提前几个月拆出分区，保证 p_future 始终为空；
+也可以手动执行：
+
+    python loan_history.py maintain                 预建之后几个月的分区，并按保留期归档或删除旧分区
+    python loan_history.py archive --before 2024-01 把旧分区换出为独立的归档表
+    python loan_history.py drop --before 2024-01    直接删除旧分区
+
+历史查询总是带有时间范围，只扫描范围内的分区。
+"""
+import argparse
+import json
+import re
+import time
+import threading
+from datetime import date, datetime, timedelta
+
+from pagination import keyset_query, keyset_result
+
+TABLE = 'loan_events'
+# 多个 worker 同时维护时只有拿到这把锁的执行
+MAINTAIN_LOCK = 'loan_events_maintain'
+EVENT_TYPES = ('borrow', 'return', 'admin_add', 'admin_remove')
+_PARTITION = re.compile(r'^p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def parse_month(text):
+    """解析 YYYY-MM，返回该月第一天"""
+    return datetime.strptime(text, '%Y-%m').date()
+
+
+def month_partitions(cursor):
+    """已有的按月分区 {该月第一天: 分区名}，不含 p_future"""
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        (TABLE,)
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = _PARTITION.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def ensure_partitions(cursor, months_ahead=3, today=None):
+    """
+    从 p_future 中拆出当前月到之后 months_ahead 个月的分区，返回新建的分区名。
+    p_future 提前拆分时为空，REORGANIZE 只修改元数据；最早的分区同时容纳更早的事件。
+    """
+    current = month_start(today or date.today())
+    existing = month_partitions(cursor)
+    first = add_months(max(existing), 1) if existing else current
+    months = []
+    month = first
+    while month <= add_months(current, months_ahead):
+        months.append(month)
+        month = add_months(month, 1)
+    if not months:
+        return []
+    definitions = [
+        f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1).isoformat()}')"
+        for month in months
+    ]
+    definitions.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(f"ALTER TABLE {TABLE} REORGANIZE PARTITION p_future INTO ({', '.join(definitions)})")
+    return [partition_name(month) for month in months]
+
+
+def expired_partitions(cursor, before):
+    """所在月份早于 before（某月第一天）的分区名，按时间升序"""
+    return [name for month, name in sorted(month_partitions(cursor).items()) if month < before]
+
+
+def drop_partitions(cursor, before):
+    """删除 before 之前的分区及其中的事件，返回删除的分区名"""
+    names = expired_partitions(cursor, before)
+    if names:
+        cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(names)}")
+    return names
+
+
+def archive_partitions(cursor, before):
+    """
+    把 before 之前的每个分区与一张同结构的空表交换（EXCHANGE PARTITION，只交换表空间），
+    再删除已变空的分区。归档表名为 loan_events_archive_pYYYYMM，可单独导出后删除。
+    返回归档表名。
+    """
+    archived = []
+    for name in expired_partitions(cursor, before):
+        archive = f"{TABLE}_archive_{name}"
+        # 归档表已存在时报错，不会覆盖之前归档的数据
+        cursor.execute(f"CREATE TABLE {archive} LIKE {TABLE}")
+        cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE {TABLE} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+        cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {name}")
+        archived.append(archive)
+    return archived
+
+
+def history_query(user_id=None, book_id=None, start=None, end=None, event_type=None):
+    """
+    拼出历史查询的 SELECT 和条件，返回 (select_sql, conditions, params)。
+    start / end 为必填的时间范围 [start, end)，用于分区裁剪。
+    """
+    select_sql = f"""
+        SELECT e.id, e.event_at, e.event_type, e.user_id, u.username, e.book_id, b.title, e.borrow_id
+        FROM {TABLE} e
+        LEFT JOIN users u ON u.id = e.user_id
+        LEFT JOIN books b ON b.id = e.book_id
+    """
+    conditions = ["e.event_at >= %s", "e.event_at < %s"]
+    params = [start, end]
+    if user_id is not None:
+        conditions.append("e.user_id = %s")
+        params.append(user_id)
+    if book_id is not None:
+        conditions.append("e.book_id = %s")
+        params.append(book_id)
+    if event_type is not None:
+        conditions.append("e.event_type = %s")
+        params.append(event_type)
+    return select_sql, conditions, params
+
+
+def history_page(cursor, user_id=None, book_id=None, start=None, end=None, event_type=None,
+                 after=None, before=None, page_size=50):
+    """按用户 / 图书 / 事件类型和时间范围查询借阅历史，按 id 游标分页"""
+    select_sql, conditions, params = history_query(user_id, book_id, start, end, event_type)
+    query, params = keyset_query(select_sql, conditions, params, 'e.id', after, before, page_size)
+    cursor.execute(query, params)
+    return keyset_result(cursor.fetchall(), 'id', after, before, page_size)
+
+
+def parse_range(args, default_days=90, max_days=366):
+    """
+    从请求参数中解析 start / end（YYYY-MM-DD），缺省为最近 default_days 天；
+    范围超过 max_days 时截断，保证查询只落在少数几个分区上。不合法时抛出 ValueError。
+    """
+    end = args.get('end')
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else \
+        datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    start = args.get('start')
+    start = datetime.strptime(start, '%Y-%m-%d') if start else end - timedelta(days=default_days)
+    if start >= end:
+        raise ValueError("start 必须早于 end")
+    return max(start, end - timedelta(days=max_days)), end
+
+
+def maintain(cursor, months_ahead=3, retention_months=24, archive=True, today=None):
+    """预建分区，并归档（或删除）超过保留期的分区"""
+    created = ensure_partitions(cursor, months_ahead, today)
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    if archive:
+        removed = archive_partitions(cursor, cutoff)
+    else:
+        removed = drop_partitions(cursor, cutoff)
+    return {'created': created, 'archived' if archive else 'dropped': removed}
+
+
+def maintain_once(connection, months_ahead=3, retention_months=24, archive=True):
+    """用 GET_LOCK 串行化的 maintain()，其他连接正在维护时跳过，返回 None"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (MAINTAIN_LOCK,))
+        if not cursor.fetchone()[0]:
+            return None
+        try:
+            return maintain(cursor, months_ahead, retention_months, archive)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MAINTAIN_LOCK,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+class MaintenanceJob:
+    """后台线程，每 interval 秒执行一次 job()（维护借阅历史的分区），首次调用 start() 时启动"""
+
+    def __init__(self, job, interval=86400):
+        self.job = job
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # fork 后线程不会被继承，is_alive() 为 False 时重新启动
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='loan-history-maintain', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.job()
+            except Exception as e:
+                print(f"Loan history maintenance failed: {e}")
+            time.sleep(self.interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='借阅历史分区维护')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('maintain', help='预建分区并按 LOAN_EVENTS_RETENTION_MONTHS 归档或删除旧分区')
+    for command in ('archive', 'drop'):
+        sub = commands.add_parser(command)
+        sub.add_argument('--before', required=True, type=parse_month, help='YYYY-MM，处理该月之前的分区')
+    args = parser.parse_args()
+
+    # 只依赖配置和数据库驱动，不加载 Flask 应用
+    import mysql.connector
+    from config import Config
+
+    connection = mysql.connector.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB
+    )
+    try:
+        if args.command == 'maintain':
+            result = maintain_once(connection,
+                                   months_ahead=Config.LOAN_EVENTS_PARTITIONS_AHEAD,
+                                   retention_months=Config.LOAN_EVENTS_RETENTION_MONTHS,
+                                   archive=Config.LOAN_EVENTS_ARCHIVE)
+            if result is None:
+                result = {'skipped': '另一个连接正在维护借阅历史分区'}
+        else:
+            cursor = connection.cursor()
+            try:
+                if args.command == 'archive':
+                    result = {'archived': archive_partitions(cursor, args.before)}
+                else:
+                    result = {'dropped': drop_partitions(cursor, args.before)}
+            finally:
+                cursor.close()
+    finally:
+        connection.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
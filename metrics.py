@@ -0,0 +1,246 @@
+"""
+进程内指标收集，以 Prometheus 文本格式导出。
+
+指标只在本进程内累计；gunicorn 等多进程部署时每个 worker 各自导出，
+由 Prometheus 按实例区分后再聚合。记录一次观测只需要一次加锁和一次二分查找。
+"""
+import re
+import time
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可以直接 set，也可以传入 callback 在导出时读取当前值（返回 {标签元组: 值}）"""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            values = self.callback()
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各个桶的计数（非累计）、总和、总数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_STATEMENT = re.compile(
+    r'^\s*(?:/\*.*?\*/\s*)?(?P<verb>\w+)'
+    r'(?:.*?\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(?P<table>\w+)`?)?',
+    re.IGNORECASE | re.DOTALL
+)
+_CALL = re.compile(r'^\s*CALL\s+`?(?P<name>\w+)`?', re.IGNORECASE)
+
+
+def statement_tag(sql):
+    """
+    把 SQL 归一化为低基数的标签，如 "CALL borrow_books_batch"、"SELECT borrow_record_view"、
+    "UPDATE books"，用于按语句统计数据库耗时。
+    """
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', 'replace')
+    match = _CALL.match(sql)
+    if match:
+        return f"CALL {match.group('name')}"
+    match = _STATEMENT.match(sql)
+    if not match:
+        return 'OTHER'
+    verb = match.group('verb').upper()
+    if verb == 'UPDATE':
+        table = re.match(r'^\s*UPDATE\s+`?(\w+)', sql, re.IGNORECASE)
+        return f"UPDATE {table.group(1)}" if table else verb
+    return f"{verb} {match.group('table')}" if match.group('table') else verb
+
+
+class DatabaseInstrument:
+    """连接池的观测钩子：记录借出连接的等待时间、每条语句的耗时和存储过程报错"""
+
+    def __init__(self, registry, profile_source=None):
+        # profile_source() 返回当前请求的性能剖析对象（未开启时为 None）
+        self.profile_source = profile_source
+        self.acquire = registry.histogram(
+            'db_connection_acquire_seconds', 'Time spent waiting for a pooled connection')
+        self.query = registry.histogram(
+            'db_query_duration_seconds', 'Database time per statement', ('statement',))
+        self.errors = registry.counter(
+            'db_query_errors_total', 'Failed statements by SQLSTATE', ('statement', 'sqlstate'))
+        self.signals = registry.counter(
+            'db_procedure_signals_total',
+            "Business rule errors raised with SIGNAL SQLSTATE '45000'", ('statement', 'message'))
+
+    def wrap_cursor(self, cursor):
+        if self.profile_source is not None:
+            profile = self.profile_source()
+            if profile is not None:
+                return profile.wrap_cursor(cursor, self)
+        return InstrumentedCursor(cursor, self)
+
+    def observe_checkout(self, seconds):
+        self.acquire.observe(seconds)
+
+    def observe_query(self, sql, seconds, error=None):
+        tag = statement_tag(sql)
+        self.query.observe(seconds, statement=tag)
+        if error is not None:
+            sqlstate = getattr(error, 'sqlstate', None) or 'unknown'
+            self.errors.inc(statement=tag, sqlstate=sqlstate)
+            if sqlstate == '45000':
+                self.signals.inc(statement=tag, message=getattr(error, 'msg', str(error)))
+
+
+class InstrumentedCursor:
+    """包装 mysql.connector 游标，记录 execute / executemany / callproc 的耗时"""
+
+    def __init__(self, cursor, instrument):
+        self._cursor = cursor
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, sql, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            self._record(sql, time.perf_counter() - start, e)
+            raise
+        self._record(sql, time.perf_counter() - start)
+        return result
+
+    def _record(self, sql, seconds, error=None):
+        self._instrument.observe_query(sql, seconds, error)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(operation, self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(operation, self._cursor.executemany, operation, *args, **kwargs)
+
+    def callproc(self, procname, *args, **kwargs):
+        return self._timed(f"CALL {procname}", self._cursor.callproc, procname, *args, **kwargs)
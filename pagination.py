@@ -0,0 +1,80 @@
+class Page:
+    """一页查询结果；next_cursor / prev_cursor 为 None 表示没有下一页 / 上一页"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, page_size=20):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.page_size = page_size
+
+    def to_dict(self):
+        return {
+            'items': self.items,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'page_size': self.page_size,
+        }
+
+
+def parse_page_args(args, default_page_size=20, max_page_size=100):
+    """从请求参数中解析 after / before / page_size，非法值按缺省处理"""
+    def to_int(name):
+        try:
+            return int(args.get(name))
+        except (TypeError, ValueError):
+            return None
+
+    page_size = to_int('page_size') or default_page_size
+    page_size = max(1, min(page_size, max_page_size))
+    return to_int('after'), to_int('before'), page_size
+
+
+def keyset_query(select_sql, conditions, params, key_column, after=None, before=None, page_size=20):
+    """拼出 keyset_page 的查询语句，返回 (query, params)；异步模式下由调用方自行执行"""
+    conditions = list(conditions)
+    params = list(params)
+    if after is not None:
+        conditions.append(f"{key_column} > %s")
+        params.append(after)
+    if before is not None:
+        conditions.append(f"{key_column} < %s")
+        params.append(before)
+
+    query = select_sql
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    # 向前翻页时倒序取，再翻转回升序
+    query += f" ORDER BY {key_column} {'DESC' if before is not None else 'ASC'} LIMIT %s"
+    params.append(page_size + 1)
+    return query, params
+
+
+def keyset_result(rows, key_field, after=None, before=None, page_size=20):
+    """把 keyset_query 取回的 page_size + 1 行整理成 Page"""
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before is not None:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if before is not None or has_more:
+            next_cursor = rows[-1][key_field]
+        if after is not None or (before is not None and has_more):
+            prev_cursor = rows[0][key_field]
+    return Page(rows, next_cursor, prev_cursor, page_size)
+
+
+def keyset_page(cursor, select_sql, conditions, params, key_column, key_field,
+                after=None, before=None, page_size=20):
+    """
+    基于键值（通常是自增 id）的游标分页：用 key > after / key < before 代替 OFFSET，
+    每一页都只沿索引读取 page_size + 1 行，与总行数和页码无关。
+
+    select_sql 为不含 WHERE / ORDER BY 的查询，conditions 为额外的 WHERE 条件列表，
+    key_column 是 SQL 中的排序列（如 b.id），key_field 是结果行中对应的字段名。
+    """
+    query, params = keyset_query(select_sql, conditions, params, key_column, after, before, page_size)
+    cursor.execute(query, params)
+    return keyset_result(cursor.fetchall(), key_field, after, before, page_size)
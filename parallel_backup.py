@@ -0,0 +1,422 @@
+"""
+并行逐表备份 / 还原。
+
+与 backup_database() 生成的单个 mysqldump 文件不同，这里把每张表按主键首列的取值范围
+切成多个分块，由多个共享同一一致性快照的连接并发导出；还原时用多个连接并发导入，
+并把二级索引和外键检查推迟到数据导入之后，适合 borrow_records、loan_events 很大、
+需要尽快恢复的场景。主键首列不是整数的表整表导出，按 --chunk-rows 行切分文件。
+
+目录结构（backup/parallel_YYYYmmdd_HHMMSS/）：
+    schema_pre.sql.gz    表结构与视图（不含触发器）
+    schema_post.sql.gz   触发器、存储过程与事件，数据导入完成后再创建
+    <table>.<n>.<m>.sql.gz  第 n 个取值范围的第 m 个文件，每行一条多值 INSERT
+    manifest.json        分块列表、行数、sha256 以及导出耗时
+
+用法：
+    python parallel_backup.py dump [--workers 4] [--chunk-rows 50000]
+    python parallel_backup.py restore parallel_20240101_000000 [--workers 4]
+"""
+import os
+import io
+import json
+import time
+import queue
+import argparse
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from config import Config
+from backup_util import open_backup, file_sha256, sql_literal, CHUNK_SIZE
+
+# 每条 INSERT 语句包含的行数，也是每次 fetchmany 取回的行数
+ROWS_PER_INSERT = 1000
+# 可以按取值范围分块的主键首列类型
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'bigint'}
+
+
+def _connect(config):
+    # 导出 / 导入使用独立连接，不占用应用的连接池
+    return mysql.connector.connect(
+        host=config['MYSQL_HOST'],
+        user=config['MYSQL_USER'],
+        password=config['MYSQL_PASSWORD'],
+        database=config['MYSQL_DB']
+    )
+
+
+def _client_args(config, program):
+    return [
+        program,
+        f"-h{config['MYSQL_HOST']}",
+        f"-u{config['MYSQL_USER']}",
+        f"-p{config['MYSQL_PASSWORD']}",
+    ]
+
+
+def _dump_schema(config, filepath, options):
+    command = _client_args(config, 'mysqldump') + options + [config['MYSQL_DB']]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        with open_backup(filepath, 'wb') as out:
+            for chunk in iter(lambda: process.stdout.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command[0])
+
+
+def _pipe_into_mysql(config, filepath):
+    command = _client_args(config, 'mysql') + [config['MYSQL_DB']]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        with open_backup(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                process.stdin.write(chunk)
+    finally:
+        process.stdin.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command[0])
+
+
+def _list_tables(cursor, db_name):
+    """返回 [(表名, 整型主键首列名或 None)]，复合主键（如 loan_events 的 (id, event_at)）取首列"""
+    cursor.execute(
+        """
+        SELECT t.table_name, k.column_name, c.data_type
+        FROM information_schema.tables t
+        LEFT JOIN information_schema.key_column_usage k
+          ON k.table_schema = t.table_schema AND k.table_name = t.table_name
+         AND k.constraint_name = 'PRIMARY' AND k.ordinal_position = 1
+        LEFT JOIN information_schema.columns c
+          ON c.table_schema = k.table_schema AND c.table_name = k.table_name AND c.column_name = k.column_name
+        WHERE t.table_schema = %s AND t.table_type = 'BASE TABLE'
+        ORDER BY t.table_name
+        """,
+        (db_name,)
+    )
+    tables = []
+    for table, column, data_type in cursor.fetchall():
+        tables.append((table, column if data_type and data_type.lower() in INTEGER_TYPES else None))
+    return tables
+
+
+def _plan_ranges(cursor, table, pk, chunk_rows):
+    """
+    把表按主键首列切成宽度为 chunk_rows 的左闭右开区间 [(lo, hi)]；没有整型主键首列时返回 [None]，
+    表示整表导出。自增主键的每个区间约有 chunk_rows 行；首列不唯一时（如 book_inventory_slots）
+    同一取值的行总在同一个区间内。
+    """
+    if pk is None:
+        return [None]
+    cursor.execute(f"SELECT MIN(`{pk}`), MAX(`{pk}`) FROM `{table}`")
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+    return [(lo, lo + chunk_rows) for lo in range(int(low), int(high) + 1, chunk_rows)]
+
+
+def _write_insert(f, table, columns, rows):
+    column_list = ', '.join(f'`{c}`' for c in columns)
+    values = ', '.join('(' + ', '.join(sql_literal(v) for v in row) + ')' for row in rows)
+    f.write(f"INSERT INTO `{table}` ({column_list}) VALUES {values};\n")
+
+
+def _chunk_info(filename, filepath, rows):
+    return {
+        'file': filename,
+        'rows': rows,
+        'size': os.path.getsize(filepath),
+        'sha256': file_sha256(filepath),
+    }
+
+
+def _dump_range(connection, table, pk, bounds, number, out_dir, chunk_rows):
+    """
+    在已开启一致性快照的连接上导出一个区间（bounds 为 None 时整表），返回分块列表。
+    用 fetchmany 流式读取，每 chunk_rows 行换一个文件，内存占用与区间大小无关。
+    """
+    cursor = connection.cursor()
+    if bounds is None:
+        cursor.execute(f"SELECT * FROM `{table}`")
+    else:
+        cursor.execute(f"SELECT * FROM `{table}` WHERE `{pk}` >= %s AND `{pk}` < %s", bounds)
+    columns = [d[0] for d in cursor.description]
+    chunks = []
+    f = filename = filepath = None
+    file_rows = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(ROWS_PER_INSERT)
+            if not rows:
+                break
+            if f is None or file_rows >= chunk_rows:
+                if f is not None:
+                    f.close()
+                    chunks.append(_chunk_info(filename, filepath, file_rows))
+                filename = f"{table}.{number:05d}.{len(chunks) + 1:03d}.sql.gz"
+                filepath = os.path.join(out_dir, filename)
+                f = io.TextIOWrapper(open_backup(filepath, 'wb'), encoding='utf-8')
+                file_rows = 0
+            _write_insert(f, table, columns, rows)
+            file_rows += len(rows)
+    finally:
+        if f is not None:
+            f.close()
+        cursor.close()
+    if f is not None:
+        chunks.append(_chunk_info(filename, filepath, file_rows))
+    return chunks
+
+
+def parallel_dump(config, backup_dir, workers=4, chunk_rows=50000):
+    """并发导出所有表，返回输出目录名与每张表的吞吐报告"""
+    name = f"parallel_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    out_dir = os.path.join(backup_dir, name)
+    os.makedirs(out_dir)
+    start = time.monotonic()
+
+    _dump_schema(config, os.path.join(out_dir, 'schema_pre.sql.gz'),
+                 ['--no-data', '--skip-triggers'])
+    _dump_schema(config, os.path.join(out_dir, 'schema_post.sql.gz'),
+                 ['--no-data', '--no-create-info', '--triggers', '--routines', '--events'])
+
+    coordinator = _connect(config)
+    cursor = coordinator.cursor()
+    tables = _list_tables(cursor, config['MYSQL_DB'])
+
+    # 短暂加全局读锁，让每个工作连接在同一时刻开启一致性快照，
+    # 这样各表之间的数据互相对应（与 mysqldump --single-transaction 等价）
+    connections = [_connect(config) for _ in range(max(workers, 1))]
+    locked = False
+    try:
+        cursor.execute("FLUSH TABLES WITH READ LOCK")
+        locked = True
+    except mysql.connector.Error as e:
+        print(f"Warning: FLUSH TABLES WITH READ LOCK failed, tables may be inconsistent: {e}")
+    try:
+        for connection in connections:
+            connection.start_transaction(
+                consistent_snapshot=True, isolation_level='REPEATABLE READ', readonly=True
+            )
+    finally:
+        if locked:
+            cursor.execute("UNLOCK TABLES")
+        cursor.close()
+        coordinator.close()
+
+    # 各连接的快照是同一时刻开启的，同一张表的不同区间可以由不同连接导出
+    jobs = queue.Queue()
+    planner = connections[0].cursor()
+    for table, pk in tables:
+        for number, bounds in enumerate(_plan_ranges(planner, table, pk, chunk_rows), 1):
+            jobs.put((table, pk, bounds, number))
+    planner.close()
+
+    def run(index):
+        connection = connections[index]
+        done = []
+        try:
+            while True:
+                try:
+                    table, pk, bounds, number = jobs.get_nowait()
+                except queue.Empty:
+                    return done
+                job_start = time.monotonic()
+                chunks = _dump_range(connection, table, pk, bounds, number, out_dir, chunk_rows)
+                done.append((table, number, chunks, time.monotonic() - job_start))
+        finally:
+            connection.rollback()
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        finished = [job for batch in executor.map(run, range(len(connections))) for job in batch]
+
+    # 按表汇总；seconds 是各区间耗时之和，即单连接下的等效耗时
+    by_table = {table: {'chunks': [], 'seconds': 0.0} for table, _ in tables}
+    for table, number, chunks, seconds in sorted(finished, key=lambda job: job[:2]):
+        by_table[table]['chunks'].extend(chunks)
+        by_table[table]['seconds'] += seconds
+    results = []
+    for table, item in by_table.items():
+        rows = sum(c['rows'] for c in item['chunks'])
+        seconds = item['seconds']
+        results.append({
+            'table': table,
+            'rows': rows,
+            'bytes': sum(c['size'] for c in item['chunks']),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 1) if seconds else None,
+            'chunks': item['chunks'],
+        })
+
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'consistent': locked,
+        'seconds': round(time.monotonic() - start, 3),
+        'tables': results,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return name, manifest
+
+
+def _deferrable_indexes(cursor, db_name):
+    """
+    找出可以在导入期间删除、导入后重建的二级索引。
+    外键列开头的索引保留（InnoDB 要求外键列上有索引），FULLTEXT 等特殊索引也保留。
+    """
+    cursor.execute(
+        """
+        SELECT s.table_name, s.index_name, s.non_unique, s.index_type,
+               GROUP_CONCAT(s.column_name ORDER BY s.seq_in_index) AS columns
+        FROM information_schema.statistics s
+        WHERE s.table_schema = %s AND s.index_name <> 'PRIMARY'
+        GROUP BY s.table_name, s.index_name, s.non_unique, s.index_type
+        """,
+        (db_name,)
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT table_name, column_name FROM information_schema.key_column_usage
+        WHERE table_schema = %s AND referenced_table_name IS NOT NULL
+        """,
+        (db_name,)
+    )
+    fk_columns = {(table, column) for table, column in cursor.fetchall()}
+
+    deferred = {}
+    for table, index, non_unique, index_type, columns in indexes:
+        columns = columns.split(',')
+        if index_type != 'BTREE' or (table, columns[0]) in fk_columns:
+            continue
+        deferred.setdefault(table, []).append((index, int(non_unique), columns))
+    return deferred
+
+
+def _load_chunk(config, table, filepath):
+    connection = _connect(config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        with io.TextIOWrapper(open_backup(filepath, 'rb'), encoding='utf-8') as f:
+            for statement in f:
+                if statement.strip():
+                    cursor.execute(statement)
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def parallel_restore(config, backup_dir, name, workers=4):
+    """并发还原 parallel_dump 生成的目录，返回每张表的吞吐报告"""
+    in_dir = os.path.join(backup_dir, name)
+    with open(os.path.join(in_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    # 先校验所有分块，避免导入到一半才发现文件损坏
+    for table in manifest['tables']:
+        for chunk in table['chunks']:
+            if file_sha256(os.path.join(in_dir, chunk['file'])) != chunk['sha256']:
+                raise ValueError(f"Checksum mismatch for chunk: {chunk['file']}")
+
+    start = time.monotonic()
+    _pipe_into_mysql(config, os.path.join(in_dir, 'schema_pre.sql.gz'))
+
+    # 删除可推迟的二级索引
+    connection = _connect(config)
+    cursor = connection.cursor()
+    deferred = _deferrable_indexes(cursor, config['MYSQL_DB'])
+    for table, indexes in deferred.items():
+        drops = ', '.join(f"DROP INDEX `{index}`" for index, _, _ in indexes)
+        cursor.execute(f"ALTER TABLE `{table}` {drops}")
+    cursor.close()
+    connection.close()
+
+    # 所有分块放进同一个线程池，较大的表自然会占用更多连接
+    table_stats = {t['table']: {'rows': t['rows'], 'bytes': t['bytes'], 'load_seconds': 0.0}
+                   for t in manifest['tables']}
+    jobs = [(t['table'], os.path.join(in_dir, c['file']))
+            for t in manifest['tables'] for c in t['chunks']]
+    jobs.sort(key=lambda job: -os.path.getsize(job[1]))
+
+    def load(job):
+        chunk_start = time.monotonic()
+        _load_chunk(config, *job)
+        return job[0], time.monotonic() - chunk_start
+
+    load_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for table, seconds in executor.map(load, jobs):
+            table_stats[table]['load_seconds'] += seconds
+    load_seconds = time.monotonic() - load_start
+
+    # 每张表用一条 ALTER 一次性重建全部索引，各表并行
+    def rebuild(item):
+        table, indexes = item
+        index_start = time.monotonic()
+        adds = ', '.join(
+            f"ADD {'INDEX' if non_unique else 'UNIQUE INDEX'} `{index}` ("
+            + ', '.join(f'`{c}`' for c in columns) + ')'
+            for index, non_unique, columns in indexes
+        )
+        rebuild_connection = _connect(config)
+        try:
+            rebuild_connection.cursor().execute(f"ALTER TABLE `{table}` {adds}")
+        finally:
+            rebuild_connection.close()
+        return table, time.monotonic() - index_start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for table, seconds in executor.map(rebuild, deferred.items()):
+            table_stats.setdefault(table, {'rows': 0, 'bytes': 0, 'load_seconds': 0.0})
+            table_stats[table]['index_seconds'] = round(seconds, 3)
+
+    _pipe_into_mysql(config, os.path.join(in_dir, 'schema_post.sql.gz'))
+
+    for stats in table_stats.values():
+        # load_seconds 是各分块耗时之和，即单连接下的等效耗时
+        stats['rows_per_second'] = (
+            round(stats['rows'] / stats['load_seconds'], 1) if stats['load_seconds'] else None
+        )
+        stats['load_seconds'] = round(stats['load_seconds'], 3)
+    return {
+        'name': name,
+        'seconds': round(time.monotonic() - start, 3),
+        'load_seconds': round(load_seconds, 3),
+        'tables': table_stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='并行逐表备份 / 还原')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump')
+    dump_parser.add_argument('--workers', type=int, default=4)
+    dump_parser.add_argument('--chunk-rows', type=int, default=50000)
+    restore_parser = subparsers.add_parser('restore')
+    restore_parser.add_argument('name')
+    restore_parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    backup_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backup')
+    if args.command == 'dump':
+        name, manifest = parallel_dump(config, backup_dir, args.workers, args.chunk_rows)
+        report = {
+            'name': name,
+            'seconds': manifest['seconds'],
+            'tables': {t['table']: {k: t[k] for k in ('rows', 'bytes', 'seconds', 'rows_per_second')}
+                       for t in manifest['tables']},
+        }
+    else:
+        report = parallel_restore(config, backup_dir, args.name, args.workers)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
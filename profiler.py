@@ -0,0 +1,166 @@
+"""
+按请求开启的性能剖析。
+
+管理员在请求中带上 X-Profile 头或 _profile 参数即可对这一个请求开启剖析：
+
+    inline  用 JSON 报告替换原响应
+    save    （或 1）正常返回页面，报告写入 PROFILE_DIR，文件名放在 X-Profile-Report 响应头中
+
+报告包含 cProfile 按累计耗时排序的热点函数，以及本请求执行的每条 SQL 的耗时和
+读取行数，并标出重复执行（疑似 N+1）和没有 LIMIT 的大结果集查询。
+未开启时只在创建游标时多一次线程局部变量的读取。
+"""
+import io
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from metrics import InstrumentedCursor, statement_tag
+
+_local = threading.local()
+# 同一时间只能有一个 cProfile 处于开启状态（Python 3.12 起重复开启会抛出 ValueError），
+# 已有请求在剖析时其他请求跳过剖析、正常处理
+_active = threading.Lock()
+
+
+def current():
+    """当前线程正在剖析的请求，未开启时返回 None"""
+    return getattr(_local, 'profile', None)
+
+
+def requested_mode(request):
+    """从请求头或参数中读取剖析模式，没有请求剖析时返回 None"""
+    value = (request.headers.get('X-Profile') or request.args.get('_profile') or '').strip().lower()
+    if not value:
+        return None
+    return 'inline' if value == 'inline' else 'save'
+
+
+def normalize_sql(sql):
+    """去掉字面量和多余空白，用于识别同一条语句的重复执行"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', 'replace')
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    sql = re.sub(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class ProfilingCursor(InstrumentedCursor):
+    """在记录指标的同时，把每条语句的耗时和读取的行数写入剖析报告"""
+
+    def __init__(self, cursor, instrument, profile):
+        super().__init__(cursor, instrument)
+        self._profile = profile
+        self._entry = None
+
+    def _record(self, sql, seconds, error=None):
+        super()._record(sql, seconds, error)
+        self._entry = self._profile.add_query(sql, seconds, error)
+
+    def _count(self, rows):
+        if self._entry is not None and rows is not None:
+            self._entry['rows'] += len(rows) if isinstance(rows, list) else 1
+        return rows
+
+    def fetchone(self, *args, **kwargs):
+        return self._count(self._cursor.fetchone(*args, **kwargs))
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self, *args, **kwargs):
+        return self._count(self._cursor.fetchall(*args, **kwargs))
+
+
+class RequestProfile:
+    def __init__(self, mode, repeat_threshold=5, unbounded_rows=1000, top=30):
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+        self.unbounded_rows = unbounded_rows
+        self.top = top
+        self.queries = []
+        self._profiler = cProfile.Profile()
+        self._start = None
+        self.duration = None
+
+    def wrap_cursor(self, cursor, instrument):
+        return ProfilingCursor(cursor, instrument, self)
+
+    def add_query(self, sql, seconds, error=None):
+        if isinstance(sql, (bytes, bytearray)):
+            sql = sql.decode('utf-8', 'replace')
+        entry = {
+            'statement': statement_tag(sql),
+            'sql': re.sub(r'\s+', ' ', sql).strip(),
+            'seconds': round(seconds, 6),
+            'rows': 0,
+            'error': str(error) if error is not None else None,
+        }
+        self.queries.append(entry)
+        return entry
+
+    def start(self):
+        """开启剖析；已有其他剖析在进行时返回 False，本请求不剖析"""
+        if not _active.acquire(blocking=False):
+            return False
+        try:
+            self._profiler.enable()
+        except ValueError:
+            # 进程中还有其他剖析工具在运行
+            _active.release()
+            return False
+        _local.profile = self
+        self._start = time.perf_counter()
+        return True
+
+    def stop(self):
+        self._profiler.disable()
+        self.duration = time.perf_counter() - self._start
+        _local.profile = None
+        _active.release()
+
+    def _warnings(self):
+        warnings = []
+        counts = Counter(normalize_sql(q['sql']) for q in self.queries)
+        for sql, count in counts.items():
+            if count >= self.repeat_threshold:
+                warnings.append({'type': 'repeated', 'count': count, 'sql': sql,
+                                 'hint': '同一语句在一次请求中重复执行，考虑合并为一次查询（N+1）'})
+        for q in self.queries:
+            if not q['sql'].upper().startswith('SELECT') or re.search(r'\bLIMIT\b', q['sql'], re.I):
+                continue
+            if q['rows'] >= self.unbounded_rows or not re.search(r'\bWHERE\b', q['sql'], re.I):
+                warnings.append({'type': 'unbounded', 'rows': q['rows'], 'sql': q['sql'],
+                                 'hint': '查询没有 LIMIT，结果集随数据量增长'})
+        return warnings
+
+    def report(self, request):
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        return {
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint,
+            'duration': round(self.duration, 6),
+            'sql_time': round(sum(q['seconds'] for q in self.queries), 6),
+            'query_count': len(self.queries),
+            'queries': self.queries,
+            'warnings': self._warnings(),
+            'profile': stream.getvalue(),
+        }
+
+    def save(self, report, directory):
+        os.makedirs(directory, exist_ok=True)
+        endpoint = report['endpoint'] or 'unknown'
+        filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{endpoint}.json"
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return filename
@@ -2,7 +2,9 @@
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTO_INCREMENT,
     username VARCHAR(255) NOT NULL UNIQUE,
-    password_hash VARCHAR(255) NOT NULL
+    password_hash VARCHAR(255) NOT NULL,
+    -- 当前借出未还的图书数，由借还书存储过程维护
+    active_borrow_count INTEGER NOT NULL DEFAULT 0
 );
 
 -- 创建管理员表
@@ -17,7 +19,9 @@ CREATE TABLE IF NOT EXISTS books (
     id INTEGER PRIMARY KEY AUTO_INCREMENT,
     title VARCHAR(255) NOT NULL,
     image_filename VARCHAR(255),
-    quantity INTEGER NOT NULL DEFAULT 0
+    quantity INTEGER NOT NULL DEFAULT 0,
+    -- 当前借出未还的数量，由借还书存储过程维护；拆分库存的图书还需加上各分片的 borrow_delta
+    active_borrow_count INTEGER NOT NULL DEFAULT 0
 );
 
 -- 创建借阅记录表
@@ -29,10 +33,81 @@ CREATE TABLE IF NOT EXISTS borrow_records (
     FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
 );
 
+-- 热门图书的拆分库存：借书时锁定任一有余量的分片，books.quantity 为各分片之和的镜像；
+-- 借还时不锁 books 行，借出数的变化记在分片的 borrow_delta 上，重新拆分时合并到 books.active_borrow_count
+CREATE TABLE IF NOT EXISTS book_inventory_slots (
+    book_id INTEGER NOT NULL,
+    slot SMALLINT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    borrow_delta INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (book_id, slot),
+    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+);
+
+-- 借阅统计：借还书存储过程在事务末尾累加，每个计数拆成 16 个分片（按连接号取模），
+-- 并发借还不争用同一行；读取时对分片求和
+CREATE TABLE IF NOT EXISTS circulation_counters (
+    name VARCHAR(32) NOT NULL,
+    shard TINYINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+-- 每日借还次数，分片方式同上
+CREATE TABLE IF NOT EXISTS circulation_daily (
+    day DATE NOT NULL,
+    shard TINYINT NOT NULL,
+    borrows INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, shard)
+);
+
+-- 每本书的累计借阅次数，借书时在已持有的图书行 / 分片锁下更新：未拆分的图书为分片 0，拆分库存的图书为分片号 + 1
+CREATE TABLE IF NOT EXISTS book_circulation_stats (
+    book_id INTEGER NOT NULL,
+    shard SMALLINT NOT NULL,
+    borrows BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (book_id, shard),
+    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+);
+
+-- 定期汇总的统计快照（热门图书、库存、用户借阅分布等），管理员主页直接读取
+CREATE TABLE IF NOT EXISTS circulation_snapshot (
+    name VARCHAR(32) PRIMARY KEY,
+    value JSON NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 借阅历史：借还书存储过程写入的只追加事件，borrow_records 只保留在借的记录。
+-- 按 event_at 按月分区，主键须包含分区列；分区由 loan_history.py 预建、归档和删除，不设外键
+CREATE TABLE IF NOT EXISTS loan_events (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    event_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    event_type ENUM('borrow', 'return', 'admin_add', 'admin_remove') NOT NULL,
+    user_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    borrow_id INTEGER,
+    PRIMARY KEY (id, event_at),
+    KEY idx_loan_events_user (user_id, event_at),
+    KEY idx_loan_events_book (book_id, event_at)
+) PARTITION BY RANGE COLUMNS (event_at) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- 数据变更日志，由触发器写入，用于增量备份
+CREATE TABLE IF NOT EXISTS change_log (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    table_name VARCHAR(64) NOT NULL,
+    row_id INTEGER NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE INDEX idx_borrow_records_user_id ON borrow_records(user_id);
 CREATE INDEX idx_borrow_records_book_id ON borrow_records(book_id);
 CREATE INDEX idx_borrow_records_user_book ON borrow_records(user_id, book_id);
 CREATE INDEX idx_books_title ON books(title);
+-- 书名全文索引，ngram 分词以支持中文检索
+CREATE FULLTEXT INDEX ft_books_title ON books(title) WITH PARSER ngram;
 CREATE INDEX idx_books_quantity ON books(quantity);
 CREATE INDEX idx_borrow_user_time ON borrow_records(user_id, id);
 CREATE INDEX idx_borrow_book_time ON borrow_records(book_id, id);
@@ -62,21 +137,8 @@ JOIN borrow_records br ON u.id = br.user_id
 JOIN books b ON br.book_id = b.id;
 -- 用户已借阅的书籍视图
 
-CREATE OR REPLACE VIEW available_books_per_user_view AS
-SELECT
-    u.id AS user_id,
-    b.id AS book_id,
-    b.title,
-    b.image_filename,
-    b.quantity
-FROM users u
-CROSS JOIN books b
-WHERE b.quantity > 0
-  AND NOT EXISTS (
-      SELECT 1 FROM borrow_records br
-      WHERE br.book_id = b.id AND br.user_id = u.id
-  );
--- 用户可借阅的书籍视图
+-- 可借阅图书不再使用 users CROSS JOIN books 的视图，改由 catalog.py 中的反连接查询实现
+DROP VIEW IF EXISTS available_books_per_user_view;
 
 -- 插入用户的占位语句
 INSERT INTO users (username, password_hash) VALUES
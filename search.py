@@ -0,0 +1,96 @@
+"""
+图书全文检索。
+
+books.title 上建有 ngram 分词的 FULLTEXT 索引 ft_books_title（见 schema.sql），
+中文书名按 ngram_token_size（默认 2）切分，标题中任意连续片段都能命中。
+InnoDB 在 add_book / api_edit_book / api_delete_book 的事务提交时同步维护该索引，
+应用层无需额外处理。
+
+结果按相关度降序、相关度相同时按 id 升序排列；排序键不是单调的 id，
+因此分页使用 offset，并以 SEARCH_MAX_OFFSET 限制可翻到的最深位置。
+"""
+import re
+
+from pagination import Page
+from circulation import active_borrows_sql
+
+NGRAM_TOKEN_SIZE = 2
+SEARCH_MAX_OFFSET = 1000
+
+FULLTEXT_MATCH = "MATCH(b.title) AGAINST (%s IN BOOLEAN MODE)"
+
+SEARCH_BOOKS_SELECT = f"""
+    SELECT b.id, b.title, b.quantity, b.image_filename, {active_borrows_sql('b')} AS active_borrow_count
+    FROM books b
+"""
+
+# 布尔模式下有特殊含义的字符，用户输入中一律当作分隔符
+_OPERATORS = re.compile(r'[+\-<>()~*"@\s]+')
+
+
+def boolean_query(text):
+    """
+    把用户输入转换成布尔模式检索串，每个词都必须出现；没有有效词时返回 None。
+    不短于分词长度的词按短语匹配，更短的词（如单个汉字）用 * 做前缀匹配。
+    """
+    terms = [term for term in _OPERATORS.split(text or '') if term]
+    if not terms:
+        return None
+    parts = []
+    for term in terms:
+        if len(term) >= NGRAM_TOKEN_SIZE:
+            parts.append(f'+"{term}"')
+        else:
+            parts.append(f'+{term}*')
+    return ' '.join(parts)
+
+
+def parse_offset(args):
+    """解析检索结果分页的 offset 参数"""
+    try:
+        offset = int(args.get('offset'))
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(offset, SEARCH_MAX_OFFSET))
+
+
+def search_query(select_sql, conditions, params, query, offset=0, page_size=20):
+    """拼出 search_page 的查询语句，返回 (sql, params)"""
+    conditions = [FULLTEXT_MATCH] + list(conditions)
+    params = [query] + list(params)
+
+    sql = (select_sql + " WHERE " + " AND ".join(conditions)
+           + f" ORDER BY {FULLTEXT_MATCH} DESC, b.id LIMIT %s OFFSET %s")
+    return sql, params + [query, page_size + 1, offset]
+
+
+def search_result(rows, offset=0, page_size=20):
+    """把 search_query 取回的 page_size + 1 行整理成 Page"""
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and offset + page_size <= SEARCH_MAX_OFFSET:
+        next_cursor = offset + page_size
+    prev_cursor = max(0, offset - page_size) if offset > 0 else None
+    return Page(rows, next_cursor, prev_cursor, page_size)
+
+
+def search_page(cursor, select_sql, conditions, params, query, offset=0, page_size=20):
+    """
+    在 select_sql 上叠加全文匹配条件，按相关度排序取一页。
+    返回的 Page 中 next_cursor / prev_cursor 为相邻页的 offset。
+    """
+    sql, params = search_query(select_sql, conditions, params, query, offset, page_size)
+    cursor.execute(sql, params)
+    return search_result(cursor.fetchall(), offset, page_size)
+
+
+def search_books(cursor, text, min_quantity=0, offset=0, page_size=20):
+    """按书名全文检索图书，可同时限定最小库存；输入没有有效词时返回 None"""
+    query = boolean_query(text)
+    if query is None:
+        return None
+    return search_page(cursor, SEARCH_BOOKS_SELECT, ["b.quantity >= %s"], [min_quantity],
+                       query, offset, page_size)
@@ -0,0 +1,85 @@
+function restoreDatabase(dryRun) {
+    const filename = document.getElementById('backupFile').value;
+    const until = document.getElementById('restoreUntil').value;
+    if (!filename) {
+        alert('请选择一个备份文件');
+        return;
+    }
+
+    if (!dryRun && !confirm('确定要还原数据库吗？当前数据将被覆盖！')) {
+        return;
+    }
+
+    fetch('/admin/restore', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ filename: filename, until: until || null, dry_run: dryRun })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert(data.message);
+            if (!dryRun) {
+                location.reload();
+            }
+        } else {
+            alert(data.message);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('还原请求失败');
+    });
+}
+
+// 借阅统计面板
+function formatNumber(value) {
+    return value === null || value === undefined ? '-' : Number(value).toLocaleString('zh-CN');
+}
+
+function renderStats(stats) {
+    const counters = stats.counters;
+    const catalog = stats.catalog || {};
+    const loans = stats.loans_per_user || {};
+    document.getElementById('statActiveLoans').textContent = formatNumber(counters.active_loans);
+    document.getElementById('statUtilization').textContent =
+        stats.utilization === null ? '-' : `${(stats.utilization * 100).toFixed(1)}%`;
+    document.getElementById('statSoldOut').textContent = formatNumber(catalog.sold_out_books);
+    document.getElementById('statAverageLoans').textContent =
+        loans.average === null || loans.average === undefined ? '-' : loans.average.toFixed(2);
+    document.getElementById('statBorrows').textContent = formatNumber(counters.borrows);
+    document.getElementById('statReturns').textContent = formatNumber(counters.returns);
+    document.getElementById('statRejections').textContent = formatNumber(counters.sold_out_rejections);
+    document.getElementById('statBorrowers').textContent = formatNumber(loans.users_with_loans);
+    document.getElementById('statsSnapshotAt').textContent =
+        stats.snapshot_at ? `汇总更新于 ${new Date(stats.snapshot_at).toLocaleString('zh-CN')}` : '汇总尚未生成';
+
+    // 每日借还：柱高按最大值归一化
+    const peak = Math.max(1, ...stats.daily.map(day => Math.max(day.borrows, day.returns)));
+    document.getElementById('statsDaily').innerHTML = stats.daily.map(day => `
+        <div class="daily-bar" title="${day.day}：借出 ${day.borrows}，归还 ${day.returns}">
+            <span class="bar borrows" style="height: ${day.borrows / peak * 100}%"></span>
+            <span class="bar returns" style="height: ${day.returns / peak * 100}%"></span>
+        </div>
+    `).join('');
+
+    const topBooks = document.getElementById('statsTopBooks');
+    topBooks.innerHTML = stats.top_books.length
+        ? stats.top_books.map(book => `<li><span>${book.title}</span><span class="text-muted">${formatNumber(book.borrows)} 次</span></li>`).join('')
+        : '<li class="text-muted">暂无借阅</li>';
+}
+
+function loadStats() {
+    fetch('/admin/stats')
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            renderStats(data.stats);
+        }
+    })
+    .catch(error => console.error('加载借阅统计失败:', error));
+}
+
+document.addEventListener('DOMContentLoaded', loadStats);
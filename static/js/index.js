@@ -0,0 +1,69 @@
+function handleUserLogin() {
+    const button = document.querySelector('#userLoginForm .btn');
+    button.disabled = true;
+    button.classList.add('loading');
+
+    const username = document.getElementById('userUsername').value;
+    const password = document.getElementById('userPassword').value;
+
+    axios.post('/api/user_login', { username, password })
+        .then(response => {
+            if (response.data.success) {
+                window.location.href = response.data.redirect;
+            }
+        })
+        .catch(error => {
+            alert(error.response.data.message || '登录失败');
+        })
+        .finally(() => {
+            button.disabled = false;
+            button.classList.remove('loading');
+        });
+}
+
+function handleAdminLogin() {
+    const button = document.querySelector('#adminLoginForm .btn');
+    button.disabled = true;
+    button.classList.add('loading');
+
+    const username = document.getElementById('adminUsername').value;
+    const password = document.getElementById('adminPassword').value;
+
+    axios.post('/api/admin_login', { username, password })
+        .then(response => {
+            if (response.data.success) {
+                window.location.href = response.data.redirect;
+            }
+        })
+        .catch(error => {
+            alert(error.response.data.message || '登录失败');
+        })
+        .finally(() => {
+            button.disabled = false;
+            button.classList.remove('loading');
+        });
+}
+
+// Clear input fields when modals are shown
+const userLoginModal = document.getElementById('userLoginModal');
+userLoginModal.addEventListener('show.bs.modal', () => {
+    document.getElementById('userUsername').value = '';
+    document.getElementById('userPassword').value = '';
+});
+
+const adminLoginModal = document.getElementById('adminLoginModal');
+adminLoginModal.addEventListener('show.bs.modal', () => {
+    document.getElementById('adminUsername').value = '';
+    document.getElementById('adminPassword').value = '';
+});
+
+// 为模态框添加动画效果
+document.querySelectorAll('.modal').forEach(modal => {
+    modal.addEventListener('shown.bs.modal', () => {
+        modal.querySelector('.modal-content').style.transform = 'scale(1)';
+    });
+
+    modal.addEventListener('hide.bs.modal', () => {
+        modal.querySelector('.modal-content').style.transform = 'scale(0.9)';
+    });
+});
@@ -0,0 +1,216 @@
+async function deleteBook(bookId) {
+    if (!confirm('确定要删除该图书吗？')) {
+        return;
+    }
+
+    const response = await fetch('/api/delete_book', {
+        method: 'DELETE',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ book_id: bookId })
+    });
+
+    const result = await response.json();
+
+    if (result.success) {
+        alert(result.message);
+        location.reload();
+    } else {
+        // 显示错误弹窗
+        document.getElementById('errorModalBody').innerText = result.message;
+        var errorModal = new bootstrap.Modal(document.getElementById('errorModal'));
+        errorModal.show();
+    }
+}
+
+async function editBook(bookId) {
+    const title = document.getElementById(`title${bookId}`).value;
+    const quantity = document.getElementById(`quantity${bookId}`).value;
+    const imageInput = document.getElementById(`image${bookId}`);
+    const formData = new FormData();
+
+    if (!title || !quantity) {
+        alert('书名和库存不能为空！');
+        return;
+    }
+
+    formData.append('book_id', bookId);
+    formData.append('title', title);
+    formData.append('quantity', quantity);
+
+    if (imageInput.files.length > 0) {
+        formData.append('image', imageInput.files[0]);
+    }
+
+    const response = await fetch('/api/edit_book', {
+        method: 'POST',
+        body: formData
+    });
+
+    const result = await response.json();
+
+    if (result.success) {
+        alert(result.message);
+        location.reload();
+    } else {
+        alert(result.message);
+    }
+}
+
+// 当前筛选结果翻页时需要附带的参数，由后端给出
+let filterPages = { next: null, prev: null };
+
+function filterPage(direction) {
+    const pageArgs = filterPages[direction];
+    if (pageArgs) {
+        filterBooks(pageArgs);
+    }
+}
+
+function updateFilterPager(result) {
+    filterPages = { next: result.next_page, prev: result.prev_page };
+    document.getElementById('filterPrev').classList.toggle('disabled', !result.prev_page);
+    document.getElementById('filterNext').classList.toggle('disabled', !result.next_page);
+    document.getElementById('pagePager').style.display = 'none';
+    document.getElementById('filterPager').style.display =
+        !result.prev_page && !result.next_page ? 'none' : '';
+}
+
+// 筛选图书，pageArgs 为翻页参数（offset 或 after / before），首次筛选传 {}
+async function filterBooks(pageArgs) {
+    const title = document.getElementById('filterTitle').value.trim();
+    const quantity = document.getElementById('filterQuantity').value || 0;
+
+    // 显示加载状态
+    const tableBody = document.getElementById('booksTableBody');
+    tableBody.innerHTML = `
+        <tr>
+            <td colspan="6" class="no-results">
+                <div class="no-results-icon">🔍</div>
+                <p>正在筛选中...</p>
+            </td>
+        </tr>
+    `;
+
+    try {
+        const response = await fetch('/admin/filter_book', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: new URLSearchParams({ title, quantity, ...pageArgs }).toString()
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            renderBooks(result.books);
+            updateFilterPager(result);
+        } else {
+            alert(result.message || '筛选失败');
+            renderBooks(originalBooksData);
+        }
+    } catch (error) {
+        console.error('筛选出错:', error);
+        alert('筛选过程中发生错误');
+        renderBooks(originalBooksData);
+    }
+}
+
+// 重置筛选
+function resetFilter() {
+    document.getElementById('filterTitle').value = '';
+    document.getElementById('filterQuantity').value = '0';
+    document.getElementById('filterPager').style.display = 'none';
+    document.getElementById('pagePager').style.display = '';
+    renderBooks(originalBooksData);
+}
+
+// 渲染图书列表
+function renderBooks(books) {
+    const tableBody = document.getElementById('booksTableBody');
+
+    if (!books || books.length === 0) {
+        tableBody.innerHTML = `
+            <tr>
+                <td colspan="6" class="no-results">
+                    <div class="no-results-icon">📚</div>
+                    <p>没有找到符合条件的图书</p>
+                </td>
+            </tr>
+        `;
+        return;
+    }
+
+    let html = '';
+    books.forEach(book => {
+        // 生成修改模态框ID
+        const modalId = `editBookModal${book.id}`;
+
+        // 处理图片显示
+        const imageHtml = book.image_url
+            ? `<img src="${book.image_url}" alt="${book.title}" class="book-image">`
+            : `<div class="no-image">无图片</div>`;
+
+        // 库存徽章颜色
+        const badgeColor = book.quantity > 5 ? 'success' : 'warning';
+
+        // 生成表格行
+        html += `
+            <tr data-book-id="${book.id}">
+                <td>${book.id}</td>
+                <td>${book.title}</td>
+                <td>
+                    <span class="badge bg-${badgeColor}">
+                        ${book.quantity}
+                    </span>
+                </td>
+                <td>${book.active_borrow_count}</td>
+                <td>${imageHtml}</td>
+                <td>
+                    <button class="btn btn-warning btn-sm" data-bs-toggle="modal" data-bs-target="#${modalId}">修改</button>
+                    <button class="btn btn-danger btn-sm" onclick="deleteBook('${book.id}')">删除</button>
+                </td>
+            </tr>
+
+            <!-- 动态生成的修改模态框 -->
+            <div class="modal fade" id="${modalId}" tabindex="-1" aria-labelledby="${modalId}Label" aria-hidden="true">
+                <div class="modal-dialog">
+                    <div class="modal-content">
+                        <div class="modal-header">
+                            <h5 class="modal-title" id="${modalId}Label">修改图书信息</h5>
+                            <button type="button" class="btn-close" data-bs-dismiss="modal" aria-label="Close"></button>
+                        </div>
+                        <div class="modal-body">
+                            <input type="hidden" name="book_id" value="${book.id}">
+                            <div class="mb-3">
+                                <label for="title${book.id}" class="form-label">书名</label>
+                                <input type="text" class="form-control" id="title${book.id}" name="title" value="${book.title}" required>
+                            </div>
+                            <div class="mb-3">
+                                <label for="quantity${book.id}" class="form-label">库存</label>
+                                <input type="number" class="form-control" id="quantity${book.id}" name="quantity" value="${book.quantity}" required min="0">
+                            </div>
+                            <div class="mb-3">
+                                <label for="image${book.id}" class="form-label">更新图片</label>
+                                <input type="file" class="form-control" id="image${book.id}" name="image" accept="image/*">
+                            </div>
+                        </div>
+                        <div class="modal-footer">
+                            <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">取消</button>
+                            <button type="button" class="btn btn-primary" onclick="editBook('${book.id}')">保存修改</button>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        `;
+    });
+
+    tableBody.innerHTML = html;
+
+    // 重新初始化所有模态框（因为是动态生成的）
+    document.querySelectorAll('.modal').forEach(modalElement => {
+        new bootstrap.Modal(modalElement);
+    });
+}
@@ -0,0 +1,69 @@
+function showAlert(message) {
+    const alertPlaceholder = document.getElementById('alertPlaceholder');
+    alertPlaceholder.innerHTML = `
+        <div class="alert alert-danger alert-dismissible fade show" role="alert">
+            ${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
+        </div>
+    `;
+}
+
+// 输入时按需请求候选项，不再把所有用户和书籍渲染进下拉框
+function setupTypeahead(inputId, listId, hiddenId, url, key, label) {
+    const input = document.getElementById(inputId);
+    const datalist = document.getElementById(listId);
+    const hidden = document.getElementById(hiddenId);
+    let options = {};
+    let timer = null;
+
+    input.addEventListener('input', () => {
+        hidden.value = options[input.value] || '';
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const response = await fetch(`${url}?q=${encodeURIComponent(input.value.trim())}`);
+            const result = await response.json();
+            if (!result.success) {
+                return;
+            }
+            options = {};
+            datalist.innerHTML = '';
+            result[key].forEach(item => {
+                const text = label(item);
+                options[text] = item.id;
+                const option = document.createElement('option');
+                option.value = text;
+                datalist.appendChild(option);
+            });
+            hidden.value = options[input.value] || '';
+        }, 250);
+    });
+}
+
+setupTypeahead('user_search', 'userOptions', 'user_id', '/api/typeahead/users', 'users',
+    user => `${user.username} (#${user.id})`);
+setupTypeahead('book_search', 'bookOptions', 'book_id', '/api/typeahead/books', 'books',
+    book => `${book.title} (#${book.id}，库存 ${book.quantity})`);
+
+async function submitBorrowRecordForm(event) {
+    event.preventDefault();
+
+    const form = event.target;
+    if (!form.user_id.value || !form.book_id.value) {
+        showAlert('请从候选列表中选择用户和书籍');
+        return;
+    }
+    const formData = new FormData(form);
+
+    const response = await fetch(form.action, {
+        method: 'POST',
+        body: formData
+    });
+
+    const result = await response.json();
+
+    if (!result.success) {
+        showAlert(result.message);
+    } else {
+        location.reload();
+    }
+}
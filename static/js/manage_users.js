@@ -0,0 +1,25 @@
+async function deleteUser(userId) {
+    if (!confirm('确定要删除该用户吗？')) {
+        return;
+    }
+
+    const response = await fetch('/api/delete_user', {
+        method: 'DELETE',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ user_id: userId })
+    });
+
+    const result = await response.json();
+
+    if (result.success) {
+        alert(result.message);
+        location.reload();
+    } else {
+        // 显示错误弹窗
+        document.getElementById('errorModalBody').innerText = result.message;
+        var errorModal = new bootstrap.Modal(document.getElementById('errorModal'));
+        errorModal.show();
+    }
+}
@@ -0,0 +1,13 @@
+// 归还确认函数
+function confirmReturn() {
+    return confirm('确定要归还这本图书吗？归还后将无法继续借阅，除非重新借阅。');
+}
+
+// 页面加载完成后检查图书列表状态
+document.addEventListener('DOMContentLoaded', function() {
+    const booksGrid = document.querySelector('.books-grid');
+    if (booksGrid) {
+        const bookCards = booksGrid.querySelectorAll('.book-card');
+        console.log(`共加载 ${bookCards.length} 本借阅图书`);
+    }
+});
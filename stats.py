@@ -0,0 +1,164 @@
+"""
+管理员主页的借阅统计。
+
+- 增量部分：借还书存储过程在事务中累加 circulation_counters（借出、归还、在借、售罄拒绝次数）、
+  circulation_daily（每日借还次数）和 book_circulation_stats（每本书的借阅次数），
+  计数按分片存放，读取时对固定数量的分片求和；
+- 汇总部分：rollup() 定期计算需要扫描整表的数字（图书 / 用户总数、在架册数、售罄图书、
+  用户在借数分布、借阅次数最多的图书），写入 circulation_snapshot。
+
+read_stats() 只读取这几张小表，耗时与借阅历史的规模无关。
+"""
+import json
+import time
+import threading
+from datetime import date, timedelta
+
+COUNTERS = ('borrows', 'returns', 'active_loans', 'sold_out_rejections')
+
+
+def read_counters(cursor):
+    """各计数的当前值（对分片求和）"""
+    cursor.execute("SELECT name, SUM(value) FROM circulation_counters GROUP BY name")
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update({name: int(value) for name, value in cursor.fetchall()})
+    return counters
+
+
+def read_daily(cursor, days=30):
+    """最近 days 天每天的借还次数，没有借还的日期补 0"""
+    start = date.today() - timedelta(days=days - 1)
+    cursor.execute(
+        "SELECT day, SUM(borrows), SUM(returns) FROM circulation_daily WHERE day >= %s GROUP BY day",
+        (start,)
+    )
+    rows = {day: (int(borrows), int(returns)) for day, borrows, returns in cursor.fetchall()}
+    daily = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        borrows, returns = rows.get(day, (0, 0))
+        daily.append({'day': day.isoformat(), 'borrows': borrows, 'returns': returns})
+    return daily
+
+
+def read_snapshot(cursor):
+    """最近一次 rollup 的结果 {名称: 值}，以及其中最早的更新时间"""
+    cursor.execute("SELECT name, value, updated_at FROM circulation_snapshot")
+    snapshot, updated_at = {}, None
+    for name, value, row_updated_at in cursor.fetchall():
+        snapshot[name] = json.loads(value) if isinstance(value, (str, bytes, bytearray)) else value
+        updated_at = row_updated_at if updated_at is None else min(updated_at, row_updated_at)
+    return snapshot, updated_at
+
+
+def read_stats(cursor, days=30):
+    """管理员主页的统计数据：实时计数 + 最近一次汇总"""
+    counters = read_counters(cursor)
+    snapshot, updated_at = read_snapshot(cursor)
+    catalog = snapshot.get('catalog', {})
+    # 借出率 = 在借册数 / 馆藏总册数（在借 + 在架）
+    on_shelf = catalog.get('copies_on_shelf')
+    utilization = None
+    if on_shelf is not None and counters['active_loans'] + on_shelf > 0:
+        utilization = counters['active_loans'] / (counters['active_loans'] + on_shelf)
+    return {
+        'counters': counters,
+        'utilization': utilization,
+        'daily': read_daily(cursor, days),
+        'catalog': catalog,
+        'loans_per_user': snapshot.get('loans_per_user', {}),
+        'top_books': snapshot.get('top_books', []),
+        'snapshot_at': updated_at.isoformat() if updated_at is not None else None,
+    }
+
+
+def _save(cursor, name, value):
+    cursor.execute(
+        "INSERT INTO circulation_snapshot (name, value) VALUES (%s, %s) AS new "
+        "ON DUPLICATE KEY UPDATE value = new.value, updated_at = CURRENT_TIMESTAMP",
+        (name, json.dumps(value, ensure_ascii=False, default=str))
+    )
+
+
+def rollup(connection, top=10, max_age=None):
+    """
+    汇总需要扫描整表的统计并写入 circulation_snapshot，返回汇总结果。
+    多个 worker 各自运行汇总线程，快照在 max_age 秒内已被更新过时跳过，返回 None。
+    """
+    cursor = connection.cursor()
+    try:
+        if max_age is not None:
+            cursor.execute("SELECT TIMESTAMPDIFF(SECOND, MIN(updated_at), NOW()) FROM circulation_snapshot")
+            age = cursor.fetchone()[0]
+            if age is not None and age < max_age:
+                connection.commit()
+                return None
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity = 0), 0) FROM books")
+        books, on_shelf, sold_out = cursor.fetchone()
+        # 用户在借数分布 {在借数: 用户数}，用户总数和平均值由它得出
+        cursor.execute("SELECT active_borrow_count, COUNT(*) FROM users GROUP BY active_borrow_count")
+        distribution = {int(loans): int(count) for loans, count in cursor.fetchall()}
+        users = sum(distribution.values())
+        catalog = {'books': int(books), 'copies_on_shelf': int(on_shelf), 'sold_out_books': int(sold_out),
+                   'users': users}
+        loans_per_user = {
+            'users_with_loans': sum(count for loans, count in distribution.items() if loans > 0),
+            'max': max(distribution, default=0),
+            'average': sum(loans * count for loans, count in distribution.items()) / users if users else None,
+            'distribution': distribution,
+        }
+
+        cursor.execute("""
+            SELECT s.book_id, b.title, s.borrows
+            FROM (SELECT book_id, SUM(borrows) AS borrows FROM book_circulation_stats
+                  GROUP BY book_id ORDER BY borrows DESC LIMIT %s) s
+            JOIN books b ON b.id = s.book_id
+            ORDER BY s.borrows DESC, s.book_id
+        """, (top,))
+        top_books = [{'book_id': book_id, 'title': title, 'borrows': int(borrows)}
+                     for book_id, title, borrows in cursor.fetchall()]
+
+        _save(cursor, 'catalog', catalog)
+        _save(cursor, 'loans_per_user', loans_per_user)
+        _save(cursor, 'top_books', top_books)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {'catalog': catalog, 'loans_per_user': loans_per_user, 'top_books': top_books}
+
+
+def rebuild_active_loans(cursor):
+    """按 borrow_records 重新计算在借数（不提交事务），用于初始化已有数据库和还原备份之后"""
+    cursor.execute("DELETE FROM circulation_counters WHERE name = 'active_loans'")
+    cursor.execute("INSERT INTO circulation_counters (name, shard, value) "
+                   "SELECT 'active_loans', 0, COUNT(*) FROM borrow_records")
+
+
+class RollupJob:
+    """后台线程，每 interval 秒执行一次 job()（汇总统计），首次调用 start() 时启动"""
+
+    def __init__(self, job, interval=300):
+        self.job = job
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # fork 后线程不会被继承，is_alive() 为 False 时重新启动
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stats-rollup', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.job()
+            except Exception as e:
+                print(f"Stats rollup failed: {e}")
+            time.sleep(self.interval)